@@ -0,0 +1 @@
+"""Benchmarks for sortpics. Run them with e.g. 'python -m benchmarks.exif_reader'"""
@@ -0,0 +1,44 @@
+"""Compare the header-only EXIF reader with Pillow, in files per second"""
+
+import os
+import sys
+import time
+import tempfile
+from datetime import datetime
+from sortpics.exif import read_exif_tags
+from sortpics.timestamp import _pillow_exif_tags
+from .synthetic import jpeg_bytes
+
+
+def write_sample_jpegs(folder, count):
+    """Write count JPEG files with EXIF dates in the folder"""
+    data = jpeg_bytes(datetime(2020, 5, 23, 16, 55, 13, 123000))
+    filenames = []
+    for i in range(count):
+        filename = os.path.join(folder, f"IMG_{i:05d}.JPG")
+        with open(filename, "wb") as stream:
+            stream.write(data)
+        filenames.append(filename)
+    return filenames
+
+
+def files_per_second(reader, filenames):
+    """The number of files per second that the reader can process"""
+    start = time.perf_counter()
+    for filename in filenames:
+        reader(filename)
+    return len(filenames) / (time.perf_counter() - start)
+
+
+def main(count=2000):
+    with tempfile.TemporaryDirectory() as folder:
+        filenames = write_sample_jpegs(folder, count)
+        for name, reader in [
+            ("header-only reader", read_exif_tags),
+            ("Pillow", _pillow_exif_tags),
+        ]:
+            print(f"{name:>20}: {files_per_second(reader, filenames):10.0f} files/s")
+
+
+if __name__ == "__main__":
+    main(*map(int, sys.argv[1:]))
@@ -0,0 +1,33 @@
+"""Time the pairing of live photos on synthetic lists of file names, to show that it scales linearly"""
+
+import sys
+import time
+from sortpics.normalize import live_photo_pairs
+
+
+def synthetic_filenames(count):
+    """A list of count file names, with one live photo (.MOV + .JPG) every four files"""
+    filenames = []
+    for i in range(count // 2):
+        folder = f"{2000 + i % 20}/{i % 12 + 1:02d}"
+        filenames.append(f"{folder}/IMG_{i:07d}.JPG")
+        filenames.append(
+            f"{folder}/IMG_{i:07d}.MOV" if i % 2 else f"{folder}/DSC_{i:07d}.jpg"
+        )
+    return filenames
+
+
+def main(*counts):
+    for count in counts or (10_000, 100_000, 1_000_000):
+        filenames = synthetic_filenames(count)
+        start = time.perf_counter()
+        pairs = sum(1 for _ in live_photo_pairs(filenames))
+        elapsed = time.perf_counter() - start
+        print(
+            f"{count:>10} names: {pairs:>8} pairs in {elapsed:6.3f}s "
+            f"({1e9 * elapsed / count:.0f} ns/name)"
+        )
+
+
+if __name__ == "__main__":
+    main(*map(int, sys.argv[1:]))
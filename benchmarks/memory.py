@@ -0,0 +1,86 @@
+"""Measure the peak memory of a sortpics run on a folder with many (empty) files
+
+Usage:
+    python -m benchmarks.memory [--files 200000]
+
+The creation dates are derived from the file names, so that the measure is not
+affected by the metadata readers. Each size is measured in a fresh process.
+"""
+
+import os
+import sys
+import argparse
+import tempfile
+import subprocess
+from datetime import datetime, timedelta
+from contextlib import redirect_stdout, redirect_stderr
+from unittest.mock import patch
+from .stages import peak_rss_mb
+
+FILES_PER_FOLDER = 1000
+
+
+def write_empty_files(folder, count):
+    """Write count empty files, e.g. 'Google Photos/Album 12/IMG_0012345.JPG'"""
+    for i in range(count):
+        subfolder = os.path.join(
+            folder, "Google Photos", f"Album {i // FILES_PER_FOLDER}"
+        )
+        if i % FILES_PER_FOLDER == 0:
+            os.makedirs(subfolder)
+        # One file in ten is the movie of a live photo
+        name = f"IMG_{i - 1:07d}.MOV" if i % 10 == 1 else f"IMG_{i:07d}.JPG"
+        open(os.path.join(subfolder, name), "w").close()
+
+
+def synthetic_creation_date(path):
+    """A creation date derived from the file name. One photo in ten is taken
+    in the same second as the previous one"""
+    i = int(os.path.basename(path)[4:11])
+    second = 7 * (i - 1 if i % 10 == 3 else i)
+    return datetime(2015, 1, 1) + timedelta(seconds=second, milliseconds=i % 1000)
+
+
+def child(count):
+    """Run sortpics in test mode on count files, and print the peak RSS before and after"""
+    from sortpics.cli import sortpics
+
+    with tempfile.TemporaryDirectory() as folder:
+        write_empty_files(folder, count)
+        before = peak_rss_mb()
+        with open(os.devnull, "w") as devnull, redirect_stdout(
+            devnull
+        ), redirect_stderr(devnull), patch(
+            "sortpics.normalize.creation_date", synthetic_creation_date
+        ):
+            sortpics(folder, test=True, scripts=False, cache=False)
+        after = peak_rss_mb()
+    print(f"{before:.1f} {after:.1f}")
+
+
+def main(args=None):
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--files", type=int, nargs="+", default=[200000])
+    parser.add_argument("--child", type=int, help=argparse.SUPPRESS)
+    args = parser.parse_args(args)
+
+    if args.child:
+        child(args.child)
+        return 0
+
+    print(
+        f"{'files':>10} {'RSS before (MB)':>16} {'peak RSS (MB)':>14} {'bytes/file':>11}"
+    )
+    for count in args.files:
+        output = subprocess.check_output(
+            [sys.executable, "-m", "benchmarks.memory", "--child", str(count)]
+        )
+        before, after = map(float, output.split())
+        print(
+            f"{count:>10} {before:>16.1f} {after:>14.1f} {1e6 * (after - before) / count:>11.0f}"
+        )
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
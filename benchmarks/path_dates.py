@@ -0,0 +1,101 @@
+"""Time the extraction of dates from paths, and check that the results match the former regular expressions"""
+
+import os
+import re
+import sys
+import time
+import random
+from datetime import datetime
+from sortpics.timestamp import creation_date_from_path, _date_from_folder
+
+# The regular expressions used up to sortpics 0.1.2
+LEGACY_DATE = re.compile(r"(.*)([0-9]{4})[-/]?([0-9]{2})[-/]?([0-9]{2})(.*)")
+LEGACY_DATETIME = re.compile(
+    r"(.*)([0-9]{4})-?([0-9]{2})-?([0-9]{2})[ _]?-?([0-9]{2})[\.-]?([0-9]{2})[\.-]?([0-9]{2})(.*)"
+)
+
+
+def _legacy_match(pattern, string):
+    match = pattern.match(string)
+    if not match:
+        raise ValueError(f"No match in {string}")
+    return datetime(*(int(group) for group in match.groups()[1:-1]))
+
+
+def legacy_creation_date_from_path(filename):
+    """The creation date from the path, as computed by sortpics 0.1.2, or None"""
+    basename = os.path.basename(filename)
+    for pattern, string in [
+        (LEGACY_DATETIME, basename),
+        (LEGACY_DATE, basename[:10]),
+        (LEGACY_DATE, basename),
+        (LEGACY_DATE, os.path.dirname(filename)),
+    ]:
+        try:
+            return _legacy_match(pattern, string)
+        except ValueError:
+            pass
+    return None
+
+
+def _creation_date_from_path(filename):
+    try:
+        return creation_date_from_path(filename)
+    except ValueError:
+        return None
+
+
+def synthetic_paths(count, seed=0):
+    """A list of count paths, in long Takeout, iCloud and camera folders, with a few files per folder"""
+    rng = random.Random(seed)
+    paths = []
+    while len(paths) < count:
+        day = datetime(2010, 1, 1).toordinal() + rng.randrange(4000)
+        date = datetime.fromordinal(day)
+        kind = rng.random()
+        if kind < 0.4:
+            folder = f"Takeout/Google Photos/{date:%Y-%m-%d} #{rng.randrange(3)} Trip to somewhere far away"
+        elif kind < 0.7:
+            folder = f"iCloud Photos/{date:%Y/%m/%d}"
+        else:
+            folder = f"Camera Uploads/Phone {rng.randrange(5)}"
+        for i in range(rng.randrange(1, 20)):
+            name = rng.choice(
+                [
+                    f"IMG_{rng.randrange(10000):04d}.JPG",
+                    f"VID_{date:%Y%m%d}_{rng.randrange(240000):06d}.mp4",
+                    f"{date:%Y-%m-%d %H.%M.%S} Photo {i}.jpg",
+                    f"PXL_{date:%Y%m%d}_{rng.randrange(10 ** 9):09d}.MP.jpg",
+                    f"c2141219-017b-4ff9-a303-{rng.randrange(10 ** 12):012d}.heic",
+                ]
+            )
+            paths.append(f"{folder}/{name}")
+    return paths[:count]
+
+
+def main(*counts):
+    for count in counts or (1_000_000,):
+        paths = synthetic_paths(count)
+
+        start = time.perf_counter()
+        legacy = [legacy_creation_date_from_path(path) for path in paths]
+        legacy_elapsed = time.perf_counter() - start
+
+        _date_from_folder.cache_clear()
+        start = time.perf_counter()
+        current = [_creation_date_from_path(path) for path in paths]
+        elapsed = time.perf_counter() - start
+
+        mismatches = sum(a != b for a, b in zip(legacy, current))
+        print(
+            f"{count:>10} paths: {1e9 * legacy_elapsed / count:.0f} ns/path before, "
+            f"{1e9 * elapsed / count:.0f} ns/path now ({legacy_elapsed / elapsed:.1f}x), "
+            f"{mismatches} mismatches"
+        )
+        if mismatches:
+            return 1
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main(*map(int, sys.argv[1:])))
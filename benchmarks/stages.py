@@ -0,0 +1,158 @@
+"""Time each stage of sortpics on synthetic libraries, and compare the results with a baseline
+
+Usage:
+    python -m benchmarks.stages [--sizes 1000 10000 100000] [--baseline benchmarks/baseline.json]
+    python -m benchmarks.stages --save-baseline
+"""
+
+import os
+import sys
+import json
+import time
+import argparse
+import resource
+import tempfile
+from contextlib import redirect_stdout, redirect_stderr
+from unittest.mock import patch
+from sortpics.scan import scan
+from sortpics.moves import move, date_subfolder
+from sortpics.normalize import (
+    iter_creation_dates,
+    normalize_targets,
+    non_duplicate_targets,
+)
+from .synthetic import synthetic_library
+
+BASELINE = os.path.join(os.path.dirname(__file__), "baseline.json")
+SIZES = (1000, 10000, 100000)
+
+
+def peak_rss_mb():
+    """The peak resident set size of the process so far, in MB"""
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # ru_maxrss is in bytes on macOS, and in KB on Linux
+    return peak / 1e6 if sys.platform == "darwin" else peak / 1e3
+
+
+def run_stages(folder):
+    """Run each stage of sortpics on the folder, and yield (stage, number of files, seconds)"""
+    start = time.perf_counter()
+    entries = list(scan(folder))
+    yield "scan", len(entries), time.perf_counter() - start
+
+    start = time.perf_counter()
+    datetimes = [
+        timestamp for _, timestamp in iter_creation_dates(entries, folder, cache=None)
+    ]
+    yield "creation_date", len(entries), time.perf_counter() - start
+
+    filenames = [entry.path for entry in entries]
+    sizes = [entry.st_size for entry in entries]
+    start = time.perf_counter()
+    targets = normalize_targets(filenames, list(datetimes), folder, sizes=sizes)
+    yield "normalize_targets", len(entries), time.perf_counter() - start
+
+    with patch(
+        "sortpics.normalize.non_duplicate_targets",
+        lambda filenames, targets, *_: targets,
+    ):
+        colliding_targets = normalize_targets(filenames, list(datetimes), folder)
+    start = time.perf_counter()
+    non_duplicate_targets(filenames, colliding_targets, folder)
+    yield "non_duplicate_targets", len(entries), time.perf_counter() - start
+
+    targets = [
+        None if target is None else os.path.join(date_subfolder(target), target)
+        for target in targets
+    ]
+    with redirect_stdout(sys.stderr):
+        start = time.perf_counter()
+        move(folder, filenames, targets, test=True, entries=entries)
+    yield "move (test)", len(entries), time.perf_counter() - start
+
+    with redirect_stdout(sys.stderr):
+        start = time.perf_counter()
+        move(folder, filenames, targets, test=False, entries=entries)
+    yield "move", len(entries), time.perf_counter() - start
+
+
+def benchmark(sizes=SIZES):
+    """Return {size: {stage: {files_per_second, seconds, peak_rss_mb}}}"""
+    results = {}
+    for size in sorted(sizes):
+        # The progress bars and the file list are not shown
+        with tempfile.TemporaryDirectory() as folder, open(
+            os.devnull, "w"
+        ) as devnull, redirect_stderr(devnull):
+            synthetic_library(folder, size)
+            results[str(size)] = {
+                stage: {
+                    "files_per_second": round(count / seconds),
+                    "seconds": round(seconds, 4),
+                    "peak_rss_mb": round(peak_rss_mb(), 1),
+                }
+                for stage, count, seconds in run_stages(folder)
+            }
+    return results
+
+
+def compare(results, baseline, tolerance=0.3):
+    """Print the results next to the baseline, and return the list of the regressions"""
+    regressions = []
+    print(
+        f"{'files':>8} {'stage':<22} {'files/s':>10} {'baseline':>10} {'ratio':>6} {'RSS MB':>8}"
+    )
+    for size, stages in results.items():
+        for stage, result in stages.items():
+            reference = baseline.get(size, {}).get(stage)
+            line = f"{size:>8} {stage:<22} {result['files_per_second']:>10}"
+            if reference:
+                ratio = result["files_per_second"] / reference["files_per_second"]
+                line += f" {reference['files_per_second']:>10} {ratio:>6.2f}"
+                if ratio < 1 - tolerance:
+                    regressions.append((size, stage, ratio))
+                    line += " REGRESSION"
+            else:
+                line += f" {'-':>10} {'-':>6}"
+            print(line + f" {result['peak_rss_mb']:>8}")
+    return regressions
+
+
+def main(args=None):
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--sizes", type=int, nargs="+", default=SIZES)
+    parser.add_argument("--baseline", default=BASELINE)
+    parser.add_argument(
+        "--tolerance",
+        type=float,
+        default=0.3,
+        help="Report a regression when the files/s are below (1 - tolerance) times the baseline",
+    )
+    parser.add_argument(
+        "--save-baseline",
+        action="store_true",
+        help="Save the results as the new baseline",
+    )
+    args = parser.parse_args(args)
+
+    results = benchmark(args.sizes)
+    if args.save_baseline:
+        with open(args.baseline, "w") as stream:
+            json.dump(results, stream, indent=2)
+            stream.write("\n")
+        print(f"# Baseline saved to {args.baseline}")
+
+    baseline = {}
+    if os.path.exists(args.baseline):
+        with open(args.baseline) as stream:
+            baseline = json.load(stream)
+
+    regressions = compare(results, baseline, args.tolerance)
+    if regressions:
+        print(f"# {len(regressions)} regression(s) found")
+        return 1
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
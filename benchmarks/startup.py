@@ -0,0 +1,86 @@
+"""Measure the import time of the sortpics command line with python -X importtime
+
+Usage:
+    python -m benchmarks.startup [--budget-ms 150] [--repeat 5]
+
+The heavy dependencies (PIL, hachoir, tqdm, multiprocessing and asyncio) should be
+imported only when they are used, so they must not appear in the import of sortpics.cli.
+The command fails when one of them is imported, or when the best cumulative import time
+of sortpics is above the budget.
+"""
+
+import sys
+import argparse
+import subprocess
+
+MODULE = "sortpics.cli"
+BUDGET_MS = 150
+LAZY_MODULES = ("PIL", "hachoir", "tqdm", "multiprocessing", "asyncio")
+
+
+def import_times(module=MODULE):
+    """The cumulative import time of each module, in microseconds, in a fresh interpreter"""
+    output = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", f"import {module}"],
+        stderr=subprocess.PIPE,
+        stdout=subprocess.DEVNULL,
+        universal_newlines=True,
+        check=True,
+    ).stderr
+
+    times = {}
+    for line in output.splitlines():
+        if not line.startswith("import time:") or "cumulative" in line:
+            continue
+        _, cumulative, name = line[len("import time:") :].split("|")
+        times[name.strip()] = int(cumulative)
+    return times
+
+
+def main(args=None):
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--budget-ms", type=float, default=BUDGET_MS)
+    parser.add_argument(
+        "--repeat",
+        type=int,
+        default=5,
+        help="The best of that many measures is compared with the budget",
+    )
+    args = parser.parse_args(args)
+
+    best = None
+    for _ in range(args.repeat):
+        times = import_times()
+        if best is None or times["sortpics"] < best["sortpics"]:
+            best = times
+
+    heavy = [name for name in LAZY_MODULES if name in best]
+    slowest = sorted(
+        (name for name in best if name.startswith("sortpics")),
+        key=best.get,
+        reverse=True,
+    )
+    for name in slowest[:10]:
+        print(f"{best[name] / 1000:>8.1f} ms  {name}")
+
+    failed = False
+    if heavy:
+        print(f"# These modules should be imported lazily: {', '.join(heavy)}")
+        failed = True
+    milliseconds = best["sortpics"] / 1000
+    if milliseconds > args.budget_ms:
+        print(
+            f"# The import of {MODULE} takes {milliseconds:.1f} ms, "
+            f"above the budget of {args.budget_ms:.0f} ms"
+        )
+        failed = True
+    else:
+        print(
+            f"# The import of {MODULE} takes {milliseconds:.1f} ms "
+            f"(budget: {args.budget_ms:.0f} ms)"
+        )
+    return 1 if failed else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
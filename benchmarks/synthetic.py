@@ -0,0 +1,121 @@
+"""Synthetic photo libraries for the benchmarks"""
+
+import io
+import os
+import random
+import struct
+from datetime import datetime, timedelta
+from PIL import Image
+from sortpics.isobmff import MAC_EPOCH
+
+_EXIF_DATE_PLACEHOLDER = b"1999:01:01 00:00:00"
+_EXIF_SUBSEC_PLACEHOLDER = b"987"
+
+
+def _jpeg_template(size=(16, 16)):
+    """A small JPEG file with EXIF dates set to placeholders, that jpeg_bytes replaces"""
+    exif = Image.Exif()
+    exif[306] = _EXIF_DATE_PLACEHOLDER.decode()
+    ifd = exif.get_ifd(0x8769)
+    ifd[36867] = _EXIF_DATE_PLACEHOLDER.decode()
+    ifd[37521] = _EXIF_SUBSEC_PLACEHOLDER.decode()
+    stream = io.BytesIO()
+    Image.new("RGB", size).save(stream, format="JPEG", exif=exif)
+    template = stream.getvalue()
+    assert template.count(_EXIF_DATE_PLACEHOLDER) == 2
+    assert template.count(_EXIF_SUBSEC_PLACEHOLDER) == 1
+    return template
+
+
+_JPEG_TEMPLATE = None
+
+
+def jpeg_bytes(timestamp):
+    """A minimal JPEG file with the given EXIF DateTimeOriginal, DateTime and SubsecTimeOriginal"""
+    global _JPEG_TEMPLATE
+    if _JPEG_TEMPLATE is None:
+        _JPEG_TEMPLATE = _jpeg_template()
+
+    date = timestamp.strftime("%Y:%m:%d %H:%M:%S").encode()
+    subsec = f"{timestamp.microsecond // 1000:03d}".encode()
+    return _JPEG_TEMPLATE.replace(_EXIF_DATE_PLACEHOLDER, date).replace(
+        _EXIF_SUBSEC_PLACEHOLDER, subsec
+    )
+
+
+def _box(box_type, payload):
+    return struct.pack(">I", 8 + len(payload)) + box_type + payload
+
+
+def mp4_bytes(timestamp, mdat_size=4096):
+    """A MP4 stub with a mdat box, followed by a moov box with a mvhd box that has the given creation time"""
+    seconds = int((timestamp - MAC_EPOCH).total_seconds())
+    mvhd = _box(
+        b"mvhd",
+        struct.pack(">B3xIIII", 0, seconds, seconds, 1000, 5000) + b"\x00" * 80,
+    )
+    return (
+        _box(b"ftyp", b"isom\x00\x00\x00\x00isommp41")
+        + _box(b"mdat", b"\x00" * mdat_size)
+        + _box(b"moov", mvhd)
+    )
+
+
+def synthetic_library(folder, count, seed=0):
+    """Write about count files in the folder, and return the list of their relative paths.
+
+    The library mixes:
+    - Google Takeout style date folders, e.g. 'Google Photos/2019-12-25/IMG_0042.JPG'
+    - iCloud style folders with IMG_xxxx names and live photos (.JPG + .MOV)
+    - phone videos named after their creation time, e.g. 'Camera/VID_20191225_150712.mp4'
+    - bursts of photos taken within the same second, and exact copies of some photos
+    """
+    rng = random.Random(seed)
+    start = datetime(2015, 1, 1)
+    filenames = []
+
+    def write(path, data):
+        full_path = os.path.join(folder, path)
+        os.makedirs(os.path.dirname(full_path), exist_ok=True)
+        with open(full_path, "wb") as stream:
+            stream.write(data)
+        filenames.append(path)
+
+    i = 0
+    while len(filenames) < count:
+        i += 1
+        timestamp = start + timedelta(
+            seconds=rng.randrange(5 * 365 * 86400), milliseconds=rng.randrange(1000)
+        )
+        kind = rng.random()
+        if kind < 0.4:
+            path = f"Google Photos/{timestamp:%Y-%m-%d}/IMG_{i:04d}.JPG"
+            write(path, jpeg_bytes(timestamp))
+            if rng.random() < 0.05:
+                # An exact copy in another album
+                write(
+                    f"Google Photos/Album {i % 7}/IMG_{i:04d}.JPG",
+                    jpeg_bytes(timestamp),
+                )
+        elif kind < 0.7:
+            folder_name = f"iCloud/{timestamp:%Y/%m/%d}"
+            write(f"{folder_name}/IMG_{i:04d}.JPG", jpeg_bytes(timestamp))
+            if rng.random() < 0.3:
+                write(
+                    f"{folder_name}/IMG_{i:04d}.MOV",
+                    mp4_bytes(timestamp + timedelta(seconds=1)),
+                )
+        elif kind < 0.9:
+            write(
+                f"Camera/VID_{timestamp:%Y%m%d_%H%M%S}.mp4",
+                mp4_bytes(timestamp, mdat_size=rng.randrange(1024, 64 * 1024)),
+            )
+        else:
+            # A burst of photos within the same second
+            for j in range(3):
+                burst = timestamp.replace(microsecond=0) + timedelta(
+                    milliseconds=100 * j
+                )
+                write(f"Camera/IMG_{i:04d}_BURST{j}.JPG", jpeg_bytes(burst))
+
+    return filenames
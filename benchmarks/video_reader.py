@@ -0,0 +1,36 @@
+"""Compare the moov/mvhd reader with hachoir, in files per second"""
+
+import os
+import sys
+import tempfile
+from datetime import datetime
+from sortpics.isobmff import read_mvhd_creation_time
+from sortpics.timestamp import creation_date_from_hachoir
+from .exif_reader import files_per_second
+from .synthetic import mp4_bytes
+
+
+def write_sample_videos(folder, count, mdat_size=1024 * 1024):
+    """Write count MP4 stubs with the moov box after a large mdat box"""
+    data = mp4_bytes(datetime(2020, 5, 23, 16, 55, 13), mdat_size=mdat_size)
+    filenames = []
+    for i in range(count):
+        filename = os.path.join(folder, f"VID_{i:05d}.mp4")
+        with open(filename, "wb") as stream:
+            stream.write(data)
+        filenames.append(filename)
+    return filenames
+
+
+def main(count=200):
+    with tempfile.TemporaryDirectory() as folder:
+        filenames = write_sample_videos(folder, count)
+        for name, reader in [
+            ("moov/mvhd reader", read_mvhd_creation_time),
+            ("hachoir", creation_date_from_hachoir),
+        ]:
+            print(f"{name:>20}: {files_per_second(reader, filenames):10.0f} files/s")
+
+
+if __name__ == "__main__":
+    main(*map(int, sys.argv[1:]))
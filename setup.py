@@ -21,7 +21,7 @@ setup(
     long_description=long_description,
     long_description_content_type="text/markdown",
     url="https://github.com/mwouts/sortpics",
-    packages=find_packages(exclude=["tests"]),
+    packages=find_packages(exclude=["tests", "benchmarks"]),
     entry_points={"console_scripts": ["sortpics = sortpics.cli:sortpics_cli"]},
     tests_require=["pytest"],
     install_requires=["pillow", "hachoir", "tqdm"],
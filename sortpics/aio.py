@@ -0,0 +1,96 @@
+"""Read the creation dates with asyncio, for folders on network mounts with a high latency.
+
+Python has no asynchronous file API, so the metadata is read in a pool of threads, but the
+event loop keeps many reads in flight, limits the number of concurrent reads on each mount
+(device), and runs the choice between the metadata and the path dates."""
+
+import os
+import asyncio
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from .timestamp import media_creation_date, best_creation_date
+from .stats import collect
+
+
+def imap_creation_dates(
+    filenames, jobs=64, jobs_per_mount=None, stats=False, path_dates=True
+):
+    """Yield the creation dates of the given files, in the same order.
+
+    :param filenames: an iterable of paths, consumed lazily
+    :param jobs: the maximum number of files read at the same time
+    :param jobs_per_mount: the maximum number of files read at the same time on each device (default: jobs)
+    :param stats: when True, yield (date, seconds, events) as returned by stats.collect
+    :param path_dates: when False, yield the dates in the file metadata, before the choice
+        with the dates in the path (see timestamp.best_creation_date)
+    """
+    loop = asyncio.new_event_loop()
+    pool = ThreadPoolExecutor(max_workers=jobs)
+    devices = {}
+    semaphores = {}
+    read = media_creation_date
+    decide = best_creation_date
+    if stats:
+        read = _collected(media_creation_date)
+        decide = _collected_decision
+    if not path_dates:
+        decide = _media_date
+
+    async def device(folder):
+        # The first file of each folder stats the folder, and the others wait for that result
+        if folder not in devices:
+            devices[folder] = loop.run_in_executor(pool, _device, folder)
+        return await devices[folder]
+
+    async def creation_date(filename):
+        mount = await device(os.path.dirname(filename))
+        if mount not in semaphores:
+            semaphores[mount] = asyncio.Semaphore(jobs_per_mount or jobs)
+        async with semaphores[mount]:
+            timestamp = await loop.run_in_executor(pool, read, filename)
+        return decide(timestamp, filename)
+
+    pending = deque()
+    try:
+        for filename in filenames:
+            pending.append(loop.create_task(creation_date(filename)))
+            if len(pending) >= 4 * jobs:
+                yield loop.run_until_complete(pending.popleft())
+
+        while pending:
+            yield loop.run_until_complete(pending.popleft())
+    finally:
+        for task in pending:
+            task.cancel()
+        if pending:
+            loop.run_until_complete(asyncio.gather(*pending, return_exceptions=True))
+        pool.shutdown()
+        loop.close()
+
+
+def _device(folder):
+    """The device of the folder, or None if the folder cannot be accessed"""
+    try:
+        return os.stat(folder or ".").st_dev
+    except OSError:
+        return None
+
+
+def _collected(func):
+    def wrapper(filename):
+        return collect(func, filename)
+
+    return wrapper
+
+
+def _media_date(timestamp, filename):
+    return timestamp
+
+
+def _collected_decision(timestamp, filename):
+    """best_creation_date on the result of _collected(media_creation_date)"""
+    timestamp, seconds, events = timestamp
+    timestamp, decision_seconds, decision_events = collect(
+        lambda filename: best_creation_date(timestamp, filename), filename
+    )
+    return timestamp, seconds + decision_seconds, events + decision_events
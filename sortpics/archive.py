@@ -0,0 +1,316 @@
+"""Read the photos and videos of a zip or tar archive, e.g. a Google Takeout export, without
+extracting the archive first.
+
+The members are listed with the zip central directory, or with the tar headers. While an
+Archive is open, the paths under the archive path, e.g. 'takeout.zip/Google Photos/IMG_1.JPG',
+are opened in the archive by fileio.open_path, so the extractors only read the bytes that they need.
+Then each member is copied once, directly to its target.
+
+A compressed tar has no index, and its members are not seekable: listing the members,
+reading their metadata and extracting them would decompress the archive up to three times.
+When a spool folder is given, e.g. the target folder of a --no-test run, the members of a
+compressed tar are rather decompressed in a single pass, to a hidden folder in the spool
+folder. The metadata is read from these files, and the extraction renames them."""
+
+import os
+import io
+import time
+import errno
+import tempfile
+import shutil
+import shlex
+import logging
+import threading
+import functools
+from datetime import datetime
+from .scan import FileEntry
+from .fileio import OPEN_ARCHIVES
+
+LOGGER = logging.getLogger(__name__)
+
+ARCHIVE_EXTENSIONS = (".zip", ".tar", ".tgz", ".tar.gz", ".tar.bz2", ".tar.xz")
+CHUNK_SIZE = 1024 * 1024
+# The magic numbers of the gzip, bzip2 and xz formats
+COMPRESSED_MAGIC = (b"\x1f\x8b", b"BZh", b"\xfd7zXZ\x00")
+
+
+def is_archive(path):
+    """Is the path a zip or tar archive?"""
+    return path.lower().endswith(ARCHIVE_EXTENSIONS) and os.path.isfile(path)
+
+
+def _is_compressed(path):
+    """Is the file compressed with gzip, bzip2 or xz?"""
+    with open(path, "rb") as stream:
+        return stream.read(6).startswith(COMPRESSED_MAGIC)
+
+
+class Archive:
+    """The files in a zip or tar archive. Use it as a context manager, so that the
+    paths of the members can be opened with fileio.open_path.
+
+    When spool is a folder, the members of a compressed tar are decompressed once, to a
+    temporary folder in that folder, which is removed when the archive is closed."""
+
+    def __init__(self, path, spool=None):
+        # zipfile and tarfile are imported only when an archive is read
+        import tarfile
+        import zipfile
+
+        self.path = path
+        # The members of a tar archive are read from the same file object
+        self.lock = threading.Lock()
+        self.is_zip = zipfile.is_zipfile(path)
+        # The folder where the members are decompressed, if any
+        self.spool = None
+        if self.is_zip:
+            self._archive = zipfile.ZipFile(path)
+            members = [
+                (info.filename, info, info.header_offset, info.file_size)
+                for info in self._archive.infolist()
+                if not info.filename.endswith("/")
+            ]
+        elif spool is not None and _is_compressed(path):
+            self._archive = tarfile.open(path, "r|*")
+            os.makedirs(spool, exist_ok=True)
+            self.spool = tempfile.mkdtemp(prefix=".sortpics-", dir=spool)
+            members = []
+        else:
+            self._archive = tarfile.open(path, "r:*")
+            members = [
+                (info.name, info, info.offset_data, info.size)
+                for info in self._archive.getmembers()
+                if info.isfile()
+            ]
+
+        # The members by normalized name, in the order in which they are stored
+        self.members = {}
+        self._folders = {}
+        for name, info, offset, size in sorted(members, key=lambda member: member[2]):
+            self._add_member(name, info, offset, size)
+        if self.spool is not None:
+            self._decompress()
+
+    def _add_member(self, name, info, offset, size):
+        """Add the member to the index, unless it is hidden, a duplicate, or outside of the archive"""
+        name = os.path.normpath(name)
+        if os.path.isabs(name) or name.split(os.sep, 1)[0] == "..":
+            return False
+        dirname, basename = os.path.split(name)
+        if basename.startswith(".") or name in self.members:
+            return False
+        self.members[name] = info, offset, size
+        self._folders.setdefault(dirname, []).append(basename)
+        return True
+
+    def _decompress(self):
+        """Decompress the members of the tar to the spool folder, in a single pass"""
+        try:
+            for info in self._archive:
+                if not info.isfile() or not self._add_member(
+                    info.name, info, len(self.members), info.size
+                ):
+                    continue
+                spooled = self._spooled(os.path.normpath(info.name))
+                with self._archive.extractfile(info) as source, open(
+                    spooled, "xb"
+                ) as stream:
+                    shutil.copyfileobj(source, stream, CHUNK_SIZE)
+                mtime = self._mtime_ns(info)
+                os.utime(spooled, ns=(mtime, mtime))
+        except BaseException:
+            self.close()
+            raise
+
+    def _spooled(self, name):
+        """The path of the decompressed member in the spool folder"""
+        _, offset, _ = self.members[name]
+        return os.path.join(self.spool, str(offset))
+
+    def __enter__(self):
+        OPEN_ARCHIVES[self.path] = self
+        return self
+
+    def __exit__(self, *exc):
+        OPEN_ARCHIVES.pop(self.path, None)
+        self.close()
+
+    def close(self):
+        """Close the archive, and remove the spool folder with the members that were not extracted"""
+        self._archive.close()
+        if self.spool is not None:
+            shutil.rmtree(self.spool, ignore_errors=True)
+
+    def scan(self):
+        """Yield a FileEntry for each file in the archive, in the order in which they are stored.
+        The paths are like those of scan, e.g. './IMG_1.JPG' or 'Google Photos/IMG_1.JPG'
+        """
+        for i, (name, (info, _, size)) in enumerate(self.members.items()):
+            yield FileEntry(
+                name if os.path.dirname(name) else os.path.join(".", name),
+                size,
+                self._mtime_ns(info),
+                i,
+                0,
+            )
+
+    def _mtime_ns(self, info):
+        if self.is_zip:
+            return int(datetime(*info.date_time).timestamp()) * 1000000000
+        return int(info.mtime) * 1000000000
+
+    def listdir(self, dirname):
+        """The names of the files in a directory of the archive"""
+        return list(self._folders.get(os.path.normpath(dirname), ()))
+
+    def open(self, name):
+        """A seekable binary stream for the member"""
+        if self.spool is not None:
+            return open(self._spooled(os.path.normpath(name)), "rb")
+        info, _, size = self.members[os.path.normpath(name)]
+        if self.is_zip:
+            opener = functools.partial(self._archive.open, info)
+        else:
+            opener = functools.partial(self._archive.extractfile, info)
+        return _MemberReader(opener, os.path.join(self.path, name), size, self.lock)
+
+    def extract(self, moves, folder, on_move=None):
+        """Copy the members in the list of (name, target) pairs to their target in the folder.
+        The members are read in the order in which they are stored, and each one is written to
+        a temporary file next to its target, then renamed. Existing targets are never overwritten.
+        Return the number of files extracted."""
+        start = time.perf_counter()
+        for new_dir in sorted({os.path.dirname(target) for _, target in moves}):
+            if new_dir:
+                os.makedirs(os.path.join(folder, new_dir), exist_ok=True)
+
+        extracted = copied_bytes = 0
+        for name, target in sorted(
+            moves, key=lambda move: self.members[os.path.normpath(move[0])][1]
+        ):
+            try:
+                copied_bytes += self._extract_one(name, os.path.join(folder, target))
+            except OSError as err:
+                LOGGER.warning("# Could not extract %s to %s: %s", name, target, err)
+                continue
+            extracted += 1
+            if on_move is not None:
+                on_move(name, target)
+
+        elapsed = time.perf_counter() - start
+        if extracted:
+            print(
+                f"# Extracted {extracted} files in {elapsed:.2f}s "
+                f"({copied_bytes / 1e6:.1f} MB, {copied_bytes / 1e6 / elapsed:.1f} MB/s)"
+            )
+        return extracted
+
+    def _extract_one(self, name, target):
+        if self.spool is not None:
+            # The member was decompressed next to its target
+            spooled = self._spooled(os.path.normpath(name))
+            size = os.path.getsize(spooled)
+            if os.path.lexists(target):
+                raise FileExistsError(errno.EEXIST, "Target exists", target)
+            try:
+                os.rename(spooled, target)
+                return size
+            except OSError as err:
+                # The target is on another device: the member is copied
+                if err.errno != errno.EXDEV:
+                    raise
+
+        target_dir, target_name = os.path.split(target)
+        partial = os.path.join(target_dir, f".{target_name}.sortpics-partial")
+        try:
+            with self.open(name) as source, open(partial, "xb") as stream:
+                shutil.copyfileobj(source, stream, CHUNK_SIZE)
+                size = stream.tell()
+            info = self.members[os.path.normpath(name)][0]
+            mtime = self._mtime_ns(info)
+            os.utime(partial, ns=(mtime, mtime))
+            if os.path.lexists(target):
+                raise FileExistsError(errno.EEXIST, "Target exists", target)
+            os.rename(partial, target)
+        except BaseException:
+            if os.path.lexists(partial):
+                os.unlink(partial)
+            raise
+        return size
+
+    def command(self, name, target):
+        """A shell command that extracts the member to the target"""
+        # The member name as stored, e.g. './IMG_1.JPG' in an archive made with 'tar czf x.tar.gz .'
+        info = self.members[os.path.normpath(name)][0]
+        if self.is_zip:
+            command = ["unzip", "-p", os.path.abspath(self.path), info.filename]
+        else:
+            command = ["tar", "-xOf", os.path.abspath(self.path), info.name]
+        return (
+            " ".join(shlex.quote(arg) for arg in command) + f" > {shlex.quote(target)}"
+        )
+
+
+class _MemberReader(io.RawIOBase):
+    """A seekable stream on an archive member. The seeks are done only when the stream is read,
+    so that seeking to the end of a compressed member, to find its size, is free.
+
+    The member is opened with opener(). When the member stream is not seekable, e.g. the
+    zip members in Python 3.6, the seeks are done by reading, or by opening it again."""
+
+    def __init__(self, opener, name, size, lock):
+        super().__init__()
+        self.opener = opener
+        self.stream = opener()
+        self.name = name
+        self.size = size
+        self.lock = lock
+        self.position = 0
+        # The position of the member stream
+        self.stream_position = 0
+
+    def readable(self):
+        return True
+
+    def seekable(self):
+        return True
+
+    def readinto(self, buffer):
+        with self.lock:
+            if self.stream_position != self.position:
+                self._seek_stream()
+            size = self.stream.readinto(buffer)
+            self.stream_position += size or 0
+        self.position += size or 0
+        return size
+
+    def _seek_stream(self):
+        if self.stream.seekable():
+            self.stream_position = self.stream.seek(self.position)
+            return
+        if self.position < self.stream_position:
+            self.stream.close()
+            self.stream = self.opener()
+            self.stream_position = 0
+        while self.stream_position < self.position:
+            data = self.stream.read(
+                min(self.position - self.stream_position, CHUNK_SIZE)
+            )
+            if not data:
+                break
+            self.stream_position += len(data)
+
+    def seek(self, offset, whence=io.SEEK_SET):
+        if whence == io.SEEK_CUR:
+            offset += self.position
+        elif whence == io.SEEK_END:
+            offset += self.size
+        self.position = max(0, offset)
+        return self.position
+
+    def tell(self):
+        return self.position
+
+    def close(self):
+        self.stream.close()
+        super().close()
@@ -0,0 +1,123 @@
+"""A persistent cache for the creation dates and the content hashes, to make repeated runs faster"""
+
+import sqlite3
+from .timestamp import fromisoformat
+
+CACHE_NAME = ".sortpics_cache.db"
+
+# Version 1 stores the dates in the file metadata, before the choice with the path dates
+SCHEMA_VERSION = 1
+
+
+class MetadataCache:
+    """The creation dates and the content hashes of the files in a folder, keyed by relative path,
+    size, mtime and inode.
+
+    A file that was renamed, e.g. by a previous sortpics run, is found again by its inode.
+    The dates are the ones in the file metadata: the date in the path, that changes with
+    the renames, is taken into account after the lookup (see timestamp.best_creation_date).
+    """
+
+    def __init__(self, path, rebuild=False, commit_every=1000):
+        self.connection = sqlite3.connect(path)
+        self.commit_every = commit_every
+        self._uncommitted = 0
+        (version,) = self.connection.execute("PRAGMA user_version").fetchone()
+        if rebuild or version != SCHEMA_VERSION:
+            self.connection.execute("DROP TABLE IF EXISTS metadata")
+            self.connection.execute("DROP TABLE IF EXISTS hashes")
+        self.connection.execute(
+            "CREATE TABLE IF NOT EXISTS metadata "
+            "(path TEXT PRIMARY KEY, size INTEGER, mtime_ns INTEGER, inode INTEGER, timestamp TEXT)"
+        )
+        self.connection.execute(
+            "CREATE INDEX IF NOT EXISTS metadata_inode ON metadata (inode)"
+        )
+        self.connection.execute(
+            "CREATE TABLE IF NOT EXISTS hashes (path TEXT, kind TEXT, size INTEGER, "
+            "mtime_ns INTEGER, inode INTEGER, digest TEXT, PRIMARY KEY (path, kind))"
+        )
+        self.connection.execute(f"PRAGMA user_version = {SCHEMA_VERSION}")
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    def lookup(self, filename, stat):
+        """The cached media creation date (possibly None) for the given file.
+        Raises a KeyError if the file is not in the cache, or has changed."""
+        row = self.connection.execute(
+            "SELECT size, mtime_ns, inode, timestamp FROM metadata WHERE path = ?",
+            (filename,),
+        ).fetchone()
+        if row is not None and row[:3] == (stat.st_size, stat.st_mtime_ns, stat.st_ino):
+            return _decode(row[3])
+
+        # Was the file renamed?
+        row = self.connection.execute(
+            "SELECT path, timestamp FROM metadata WHERE inode = ? AND size = ? AND mtime_ns = ?",
+            (stat.st_ino, stat.st_size, stat.st_mtime_ns),
+        ).fetchone()
+        if row is None:
+            raise KeyError(filename)
+
+        old_filename, timestamp = row
+        self._execute(
+            "DELETE FROM metadata WHERE path IN (?, ?)", (old_filename, filename)
+        )
+        self.store(filename, stat, _decode(timestamp))
+        return _decode(timestamp)
+
+    def store(self, filename, stat, timestamp):
+        """Store the media creation date (or None) of the given file"""
+        self._execute(
+            "INSERT OR REPLACE INTO metadata VALUES (?, ?, ?, ?, ?)",
+            (
+                filename,
+                stat.st_size,
+                stat.st_mtime_ns,
+                stat.st_ino,
+                None if timestamp is None else timestamp.isoformat(),
+            ),
+        )
+
+    def lookup_hash(self, filename, stat, kind):
+        """The cached hash of the given kind ('partial' or 'full') for the given file.
+        Raises a KeyError if the hash is not in the cache, or if the file has changed.
+        """
+        row = self.connection.execute(
+            "SELECT size, mtime_ns, inode, digest FROM hashes WHERE path = ? AND kind = ?",
+            (filename, kind),
+        ).fetchone()
+        if row is None or row[:3] != (stat.st_size, stat.st_mtime_ns, stat.st_ino):
+            raise KeyError(filename)
+        return row[3]
+
+    def store_hash(self, filename, stat, kind, digest):
+        """Store the hash of the given kind for the given file"""
+        self._execute(
+            "INSERT OR REPLACE INTO hashes VALUES (?, ?, ?, ?, ?, ?)",
+            (filename, kind, stat.st_size, stat.st_mtime_ns, stat.st_ino, digest),
+        )
+
+    def _execute(self, query, parameters):
+        self.connection.execute(query, parameters)
+        self._uncommitted += 1
+        if self._uncommitted >= self.commit_every:
+            self.commit()
+
+    def commit(self):
+        """Write the pending changes to disk"""
+        self.connection.commit()
+        self._uncommitted = 0
+
+    def close(self):
+        """Commit and close the cache"""
+        self.commit()
+        self.connection.close()
+
+
+def _decode(timestamp):
+    return None if timestamp is None else fromisoformat(timestamp)
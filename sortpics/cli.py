@@ -1,28 +1,248 @@
 """Command line interface for sortpics"""
 
 import os
+import sys
 import shlex
-import shutil
 import argparse
 import logging
+import time
+from itertools import chain
+from contextlib import ExitStack
 from datetime import datetime
-from .normalize import normalize_filenames
+from .normalize import iter_creation_dates, normalize_targets
+from .transfer import MODES
+from .manifest import Manifest, MANIFEST_NAME, folder_of
+from .parallel import EXECUTORS
+from .cache import MetadataCache, CACHE_NAME
+from .stats import RunStats, timed
+from .scan import FileEntry, scan
+from .journal import Journal, JOURNAL_PREFIX, apply, reconcile
+from .table import FileTable
+from .archive import Archive, is_archive
+from .takeout import TakeoutSidecars
+from .timestamp import PathPolicy
+from .shard import parse_shard, in_shard, write_partial, read_partials
+from .moves import move, undo_command, date_subfolder, sidecar_targets, ScriptWriter
 
 LOGGER = logging.getLogger(__name__)
 
-try:
-    shlex.join([])
-except AttributeError:
-    shlex.join = lambda args: " ".join(shlex.quote(arg) for arg in args)
 
+def _trusted(pattern):
+    return pattern, True
 
-def _parse_args(args=None):
+
+def _untrusted(pattern):
+    return pattern, False
+
+
+def _parse_args(args=None, command=None):
+    """The arguments of sortpics, or of the 'plan' or 'scan' commands"""
+    parser = argparse.ArgumentParser(
+        prog=None if command is None else f"sortpics {command}",
+        description={
+            None: "Normalize the picture names and hierarchy. Use 'sortpics plan' and "
+            "'sortpics apply' to plan the moves and to do them separately, or 'sortpics scan' "
+            "and 'sortpics merge' to shard the extraction over several processes or hosts",
+            "plan": "Write the moves that normalize the picture names and hierarchy to a plan",
+            "scan": "Extract the creation dates of the files in one root, or in one shard of "
+            "a root, to a partial file, to be merged with 'sortpics merge'",
+        }[command],
+    )
+    if command == "plan":
+        parser.add_argument(
+            "--out",
+            dest="plan",
+            metavar="PLAN",
+            required=True,
+            help="The plan file (JSON lines), to be used with 'sortpics apply PLAN'",
+        )
+    if command == "scan":
+        parser.add_argument(
+            "--out",
+            dest="partial",
+            metavar="PARTIAL",
+            required=True,
+            help="The partial file (JSON lines), to be used with 'sortpics merge'",
+        )
+        parser.add_argument(
+            "--shard",
+            type=parse_shard,
+            metavar="I/N",
+            help="Only scan the files in the I-th of N partitions of the paths, e.g. 0/4",
+        )
+
+    parser.add_argument(
+        "--folder",
+        help="Folder to normalize (default: current folder), or a zip or tar archive, "
+        "whose files are copied to their targets in the folder of the archive",
+        default=".",
+    )
+    if command != "scan":
+        parser.add_argument(
+            "--subfolder",
+            help="Move the pictures to a date/month subfolder",
+            default="%Y-%m",
+        )
+        parser.add_argument(
+            "--dest",
+            metavar="DIR",
+            help="Build the sorted tree in this folder rather than in --folder",
+        )
+        _add_mode_argument(parser)
+    if command is None:
+        parser.add_argument(
+            "--no-test",
+            dest="test",
+            action="store_false",
+            help="Proceed with the proposed renaming",
+        )
+        parser.add_argument(
+            "--no-scripts",
+            dest="scripts",
+            action="store_false",
+            help="Do not generate rename and undo scripts",
+        )
+    parser.add_argument(
+        "--jobs",
+        type=int,
+        default=1,
+        help="Number of workers used to extract the creation dates (default: 1)",
+    )
+    parser.add_argument(
+        "--executor",
+        choices=EXECUTORS + ("async",),
+        default="thread",
+        help="Use threads for I/O bound extraction (e.g. on network storage), "
+        "processes when parsing is CPU bound, or async to keep many reads in flight "
+        "on network mounts with a high latency, e.g. with --jobs 256 (default: thread)",
+    )
+    parser.add_argument(
+        "--jobs-per-mount",
+        type=int,
+        help="With --executor async, the maximum number of files read at the same time "
+        "on each mount (default: --jobs)",
+    )
+    parser.add_argument(
+        "--no-cache",
+        dest="cache",
+        action="store_false",
+        help=f"Do not use the cache of creation dates in {CACHE_NAME}",
+    )
+    parser.add_argument(
+        "--rebuild-cache",
+        action="store_true",
+        help="Parse all the files again, and replace the cached creation dates",
+    )
+    parser.add_argument(
+        "--trust-path-datetime",
+        dest="path_rules",
+        action="append",
+        nargs="?",
+        const=("*", True),
+        type=_trusted,
+        metavar="GLOB",
+        help="Do not read the files whose name has a datetime to the second, e.g. "
+        "VID_20150103_141719.3gp, and use that datetime. Without a pattern, all the file "
+        "names are trusted, otherwise only those that match the pattern, e.g. 'VID_*'",
+    )
+    parser.add_argument(
+        "--no-trust-path-datetime",
+        dest="path_rules",
+        action="append",
+        type=_untrusted,
+        metavar="GLOB",
+        help="Read the files that match the pattern, e.g. 'Screenshot_*', even when their "
+        "name has a datetime. The last pattern that matches a file wins",
+    )
+    if command != "scan":
+        parser.add_argument(
+            "--incremental",
+            action="store_true",
+            help=f"Only process the files that are not in {MANIFEST_NAME}, "
+            "i.e. that were added since the last run with --incremental --no-test",
+        )
+    parser.add_argument(
+        "--stats",
+        action="store_true",
+        help="Print the time spent in each stage, and the calls to each metadata extractor",
+    )
+    parser.add_argument(
+        "--stats-json",
+        metavar="PATH",
+        help="Write the stats, including latency histograms and the slowest files, to a JSON file",
+    )
+    if command is None:
+        parser.add_argument(
+            "--resume",
+            metavar="JOURNAL",
+            help=f"Do the moves of an interrupted --no-test run that are not done yet, "
+            f"as recorded in its journal {JOURNAL_PREFIX}*.jsonl",
+        )
+    parser.set_defaults(test=True, scripts=True, cache=True)
+
+    return parser.parse_args(args)
+
+
+def _add_mode_argument(parser):
+    parser.add_argument(
+        "--mode",
+        choices=MODES,
+        default="move",
+        help="Move the files to the destination, or keep the original tree untouched, and "
+        "hard link, clone (FICLONE, with a fallback to a copy when the filesystem does not "
+        "support it) or copy (copy_file_range) the files (default: move)",
+    )
+
+
+def _parse_apply_args(args=None):
     parser = argparse.ArgumentParser(
-        description="Normalize the picture names and hierarchy"
+        prog="sortpics apply",
+        description="Do the moves in a plan written by 'sortpics plan'. The files that have "
+        "changed since the plan was made are not moved. An interrupted apply can be run again.",
     )
+    parser.add_argument("journal", metavar="PLAN", help="The plan file")
+    parser.add_argument(
+        "--folder",
+        help="Apply the plan to this folder, e.g. when the plan was made on a replica "
+        "(default: the folder where the plan was made)",
+    )
+    parser.add_argument(
+        "--jobs", type=int, default=1, help="Number of files moved in parallel"
+    )
+    parser.add_argument(
+        "--no-scripts",
+        dest="scripts",
+        action="store_false",
+        help="Do not generate an undo script",
+    )
+    parser.add_argument(
+        "--incremental",
+        action="store_true",
+        help=f"Record the moves in {MANIFEST_NAME}",
+    )
+    return parser.parse_args(args)
+
 
+def _parse_merge_args(args=None):
+    parser = argparse.ArgumentParser(
+        prog="sortpics merge",
+        description="Merge the partial files written by 'sortpics scan' into a single plan, "
+        "that moves the files of all the roots to a unified tree in the destination folder",
+    )
+    parser.add_argument(
+        "partials", metavar="PARTIAL", nargs="+", help="The partial files"
+    )
     parser.add_argument(
-        "--folder", help="Folder to normalize (default: current folder)", default="."
+        "--out",
+        dest="plan",
+        metavar="PLAN",
+        required=True,
+        help="The plan file (JSON lines), to be used with 'sortpics apply PLAN'",
+    )
+    parser.add_argument(
+        "--folder",
+        help="The destination folder (default: current folder)",
+        default=".",
     )
     parser.add_argument(
         "--subfolder",
@@ -30,44 +250,103 @@ def _parse_args(args=None):
         default="%Y-%m",
     )
     parser.add_argument(
-        "--no-test",
-        dest="test",
-        action="store_false",
-        help="Proceed with the proposed renaming",
+        "--jobs",
+        type=int,
+        default=1,
+        help="Number of threads used to compare the files that have the same target",
+    )
+    _add_mode_argument(parser)
+    return parser.parse_args(args)
+
+
+def _parse_watch_args(args=None):
+    parser = argparse.ArgumentParser(
+        prog="sortpics watch",
+        description="Watch the folder with inotify (Linux only), and move the new files to "
+        "their normalized target as they arrive. The folder is walked only once, when the "
+        "watch starts. Stop the watch with Ctrl+C",
+    )
+    parser.add_argument(
+        "--folder",
+        help="Folder to watch (default: current folder)",
+        default=".",
+    )
+    parser.add_argument(
+        "--subfolder",
+        help="Move the pictures to a date/month subfolder",
+        default="%Y-%m",
+    )
+    parser.add_argument(
+        "--debounce",
+        type=float,
+        default=2.0,
+        metavar="SECONDS",
+        help="Sort the new files once no file was written during that many seconds (default: 2)",
+    )
+    parser.add_argument(
+        "--jobs",
+        type=int,
+        default=1,
+        help="Number of workers used to extract the creation dates (default: 1)",
+    )
+    parser.add_argument(
+        "--executor",
+        choices=EXECUTORS,
+        default="thread",
+        help="Use threads for I/O bound extraction, or processes when parsing is CPU bound",
     )
     parser.add_argument(
         "--no-scripts",
         dest="scripts",
         action="store_false",
-        help="Do not generate rename and undo scripts",
+        help="Do not generate an undo script",
     )
-    parser.set_defaults(test=True, scripts=True)
-
     return parser.parse_args(args)
 
 
 def sortpics_cli(args=None):
     """sortpics at the command line"""
-    args = _parse_args(args)
-    sortpics(**vars(args))
+    if args is None:
+        args = sys.argv[1:]
+    if args[:1] == ["apply"]:
+        resume_moves(**vars(_parse_apply_args(args[1:])))
+        return
+    if args[:1] in (["plan"], ["scan"]):
+        sortpics(**vars(_parse_args(args[1:], command=args[0])))
+        return
+    if args[:1] == ["merge"]:
+        merge_partials(**vars(_parse_merge_args(args[1:])))
+        return
+    if args[:1] == ["watch"]:
+        # The inotify binding is loaded only by the watch command
+        from .watch import watch
 
+        watch(**vars(_parse_watch_args(args[1:])))
+        return
+    sortpics(**vars(_parse_args(args)))
 
-def move(folder, filenames, targets, test=True):
-    """A function that moves the given filenames to their targets"""
-    undo = [shlex.join(["cd", folder])]
-    script = [shlex.join(["cd", folder])]
 
-    mkdirs = set()
+def extract(archive, folder, filenames, targets, test=True, script=None, undo=None):
+    """Like move, for the files of an Archive: the members are copied to their targets in
+    the folder. The existing targets are not overwritten, and the undo script removes the
+    files extracted."""
+    if undo is None:
+        undo = []
+    if script is None:
+        script = []
+    undo.append(shlex.join(["cd", folder]))
+    script.append(shlex.join(["cd", folder]))
 
+    mkdirs = set()
+    planned = set()
+    moves = []
     for filename, target in sorted(zip(filenames, targets)):
         if target is None:
             continue
 
-        if os.path.exists(target):
-            if os.path.samefile(filename, target):
-                continue
-
-            LOGGER.warning("# Target exists: %s", shlex.join(["mv", filename, target]))
+        cmd = archive.command(filename, target)
+        if target in planned or os.path.lexists(os.path.join(folder, target)):
+            LOGGER.warning("# Target exists: %s", cmd)
             continue
 
         new_dir = os.path.dirname(target)
@@ -75,70 +354,237 @@ def move(folder, filenames, targets, test=True):
             script.append(shlex.join(["mkdir", "-p", new_dir]))
             mkdirs.add(new_dir)
 
-        cmd = shlex.join(["mv", filename, target])
         script.append(cmd)
         print(cmd)
+        undo.append(shlex.join(["rm", target]))
+        planned.add(target)
+        moves.append((filename, target))
 
-        undo.append(shlex.join(["mv", target, filename]))
-
-        if not test:
-            os.makedirs(os.path.dirname(target), exist_ok=True)
-            shutil.move(filename, target)
+    if not test:
+        archive.extract(moves, folder)
 
     return script, undo
 
 
-def sortpics(folder=".", test=True, scripts=True, subfolder="%Y-%m"):
-    """The function that is called by sortpics command line"""
-    filenames = []
-    for root, dirs, files in os.walk(folder):
-        files = [f for f in files if not f[0] == "."]
-        dirs[:] = [d for d in dirs if not d[0] == "."]
-        relative_root = os.path.relpath(root, folder)
-        filenames.extend(os.path.join(relative_root, filename) for filename in files)
-
-    targets = normalize_filenames(filenames, folder)
-
-    # Add year-month parent folder
-    if subfolder:
-        targets_with_subfolder = []
-        for target in targets:
-            if target is None:
-                targets_with_subfolder.append(None)
-            else:
-                date = datetime.strptime(target[:10], "%Y-%m-%d")
-                targets_with_subfolder.append(
-                    os.path.join(date.strftime(subfolder), target)
+def resume_moves(journal, folder=None, jobs=1, scripts=True, incremental=False):
+    """Do the moves in a plan, or the moves of an interrupted --no-test run, that are not marked
+    as done in the journal. The files are moved in the folder of the journal, or in the given folder.
+    """
+    log = Journal.open(journal)
+    if folder is not None:
+        log.folder = os.path.abspath(folder)
+    stem = os.path.splitext(os.path.basename(journal))[0]
+    if stem.startswith(JOURNAL_PREFIX):
+        # The journal of an interrupted run is named after the start of that run
+        stem = stem[len(JOURNAL_PREFIX) :]
+    else:
+        # The plans that have the same name are told apart by their creation time
+        created = log.created or datetime.now().isoformat()
+        stem = f'{stem}_{created.replace(":", ".")}'
+    undo_script = os.path.join(log.folder, f".sortpics_undo_{stem}.sh")
+
+    try:
+        with ExitStack() as stack:
+            stack.enter_context(log)
+            manifest = None
+            if incremental:
+                manifest = stack.enter_context(
+                    Manifest(os.path.join(log.folder, MANIFEST_NAME))
                 )
-        targets = targets_with_subfolder
+            entries = {entry.path: entry for entry, _, _ in log.moves}
 
-    script, undo = move(folder, filenames, targets, test=test)
+            def on_move(filename, target):
+                manifest.record_move(entries[filename], target)
+
+            apply(
+                log,
+                jobs=jobs,
+                on_move=None if manifest is None else on_move,
+                check=True,
+            )
+            if manifest is not None:
+                manifest.commit()
+    finally:
+        # The journal is closed at this stage
+        if scripts:
+            write_undo_script(journal, undo_script, folder=log.folder)
+
+    if scripts and os.path.exists(undo_script):
+        print(f"# Undo the renaming with 'bash {undo_script}'")
+
+
+def write_undo_script(journal, undo_script, folder=None):
+    """Write a script that reverses the moves done in the journal,
+    in the folder of the journal or in the given folder"""
+    if not os.path.exists(journal):
+        return
+    try:
+        with Journal.open(journal) as log:
+            # The moves that completed after an interruption are not marked yet
+            reconcile(log)
+            completed = log.completed()
+    except ValueError:
+        # The plan is incomplete, so no file was moved
+        return
+
+    with open(undo_script, "w") as stream:
+        stream.write(
+            "#!/bin/bash\n"
+            f"# This script reverses the renaming done by sortpics at {log.created}\n"
+            f"{shlex.join(['cd', folder or log.folder])}\n"
+        )
+        # The moves are reversed in the reverse order, as a move may go to a target freed by an earlier move
+        for source, target in reversed(completed):
+            stream.write(undo_command(log.mode, source, target) + "\n")
+
+
+def sortpics(
+    folder=".",
+    test=True,
+    scripts=True,
+    subfolder="%Y-%m",
+    jobs=1,
+    executor="thread",
+    cache=True,
+    rebuild_cache=False,
+    incremental=False,
+    stats=False,
+    stats_json=None,
+    resume=None,
+    plan=None,
+    jobs_per_mount=None,
+    shard=None,
+    partial=None,
+    dest=None,
+    mode="move",
+    path_rules=None,
+):
+    """The function that is called by sortpics command line. With plan=PATH, the moves
+    are written to that plan, and the files are not moved. With partial=PATH, the files
+    in the (index, count) shard and their creation dates are written to that partial file,
+    see merge_partials. When folder is a zip or tar archive, the files are copied from
+    the archive to their targets in the folder of the archive. With dest=DIR, the sorted
+    tree is built in that folder, and the files are moved, hard linked, cloned or copied
+    there depending on mode. The path_rules, (glob pattern, trust) pairs, tell which files
+    are dated with the datetime in their name without being read, see PathPolicy."""
+    if resume is not None:
+        return resume_moves(resume, jobs=jobs, scripts=scripts, incremental=incremental)
+
+    _check_options(folder, incremental, plan, partial, dest, mode, executor)
+    if dest is not None:
+        dest = os.path.abspath(dest)
+    if is_archive(folder):
+        # The cache and the scripts are in the folder of the archive
+        cache = False
+
+    run_stats = RunStats() if stats or stats_json else None
+    with ExitStack() as stack:
+        # The folder where the targets are
+        target_folder = folder
+        archive = None
+        if is_archive(folder):
+            target_folder = dest or os.path.dirname(os.path.abspath(folder))
+            # The members of a compressed tar are decompressed once, next to their targets
+            archive = stack.enter_context(
+                Archive(folder, spool=None if test else target_folder)
+            )
+            # The targets are relative to the target folder
+            dest = None
+
+        metadata_cache = None
+        if cache:
+            metadata_cache = stack.enter_context(
+                MetadataCache(os.path.join(folder, CACHE_NAME), rebuild=rebuild_cache)
+            )
+        manifest = None
+        if incremental:
+            manifest = stack.enter_context(
+                Manifest(os.path.join(folder, MANIFEST_NAME))
+            )
+
+        # The dates in the Google Takeout sidecars are used, when available
+        sidecars = TakeoutSidecars(
+            folder, listdir=None if archive is None else archive.listdir
+        )
+        table = _read_dates(
+            _walk(folder, archive, manifest, sidecars, shard, dest),
+            folder,
+            run_stats,
+            jobs=jobs,
+            executor=executor,
+            cache=metadata_cache,
+            jobs_per_mount=jobs_per_mount,
+            sidecars=sidecars,
+            path_policy=PathPolicy(path_rules) if path_rules else None,
+        )
+
+        if partial is not None:
+            write_partial(
+                partial,
+                folder,
+                table,
+                shard,
+                created=datetime.now().isoformat(),
+                pairs=sidecars.pairs,
+            )
+            _report_stats(run_stats, stats, stats_json)
+            print(
+                "# Merge the partial files with 'sortpics merge PARTIAL... --out PLAN'"
+            )
+            return
+
+        targets, known_entries = _plan_targets(
+            folder,
+            table,
+            subfolder,
+            dest,
+            manifest,
+            sidecars.pairs,
+            cache=metadata_cache,
+            jobs=jobs,
+            run_stats=run_stats,
+        )
 
-    if scripts:
         now = datetime.now().isoformat()
-        undo = [
-            "#!/bin/bash",
-            f"# This script reverses the renaming {'proposed' if test else 'done'} by sortpics at {now}",
-        ] + undo
-        undo_script_name = (
-            f'.sortpics_undo_{"test_" if test else ""}{now.replace(":", ".")}.sh'
-        )
-        with open(os.path.join(folder, undo_script_name), "w") as stream:
-            stream.write("\n".join(undo) + "\n")
-
-        script = [
-            "#!/bin/bash",
-            f"# This script does the renaming {'proposed' if test else 'done'} by sortpics at {now}",
-        ] + script
-        script_name = f'.sortpics_{"test_" if test else ""}{now.replace(":", ".")}.sh'
-        with open(os.path.join(folder, script_name), "w") as stream:
-            stream.write("\n".join(script) + "\n")
+        if plan is not None:
+            test = False
+        script_name, undo_script_name = _execute(
+            stack,
+            folder,
+            target_folder,
+            archive,
+            table,
+            targets,
+            known_entries,
+            now,
+            test=test,
+            scripts=scripts,
+            plan=plan,
+            manifest=manifest,
+            jobs=jobs,
+            mode=mode,
+            run_stats=run_stats,
+        )
+
+    _report_stats(run_stats, stats, stats_json)
+
+    if plan is not None:
+        print(f"# Apply the plan with {shlex.join(['sortpics', 'apply', plan])}")
+        return
 
+    _print_next_steps(target_folder, script_name, undo_script_name, test, scripts)
+
+
+def _print_next_steps(folder, script_name, undo_script_name, test, scripts):
+    """Tell how to do, or to undo, the renaming, and how to remove the empty folders"""
+    if scripts:
         if test:
             print(
                 f"# Rerun with --no-test to rename the files, or execute 'bash {script_name}'"
             )
-        print(f"# Undo the renaming with 'bash {undo_script_name}'")
+        if os.path.exists(os.path.join(folder, undo_script_name)):
+            # A --no-test run with nothing to move has no journal, and no undo script
+            print(f"# Undo the renaming with 'bash {undo_script_name}'")
 
     elif test:
         print("# Rerun with --no-test to rename the files")
@@ -146,3 +592,333 @@ def sortpics(folder=".", test=True, scripts=True, subfolder="%Y-%m"):
     print(
         "# When you're done, clean up empty directories with 'find . -type d -empty -delete'"
     )
+
+
+def _check_options(folder, incremental, plan, partial, dest, mode, executor):
+    """Raise a ValueError for the options of sortpics that do not go together"""
+    if mode != "move" and dest is None:
+        raise ValueError(f"--mode {mode} requires --dest")
+    if dest is not None:
+        if os.path.abspath(dest) == os.path.abspath(folder):
+            raise ValueError("--dest should be another folder than --folder")
+        if incremental:
+            raise ValueError("--incremental does not support --dest")
+
+    if is_archive(folder):
+        if incremental or plan is not None or partial is not None:
+            raise ValueError(
+                "--incremental, 'sortpics plan' and 'sortpics scan' do not support archives"
+            )
+        if mode != "move":
+            raise ValueError(
+                "--mode does not apply to archives, whose files are always copied"
+            )
+        if executor == "process":
+            # The archive is open in this process only
+            raise ValueError("--executor process does not support archives")
+
+
+def _walk(folder, archive, manifest, sidecars, shard, dest):
+    """The FileEntry records of the files to be sorted: those of the folder, or of the archive,
+    in the optional shard, and not in the destination"""
+    if archive is not None:
+        return archive.scan()
+
+    walk = scan(
+        folder,
+        manifest,
+        # The sidecars are listed in every shard, so that they are found for any media file
+        on_listing=sidecars.add_listing,
+        select=None if shard is None else lambda path: in_shard(path, shard),
+    )
+    if dest is not None:
+        inner = os.path.relpath(dest, folder)
+        if inner != os.pardir and not inner.startswith(os.pardir + os.sep):
+            # The files already in the destination are not sorted again
+            inner = os.path.join(inner, "")
+            walk = (
+                entry
+                for entry in walk
+                if not os.path.normpath(entry.path).startswith(inner)
+            )
+    return walk
+
+
+def _read_dates(walk, folder, run_stats, **kwargs):
+    """A FileTable with the files in walk and their creation dates, see iter_creation_dates.
+    The extraction starts while the folder is being walked."""
+    table = FileTable()
+    if run_stats is not None:
+        walk = run_stats.timed_iter("walk", walk)
+    start = time.perf_counter(), time.process_time()
+    for entry, timestamp in iter_creation_dates(
+        walk, folder, stats=run_stats, **kwargs
+    ):
+        table.append(entry, timestamp)
+    if run_stats is not None:
+        # The time spent in the walk is not counted twice
+        walk_wall, walk_cpu = run_stats.stages.get("walk", (0.0, 0.0))
+        run_stats.add_stage_time(
+            "extract",
+            time.perf_counter() - start[0] - walk_wall,
+            time.process_time() - start[1] - walk_cpu,
+        )
+    return table
+
+
+def _scan_entries(folder):
+    """The FileEntry records of the files in the folder, by absolute path"""
+    entries = {}
+    for entry in scan(folder):
+        path = os.path.normpath(os.path.join(folder, entry.path))
+        entries[path] = FileEntry.from_stat(path, entry)
+    return entries
+
+
+def _plan_targets(
+    folder, table, subfolder, dest, manifest, pairs, cache=None, jobs=1, run_stats=None
+):
+    """The targets of the files in the table, relative to the folder or in dest, and the
+    FileEntry records that tell which targets already exist"""
+    # The files in the destination, by absolute path
+    dest_entries = {} if dest is None else _scan_entries(dest)
+
+    # The new files are not existing files
+    new_paths = set()
+    if manifest is not None:
+        new_paths = {os.path.normpath(path) for path in table.filenames}
+
+    def target_path(target):
+        if subfolder:
+            target = os.path.join(date_subfolder(target, subfolder), target)
+        if dest is not None:
+            target = os.path.join(dest, target)
+        return target
+
+    def existing(target):
+        if manifest is not None:
+            # The files that were sorted in the previous runs are in the manifest
+            entry = manifest.entry(target_path(target))
+            if entry is not None and entry.path in new_paths:
+                entry = None
+        else:
+            entry = dest_entries.get(target_path(target))
+        return None if entry is None else (entry.path, entry.st_size)
+
+    filenames = table.filenames
+    with timed(run_stats, "plan"):
+        targets = normalize_targets(
+            filenames,
+            table.datetimes,
+            folder,
+            sizes=table.sizes,
+            stats=run_stats,
+            cache=cache,
+            jobs=jobs,
+            # The exact copies of the files in the destination, or of the files
+            # sorted in the previous runs, are not moved again
+            existing=existing if dest_entries or manifest is not None else None,
+            # The files that are already at their target keep it
+            target_path=target_path,
+        )
+
+    # Add year-month parent folder, and the destination
+    for i, target in enumerate(targets):
+        if target is not None:
+            targets[i] = target_path(target)
+
+    # The sidecars are moved with their media file
+    sidecar_targets(filenames, targets, pairs)
+
+    known_entries = table
+    if dest_entries:
+        known_entries = list(table.entries) + list(dest_entries.values())
+    if manifest is not None:
+        # Look for existing targets in the manifest, rather than on disk
+        known_entries = list(table.entries) + manifest.entries(
+            {folder_of(path) for path in chain(filenames, targets) if path}
+        )
+    return targets, known_entries
+
+
+def _execute(
+    stack,
+    folder,
+    target_folder,
+    archive,
+    table,
+    targets,
+    known_entries,
+    now,
+    test=True,
+    scripts=True,
+    plan=None,
+    manifest=None,
+    jobs=1,
+    mode="move",
+    run_stats=None,
+):
+    """Write the scripts, and the journal or the plan, and move or extract the files.
+    Return the names of the script and of the undo script."""
+    undo_script_name = (
+        f'.sortpics_undo_{"test_" if test else ""}{now.replace(":", ".")}.sh'
+    )
+    journal = plan
+    if plan is None and not test and archive is None:
+        journal = os.path.join(folder, f'{JOURNAL_PREFIX}{now.replace(":", ".")}.jsonl')
+        if scripts:
+            # The undo script is written from the journal, so that it is correct
+            # even if the run is interrupted
+            stack.callback(
+                write_undo_script, journal, os.path.join(folder, undo_script_name)
+            )
+
+    if manifest is not None and not test:
+        new_entries = {entry.path: entry for entry in table.entries}
+    moved = set()
+
+    def on_move(filename, target):
+        manifest.record_move(new_entries[filename], target)
+        moved.add(filename)
+
+    script_name = f'.sortpics_{"test_" if test else ""}{now.replace(":", ".")}.sh'
+    script = undo = ScriptWriter()
+    if scripts and plan is None:
+        script, undo = _open_scripts(
+            stack,
+            target_folder,
+            script_name,
+            # Without an archive, the undo script of a --no-test run is written from the journal
+            undo_script_name if test or archive is not None else None,
+            f"{'proposed' if test else 'done'} by sortpics at {now}",
+        )
+
+    filenames = table.filenames
+    with timed(run_stats, "move"):
+        if archive is not None:
+            extract(
+                archive,
+                target_folder,
+                filenames,
+                targets,
+                test=test,
+                script=script,
+                undo=undo,
+            )
+        else:
+            move(
+                folder,
+                filenames,
+                targets,
+                test=test,
+                entries=known_entries,
+                on_move=None if test or manifest is None else on_move,
+                jobs=jobs,
+                journal=journal,
+                plan_only=plan is not None,
+                script=script,
+                undo=undo,
+                mode=mode,
+            )
+    if manifest is not None and journal is not None and plan is None:
+        # The new files that were not moved, e.g. because their target was taken,
+        # are parsed again on the next run
+        for filename, target in zip(filenames, targets):
+            if (
+                target is not None
+                and filename not in moved
+                and os.path.normpath(target) != os.path.normpath(filename)
+            ):
+                manifest.forget(new_entries[filename])
+        manifest.commit()
+    return script_name, undo_script_name
+
+
+def _open_scripts(stack, folder, script_name, undo_script_name, renaming):
+    """A ScriptWriter for the script and for the undo script (if a name is given) in the folder,
+    where the scripts are written as the moves are planned"""
+    script = ScriptWriter(
+        stack.enter_context(open(os.path.join(folder, script_name), "w"))
+    )
+    script.append("#!/bin/bash")
+    script.append(f"# This script does the renaming {renaming}")
+    if undo_script_name is None:
+        return script, ScriptWriter()
+
+    undo = ScriptWriter(
+        stack.enter_context(open(os.path.join(folder, undo_script_name), "w"))
+    )
+    undo.append("#!/bin/bash")
+    undo.append(f"# This script reverses the renaming {renaming}")
+    return script, undo
+
+
+def _report_stats(run_stats, stats, stats_json):
+    """Print the stats, and/or write them to a JSON file"""
+    if run_stats is None:
+        return
+    if stats:
+        print(run_stats.summary())
+    if stats_json:
+        run_stats.write_json(stats_json)
+
+
+def merge_partials(partials, plan, folder=".", subfolder="%Y-%m", jobs=1, mode="move"):
+    """Merge the partial files written by 'sortpics scan' into a plan that moves the files of
+    all the roots to the folder. The millisecond resolution and the collisions between the
+    targets are settled over all the files. The sources in the plan are absolute paths.
+
+    The files of different roots that have the same size and target are compared by content,
+    so the roots should be accessible where the partial files are merged."""
+    table, roots, pairs = read_partials(partials)
+    folder = os.path.abspath(folder)
+    filenames = table.filenames
+
+    def target_path(target):
+        if subfolder:
+            target = os.path.join(date_subfolder(target, subfolder), target)
+        return os.path.join(folder, target)
+
+    # The files in the destination, by absolute path, when they are not in the partial files
+    dest_entries = {}
+    if not any(
+        folder == root or folder.startswith(os.path.join(root, "")) for root in roots
+    ):
+        dest_entries = _scan_entries(folder)
+
+    def existing(target):
+        entry = dest_entries.get(target_path(target))
+        return None if entry is None else (entry.path, entry.st_size)
+
+    targets = normalize_targets(
+        filenames,
+        table.datetimes,
+        sizes=table.sizes,
+        jobs=jobs,
+        # The exact copies of the files in the destination are not moved again
+        existing=existing if dest_entries else None,
+        target_path=target_path,
+    )
+    for i, target in enumerate(targets):
+        if target is not None:
+            targets[i] = target_path(target)
+    # The sidecars are moved with their media file
+    sidecar_targets(filenames, targets, pairs)
+
+    known_entries = table
+    if dest_entries:
+        known_entries = list(table.entries) + list(dest_entries.values())
+
+    move(
+        folder,
+        filenames,
+        targets,
+        test=False,
+        entries=known_entries,
+        journal=plan,
+        plan_only=True,
+        script=ScriptWriter(),
+        undo=ScriptWriter(),
+        mode=mode,
+    )
+    print(f"# Apply the plan with {shlex.join(['sortpics', 'apply', plan])}")
@@ -0,0 +1,133 @@
+"""A minimal EXIF reader that only reads the date tags in the first few KB of a JPEG, TIFF,
+camera RAW (CR2, NEF, ARW, DNG...) or HEIF file"""
+
+import struct
+from .stats import open_counted
+from .isobmff import is_heif, read_heif_exif
+
+# The largest offset at which we look for the EXIF segment in a JPEG file
+MAX_HEADER_OFFSET = 256 * 1024
+# The IFDs of TIFF and RAW files are looked for in a prefix of that size, and then in a
+# prefix of MAX_HEADER_OFFSET bytes if they are not complete
+TIFF_PREFIX = 64 * 1024
+
+# The camera RAW formats that are TIFF files
+RAW_EXTENSIONS = (".cr2", ".nef", ".nrw", ".arw", ".srf", ".sr2", ".dng", ".pef")
+TIFF_EXTENSIONS = (".tif", ".tiff") + RAW_EXTENSIONS
+
+EXIF_IFD_POINTER = 34665
+DATE_TAGS = [
+    (36867, 37521),  # (DateTimeOriginal, SubsecTimeOriginal)
+    (36868, 37522),  # (DateTimeDigitized, SubsecTimeDigitized)
+    (306, 37520),  # (DateTime, SubsecTime)
+]
+ASCII = 2
+LONG = 4
+
+
+def read_exif_tags(filename):
+    """The date tags in IFD0 and in the Exif IFD of a JPEG, TIFF or HEIF file, as a dictionary
+    {tag: string}. The format is found with the magic bytes rather than with the extension.
+    Raises a ValueError if the file cannot be parsed."""
+    with open_counted(filename) as stream:
+        header = stream.read(12)
+        if header[:2] == b"\xff\xd8":
+            stream.seek(2)
+            tiff = _jpeg_exif_segment(stream)
+        elif header[:4] in (b"II*\x00", b"MM\x00*"):
+            return _tiff_tags(stream, header)
+        elif is_heif(header):
+            stream.seek(0)
+            tiff = read_heif_exif(stream)
+        else:
+            raise ValueError("Not a JPEG, TIFF or HEIF file")
+
+    if tiff is None:
+        return {}
+    return parse_tiff_tags(tiff)
+
+
+def _tiff_tags(stream, header):
+    """The date tags of a TIFF file, from a bounded prefix of the file"""
+    data = header + stream.read(TIFF_PREFIX - len(header))
+    try:
+        return parse_tiff_tags(data)
+    except ValueError:
+        if len(data) < TIFF_PREFIX:
+            raise
+    # An IFD or a value is beyond the first prefix
+    return parse_tiff_tags(data + stream.read(MAX_HEADER_OFFSET - len(data)))
+
+
+def _jpeg_exif_segment(stream):
+    """The TIFF data in the APP1 segment of a JPEG file (after the SOI marker),
+    or None if the file has no EXIF segment"""
+    while stream.tell() < MAX_HEADER_OFFSET:
+        header = stream.read(4)
+        if len(header) < 4 or header[0] != 0xFF:
+            raise ValueError("Invalid JPEG segment")
+
+        marker = header[1]
+        if marker in (0xD9, 0xDA):
+            # End of image, or start of the compressed data
+            return None
+
+        (length,) = struct.unpack(">H", header[2:])
+        if marker == 0xE1:
+            payload = stream.read(length - 2)
+            if payload.startswith(b"Exif\x00\x00"):
+                return payload[6:]
+        else:
+            stream.seek(length - 2, 1)
+
+    raise ValueError("No EXIF segment in the JPEG header")
+
+
+def parse_tiff_tags(data, tags=None):
+    """The values of the given ASCII tags (default: the date tags) in IFD0 and the Exif IFD of a TIFF structure.
+    Raises a ValueError if the data is not a valid TIFF structure."""
+    if tags is None:
+        tags = {tag for pair in DATE_TAGS for tag in pair}
+
+    byte_order = data[:2]
+    if byte_order == b"II":
+        endian = "<"
+    elif byte_order == b"MM":
+        endian = ">"
+    else:
+        raise ValueError("Invalid TIFF byte order")
+
+    magic, offset = _unpack(endian + "HI", data, 2)
+    if magic != 42:
+        raise ValueError("Invalid TIFF header")
+
+    values = {}
+    exif_offset = _parse_ifd(data, offset, endian, tags, values)
+    if exif_offset:
+        _parse_ifd(data, exif_offset, endian, tags, values)
+    return values
+
+
+def _parse_ifd(data, offset, endian, tags, values):
+    """Add the ASCII values of the given tags to values, and return the offset of the Exif IFD (if any)"""
+    (count,) = _unpack(endian + "H", data, offset)
+    exif_offset = None
+    for entry in range(offset + 2, offset + 2 + 12 * count, 12):
+        tag, typ, length, value = _unpack(endian + "HHI4s", data, entry)
+        if tag == EXIF_IFD_POINTER and typ == LONG:
+            (exif_offset,) = struct.unpack(endian + "I", value)
+        elif tag in tags and typ == ASCII:
+            if length > 4:
+                (start,) = struct.unpack(endian + "I", value)
+                value = data[start : start + length]
+                if len(value) < length:
+                    raise ValueError("TIFF value out of bounds")
+            values[tag] = value[:length].split(b"\x00", 1)[0].decode("ascii").strip()
+    return exif_offset
+
+
+def _unpack(fmt, data, offset):
+    try:
+        return struct.unpack_from(fmt, data, offset)
+    except struct.error as err:
+        raise ValueError("Truncated TIFF structure") from err
@@ -0,0 +1,28 @@
+"""Open the files whose metadata or content is read. The files can be members of an open
+archive, see archive.Archive"""
+
+import io
+import os
+
+# The archives that are open, by path
+OPEN_ARCHIVES = {}
+
+
+def open_path(filename):
+    """Open the file, or the archive member, in binary mode"""
+    for path, archive in OPEN_ARCHIVES.items():
+        if filename.startswith(path) and filename[len(path) : len(path) + 1] == os.sep:
+            return archive.open(filename[len(path) + 1 :])
+    return open(filename, "rb")
+
+
+def stream_size(stream):
+    """The size of a file, or of an archive member, open in binary mode"""
+    try:
+        return os.fstat(stream.fileno()).st_size
+    except (OSError, ValueError, io.UnsupportedOperation):
+        # The end of the stream is found without reading it
+        position = stream.tell()
+        size = stream.seek(0, io.SEEK_END)
+        stream.seek(position)
+        return size
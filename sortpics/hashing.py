@@ -0,0 +1,113 @@
+"""Find the files with identical content among the files that have the same target.
+
+The files are compared in stages: by size, then with a hash of their first and last
+64 KB, and then with a hash of the full content, only for the files that still match."""
+
+import os
+import hashlib
+from .parallel import imap
+from .fileio import open_path, stream_size
+
+# The number of bytes read at each end of a file for the partial hash
+PARTIAL_HASH_BYTES = 64 * 1024
+CHUNK_SIZE = 1024 * 1024
+
+
+def partial_hash(filename):
+    """A hash of the first and last PARTIAL_HASH_BYTES of the file"""
+    digest = hashlib.blake2b()
+    with open_path(filename) as stream:
+        digest.update(stream.read(PARTIAL_HASH_BYTES))
+        size = stream_size(stream)
+        if size > PARTIAL_HASH_BYTES:
+            stream.seek(max(PARTIAL_HASH_BYTES, size - PARTIAL_HASH_BYTES))
+            digest.update(stream.read(PARTIAL_HASH_BYTES))
+    return digest.hexdigest()
+
+
+def full_hash(filename):
+    """A hash of the full content of the file"""
+    digest = hashlib.blake2b()
+    with open_path(filename) as stream:
+        for chunk in iter(lambda: stream.read(CHUNK_SIZE), b""):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+HASHES = {"partial": partial_hash, "full": full_hash}
+
+
+def identical_files(groups, folder="", cache=None, jobs=1):
+    """Return {index: key} for the files that have the same content as another file in their group.
+
+    :param groups: a list of groups of (filename, size, index). Files in different groups are not compared.
+    :param cache: an optional MetadataCache, where the hashes are stored
+    :param jobs: the number of threads used to compute the hashes
+    """
+    # Only the files that have the same size as another file in the group are hashed
+    candidates = _split(groups, lambda filename, size, i: size)
+
+    digests = _hashes("partial", _flatten(candidates), folder, cache, jobs)
+    candidates = _split(candidates, lambda filename, size, i: digests[i])
+
+    # The partial hash covers the smaller files entirely
+    large_files = [
+        file for file in _flatten(candidates) if file[1] > 2 * PARTIAL_HASH_BYTES
+    ]
+    digests.update(_hashes("full", large_files, folder, cache, jobs))
+    candidates = _split(candidates, lambda filename, size, i: digests[i])
+
+    keys = {}
+    for subgroup in candidates:
+        key = min(i for _, _, i in subgroup)
+        for _, _, i in subgroup:
+            keys[i] = key
+    return keys
+
+
+def _split(groups, key):
+    """Split the groups of (filename, size, index) by key, and keep the subgroups with at least two files"""
+    subgroups = []
+    for group in groups:
+        by_key = {}
+        for file in group:
+            by_key.setdefault(key(*file), []).append(file)
+        subgroups.extend(subgroup for subgroup in by_key.values() if len(subgroup) > 1)
+    return subgroups
+
+
+def _flatten(groups):
+    return [file for group in groups for file in group]
+
+
+def _hashes(kind, files, folder, cache, jobs):
+    """The {index: hash} for the given (filename, size, index), read from the cache when possible"""
+    digests = {}
+    stats = {}
+    to_be_hashed = []
+    for filename, _, i in files:
+        if cache is not None:
+            stat = os.stat(os.path.join(folder, filename))
+            try:
+                digests[i] = cache.lookup_hash(filename, stat, kind)
+                continue
+            except KeyError:
+                stats[i] = stat
+        to_be_hashed.append((filename, i))
+
+    if not to_be_hashed:
+        return digests
+
+    for (filename, i), digest in zip(
+        to_be_hashed,
+        imap(
+            HASHES[kind],
+            [os.path.join(folder, filename) for filename, _ in to_be_hashed],
+            jobs=jobs,
+            executor="thread",
+        ),
+    ):
+        digests[i] = digest
+        if cache is not None:
+            cache.store_hash(filename, stats[i], kind, digest)
+    return digests
@@ -0,0 +1,221 @@
+"""A minimal reader for the creation time of ISO base media files (MP4, MOV, 3GP...),
+and for the Exif item of HEIF images (HEIC, AVIF...)
+
+Only the box headers are read on the way to moov/mvhd, or to meta/iinf and meta/iloc,
+so the cost does not depend on the size of the file, nor on the position of the boxes.
+"""
+
+import struct
+from datetime import datetime, timedelta
+from .stats import open_counted
+from .fileio import stream_size
+
+ISOBMFF_EXTENSIONS = (".mp4", ".m4v", ".mov", ".qt", ".3gp", ".3g2")
+HEIF_EXTENSIONS = (".heic", ".heif", ".hif", ".avif")
+
+# The major or compatible brands of the HEIF images
+HEIF_BRANDS = (b"heic", b"heix", b"heim", b"heis", b"hevc", b"mif1", b"msf1", b"avif")
+
+# We stop and raise a ValueError after reading that many bytes
+MAX_BYTES_READ = 64 * 1024
+# At most that many bytes of the Exif item of a HEIF image are read
+MAX_EXIF_BYTES = 64 * 1024
+
+MAC_EPOCH = datetime(1904, 1, 1)
+
+# The boxes that we accept at the beginning of the file
+_FIRST_BOXES = (b"ftyp", b"moov", b"mdat", b"free", b"skip", b"wide", b"pnot")
+
+
+def read_mvhd_creation_time(filename):
+    """The creation time in the moov/mvhd box, or None if it is not set.
+    Raises a ValueError if the file is not an ISO base media file."""
+    with open_counted(filename) as stream:
+        reader = _BoxReader(stream, stream_size(stream))
+        moov = reader.find_box(b"moov", 0, reader.file_size, top_level=True)
+        if moov is None:
+            raise ValueError(f"No moov box in {filename}")
+
+        mvhd = reader.find_box(b"mvhd", *moov)
+        if mvhd is None:
+            raise ValueError(f"No mvhd box in {filename}")
+
+        start, end = mvhd
+        header = reader.read(start, min(end - start, 20))
+
+    version = header[0] if header else None
+    if len(header) < (12 if version == 1 else 8):
+        raise ValueError(f"Truncated mvhd box in {filename}")
+    if version == 1:
+        (seconds,) = struct.unpack_from(">Q", header, 4)
+    else:
+        (seconds,) = struct.unpack_from(">I", header, 4)
+
+    if seconds == 0:
+        return None
+
+    # The creation time is in seconds since 1904-01-01 UTC
+    return MAC_EPOCH + timedelta(seconds=seconds)
+
+
+class _BoxReader:
+    """Read box headers with a cap on the number of bytes read"""
+
+    def __init__(self, stream, file_size, max_bytes=MAX_BYTES_READ):
+        self.stream = stream
+        self.file_size = file_size
+        self.max_bytes = max_bytes
+        self.bytes_read = 0
+
+    def read(self, offset, size):
+        """Read size bytes at the given offset"""
+        if offset < 0 or size < 0 or offset + size > self.file_size:
+            raise ValueError("Truncated box")
+        self.bytes_read += size
+        if self.bytes_read > self.max_bytes:
+            raise ValueError(f"Too many bytes read (more than {self.max_bytes})")
+        self.stream.seek(offset)
+        data = self.stream.read(size)
+        if len(data) < size:
+            raise ValueError("Truncated box")
+        return data
+
+    def find_box(self, box_type, start, end, top_level=False):
+        """The (start, end) offsets of the payload of the first box of the given type"""
+        offset = start
+        while offset + 8 <= end:
+            size, current_type = struct.unpack(">I4s", self.read(offset, 8))
+            header_size = 8
+            if size == 1:
+                (size,) = struct.unpack(">Q", self.read(offset + 8, 8))
+                header_size = 16
+            elif size == 0:
+                size = end - offset
+
+            if size < header_size or not _is_box_type(current_type):
+                raise ValueError(f"Invalid box {current_type!r} at offset {offset}")
+            if top_level and offset == start and current_type not in _FIRST_BOXES:
+                raise ValueError("Not an ISO base media file")
+
+            if current_type == box_type:
+                return offset + header_size, min(offset + size, end)
+            offset += size
+
+        return None
+
+
+def is_heif(header):
+    """Do the first 12 bytes of a file start a ftyp box with a HEIF brand?"""
+    return header[4:8] == b"ftyp" and header[8:12] in HEIF_BRANDS
+
+
+def read_heif_exif(stream):
+    """The TIFF structure in the Exif item of a HEIF image, or None if the image has no Exif item.
+    Raises a ValueError if the stream is not a HEIF image."""
+    reader = _BoxReader(stream, stream_size(stream), MAX_BYTES_READ + MAX_EXIF_BYTES)
+    meta = reader.find_box(b"meta", 0, reader.file_size, top_level=True)
+    if meta is None:
+        raise ValueError("No meta box in the HEIF image")
+
+    # The meta box is a full box: its children start after the version and flags
+    start, end = meta[0] + 4, meta[1]
+    iinf = reader.find_box(b"iinf", start, end)
+    iloc = reader.find_box(b"iloc", start, end)
+    if iinf is None or iloc is None:
+        raise ValueError("No iinf or iloc box in the HEIF image")
+
+    item_id = _exif_item_id(reader, *iinf)
+    if item_id is None:
+        return None
+
+    construction_method, extents = _item_extents(reader, *iloc, item_id)
+    if construction_method == 1:
+        # The offsets are relative to the idat box of the meta box
+        idat = reader.find_box(b"idat", start, end)
+        if idat is None:
+            raise ValueError("No idat box in the HEIF image")
+        extents = [(idat[0] + offset, length) for offset, length in extents]
+    elif construction_method != 0:
+        raise ValueError(f"Unsupported construction method {construction_method}")
+
+    payload = b"".join(
+        reader.read(offset, min(length, MAX_EXIF_BYTES)) for offset, length in extents
+    )
+    # The payload starts with the offset of the TIFF header, which usually follows 'Exif\0\0'
+    if len(payload) < 4:
+        raise ValueError("Truncated Exif item")
+    (tiff_offset,) = struct.unpack_from(">I", payload)
+    return payload[4 + tiff_offset :]
+
+
+def _exif_item_id(reader, start, end):
+    """The id of the first item of type Exif in the iinf box, or None"""
+    data = reader.read(start, end - start)
+    (version,) = _unpack(">B", data, 0)
+    offset = 6 if version == 0 else 8
+    while offset + 8 <= len(data):
+        size, box_type = _unpack(">I4s", data, offset)
+        if size < 8:
+            raise ValueError("Invalid infe box")
+        if box_type == b"infe":
+            (infe_version,) = _unpack(">B", data, offset + 8)
+            # item_ID, item_protection_index and item_type in infe boxes of version 2 or 3
+            if infe_version >= 2:
+                item_id, _, item_type = _unpack(
+                    ">HH4s" if infe_version == 2 else ">IH4s", data, offset + 12
+                )
+                if item_type == b"Exif":
+                    return item_id
+        offset += size
+    return None
+
+
+def _item_extents(reader, start, end, item_id):
+    """The construction method and the (offset, length) extents of the item in the iloc box"""
+    data = reader.read(start, end - start)
+    version, sizes, base_offset_and_index_sizes = _unpack(">B3xBB", data, 0)
+    offset_size, length_size = sizes >> 4, sizes & 15
+    base_offset_size, index_size = (
+        base_offset_and_index_sizes >> 4,
+        base_offset_and_index_sizes & 15,
+    )
+    if version not in (1, 2):
+        index_size = 0
+
+    position = 6
+
+    def read_uint(size):
+        nonlocal position
+        if position + size > len(data):
+            raise ValueError("Truncated iloc box")
+        value = int.from_bytes(data[position : position + size], "big")
+        position += size
+        return value
+
+    item_count = read_uint(4 if version == 2 else 2)
+    for _ in range(item_count):
+        current_id = read_uint(4 if version == 2 else 2)
+        construction_method = read_uint(2) & 15 if version in (1, 2) else 0
+        read_uint(2)  # data_reference_index
+        base_offset = read_uint(base_offset_size)
+        extents = []
+        for _ in range(read_uint(2)):
+            read_uint(index_size)
+            extent_offset = read_uint(offset_size)
+            extents.append((base_offset + extent_offset, read_uint(length_size)))
+        if current_id == item_id:
+            return construction_method, extents
+
+    raise ValueError(f"The item {item_id} is not in the iloc box")
+
+
+def _unpack(fmt, data, offset):
+    try:
+        return struct.unpack_from(fmt, data, offset)
+    except struct.error as err:
+        raise ValueError("Truncated box") from err
+
+
+def _is_box_type(box_type):
+    """Box types are made of printable characters, or of the copyright sign"""
+    return all(32 <= char < 127 or char == 0xA9 for char in box_type)
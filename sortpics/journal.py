@@ -0,0 +1,264 @@
+"""An append-only journal of the moves of a --no-test run, that makes the run resumable.
+The plans written by 'sortpics plan' are journals with no completed move.
+
+The journal is a JSON lines file. The first line is a header, then comes one line per planned
+move, and then a line that closes the plan. The plan is synced to disk before any file is moved.
+Then, a {"done": index} line is appended after each completed move. These lines are synced
+to disk in batches."""
+
+import os
+import json
+import time
+import logging
+from .scan import FileEntry
+from .transfer import transfer
+
+LOGGER = logging.getLogger(__name__)
+
+JOURNAL_PREFIX = ".sortpics_journal_"
+
+
+class Journal:
+    """The planned and the completed moves of a sortpics run"""
+
+    def __init__(
+        self,
+        path,
+        folder,
+        moves,
+        done=(),
+        created=None,
+        sync_every=256,
+        sync_interval=1.0,
+        mode="move",
+    ):
+        self.path = path
+        self.folder = folder
+        self.created = created
+        # How the files are moved, see transfer
+        self.mode = mode
+        # The planned moves, as (source FileEntry, target, batch). The moves in batch 1
+        # go to a target that is freed by a move in batch 0
+        self.moves = moves
+        self.done = list(done)
+        self.sync_every = sync_every
+        self.sync_interval = sync_interval
+        self._index = {entry.path: i for i, (entry, _, _) in enumerate(moves)}
+        self._stream = None
+        self._unsynced = 0
+        self._last_sync = time.monotonic()
+
+    @classmethod
+    def create(cls, path, folder, moves, created=None, **kwargs):
+        """Write the plan to a new journal, sync it to disk, and return the journal"""
+        journal = cls(path, os.path.abspath(folder), moves, created=created, **kwargs)
+        journal._stream = open(path, "x")
+        journal._write(
+            {
+                "sortpics_journal": 1,
+                "folder": journal.folder,
+                "created": created,
+                "mode": journal.mode,
+            }
+        )
+        for entry, target, batch in moves:
+            journal._write(dict(move_record(entry, target), batch=batch))
+        journal._write({"planned": len(moves)})
+        journal.sync()
+        return journal
+
+    @classmethod
+    def open(cls, path, **kwargs):
+        """Read an existing journal, and open it to record more completed moves"""
+        with open(path) as stream:
+            header = json.loads(stream.readline())
+            if "sortpics_journal" not in header:
+                raise ValueError(f"{path} is not a sortpics journal")
+
+            moves = []
+            done = []
+            planned = None
+            for line in stream:
+                try:
+                    record = json.loads(line)
+                except ValueError:
+                    # The last line may have been partially written
+                    break
+                if "done" in record:
+                    done.append(record["done"])
+                elif "planned" in record:
+                    planned = record["planned"]
+                else:
+                    entry, target = read_move_record(record)
+                    moves.append((entry, target, record.get("batch", 0)))
+
+        if planned is None or planned != len(moves):
+            raise ValueError(
+                f"The plan in {path} is incomplete. No file was moved, please run sortpics again"
+            )
+
+        journal = cls(
+            path,
+            header["folder"],
+            moves,
+            done,
+            created=header.get("created"),
+            mode=header.get("mode", "move"),
+            **kwargs,
+        )
+        journal._stream = open(path, "a")
+        return journal
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    def pending(self, batch):
+        """The (source FileEntry, target) of the moves in the batch that are not done yet"""
+        done = set(self.done)
+        return [
+            (entry, target)
+            for i, (entry, target, move_batch) in enumerate(self.moves)
+            if move_batch == batch and i not in done
+        ]
+
+    def completed(self):
+        """The (source, target) of the completed moves, in the order in which they were done"""
+        return [(self.moves[i][0].path, self.moves[i][1]) for i in self.done]
+
+    def mark_done(self, source):
+        """Record that the file was moved"""
+        i = self._index[source]
+        self.done.append(i)
+        self._write({"done": i})
+        self._unsynced += 1
+        if (
+            self._unsynced >= self.sync_every
+            or time.monotonic() - self._last_sync >= self.sync_interval
+        ):
+            self.sync()
+
+    def sync(self):
+        """Flush the journal and sync it to disk"""
+        self._stream.flush()
+        os.fsync(self._stream.fileno())
+        self._unsynced = 0
+        self._last_sync = time.monotonic()
+
+    def close(self):
+        """Sync and close the journal"""
+        if self._stream is not None and not self._stream.closed:
+            self.sync()
+            self._stream.close()
+
+    def _write(self, record):
+        self._stream.write(json.dumps(record) + "\n")
+
+
+def apply(journal, jobs=1, on_move=None, check=False):
+    """Do the pending moves in the journal, and mark them as done. With check=True, the moves
+    that were done but not marked are marked, and the files that have changed are not moved.
+    Return the number of files moved."""
+    moved = 0
+    for batch in (0, 1):
+        moves = []
+        for entry, target in journal.pending(batch):
+            if check:
+                state = _state(journal.folder, entry, target, journal.mode)
+                if state == "done":
+                    _done(journal, on_move, entry.path, target)
+                    continue
+                if state != "pending":
+                    LOGGER.warning("# %s: %s was not moved", state, entry.path)
+                    continue
+            moves.append((entry.path, target))
+
+        moved += transfer(
+            journal.folder,
+            moves,
+            # The moves in batch 1 are done in order
+            jobs=jobs if batch == 0 else 1,
+            on_move=lambda source, target: _done(journal, on_move, source, target),
+            mode=journal.mode,
+        )
+    return moved
+
+
+def reconcile(journal):
+    """Mark the moves that were done but not marked, e.g. the moves that were in flight when
+    the run was interrupted. Return the number of moves marked."""
+    marked = 0
+    for batch in (0, 1):
+        for entry, target in journal.pending(batch):
+            if _state(journal.folder, entry, target, journal.mode) == "done":
+                journal.mark_done(entry.path)
+                marked += 1
+    return marked
+
+
+def _done(journal, on_move, source, target):
+    journal.mark_done(source)
+    if on_move is not None:
+        on_move(source, target)
+
+
+def _state(folder, entry, target, mode="move"):
+    """Is the move 'pending', 'done', or is the source file 'missing' or 'changed'?
+
+    The files are compared by size and mtime: the inodes change when a file is copied
+    across devices, or when the plan was made on a replica of the folder. With the modes
+    that keep the source, the move is done when the target matches the source."""
+    try:
+        stat = os.stat(os.path.join(folder, entry.path))
+    except FileNotFoundError:
+        try:
+            stat = os.stat(os.path.join(folder, target))
+        except FileNotFoundError:
+            return "missing"
+        if _fingerprint(stat) == _fingerprint(entry):
+            return "done"
+        return "missing"
+
+    if _fingerprint(stat) != _fingerprint(entry):
+        return "changed"
+    if mode != "move":
+        try:
+            if _fingerprint(os.stat(os.path.join(folder, target))) == _fingerprint(
+                entry
+            ):
+                return "done"
+        except FileNotFoundError:
+            pass
+    return "pending"
+
+
+def _fingerprint(stat):
+    return stat.st_size, stat.st_mtime_ns
+
+
+def move_record(entry, target):
+    """A JSON record for the move of the file with the given FileEntry or stat result to target"""
+    return {
+        "source": entry.path,
+        "target": target,
+        "size": entry.st_size,
+        "mtime_ns": entry.st_mtime_ns,
+        "inode": entry.st_ino,
+        "device": entry.st_dev,
+    }
+
+
+def read_move_record(record):
+    """The (source FileEntry, target) in a record written by move_record"""
+    return (
+        FileEntry(
+            record["source"],
+            record["size"],
+            record["mtime_ns"],
+            record["inode"],
+            record["device"],
+        ),
+        record["target"],
+    )
@@ -0,0 +1,154 @@
+"""A manifest of the files that were already processed, for the incremental mode"""
+
+import os
+import json
+import sqlite3
+from .scan import FileEntry
+
+MANIFEST_NAME = ".sortpics_manifest.db"
+
+
+class Manifest:
+    """The files and sub-folders of each folder, as seen by the last sortpics run.
+
+    The changes are only written to disk by commit, i.e. after the files have been moved.
+    """
+
+    def __init__(self, path):
+        self.connection = sqlite3.connect(path)
+        self.connection.execute(
+            "CREATE TABLE IF NOT EXISTS folders "
+            "(path TEXT PRIMARY KEY, mtime_ns INTEGER, subfolders TEXT)"
+        )
+        self.connection.execute(
+            "CREATE TABLE IF NOT EXISTS files (path TEXT PRIMARY KEY, folder TEXT, "
+            "size INTEGER, mtime_ns INTEGER, inode INTEGER, device INTEGER)"
+        )
+        self.connection.execute(
+            "CREATE INDEX IF NOT EXISTS files_folder ON files (folder)"
+        )
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    def subfolders(self, folder, mtime_ns):
+        """The sub-folders of the given folder, or None if the folder has changed since the last run"""
+        row = self.connection.execute(
+            "SELECT mtime_ns, subfolders FROM folders WHERE path = ?", (folder,)
+        ).fetchone()
+        if row is None or row[0] != mtime_ns:
+            return None
+        return json.loads(row[1])
+
+    def known_files(self, folder):
+        """The (size, mtime_ns) of the files in the given folder, by name"""
+        return {
+            os.path.basename(path): (size, mtime_ns)
+            for path, size, mtime_ns in self.connection.execute(
+                "SELECT path, size, mtime_ns FROM files WHERE folder = ?", (folder,)
+            )
+        }
+
+    def update_folder(self, folder, mtime_ns, subfolders, entries):
+        """Record the current content of a folder"""
+        for subfolder in self._removed_subfolders(folder, subfolders):
+            self.connection.execute("DELETE FROM folders WHERE path = ?", (subfolder,))
+            self.connection.execute("DELETE FROM files WHERE folder = ?", (subfolder,))
+        self.connection.execute(
+            "INSERT OR REPLACE INTO folders VALUES (?, ?, ?)",
+            (folder, mtime_ns, json.dumps(subfolders)),
+        )
+        self.connection.execute("DELETE FROM files WHERE folder = ?", (folder,))
+        self.connection.executemany(
+            "INSERT OR REPLACE INTO files VALUES (?, ?, ?, ?, ?, ?)",
+            (_row(folder, entry) for entry in entries),
+        )
+
+    def entries(self, folders):
+        """The FileEntry records of the files in the given folders"""
+        entries = []
+        for folder in folders:
+            for path, size, mtime_ns, inode, device in self.connection.execute(
+                "SELECT path, size, mtime_ns, inode, device FROM files WHERE folder = ?",
+                (folder,),
+            ):
+                entries.append(FileEntry(path, size, mtime_ns, inode, device))
+        return entries
+
+    def entry(self, path):
+        """The FileEntry record of the file at the given path, or None"""
+        row = self.connection.execute(
+            "SELECT path, size, mtime_ns, inode, device FROM files WHERE path = ?",
+            (os.path.normpath(path),),
+        ).fetchone()
+        return None if row is None else FileEntry(*row)
+
+    def _removed_subfolders(self, folder, subfolders):
+        """The sub-folders of the given folder that do not exist anymore"""
+        row = self.connection.execute(
+            "SELECT subfolders FROM folders WHERE path = ?", (folder,)
+        ).fetchone()
+        if row is None:
+            return []
+        return sorted(set(json.loads(row[0])).difference(subfolders))
+
+    def record_move(self, entry, target):
+        """Record that a file was moved. The source and target folders will be scanned again on the next run."""
+        target = os.path.normpath(target)
+        self.connection.execute(
+            "DELETE FROM files WHERE path = ?", (os.path.normpath(entry.path),)
+        )
+        self.connection.execute(
+            "INSERT OR REPLACE INTO files VALUES (?, ?, ?, ?, ?, ?)",
+            (
+                target,
+                folder_of(target),
+                entry.st_size,
+                entry.st_mtime_ns,
+                entry.st_ino,
+                entry.st_dev,
+            ),
+        )
+        self.connection.executemany(
+            "UPDATE folders SET mtime_ns = NULL WHERE path = ?",
+            [
+                (folder_of(entry.path),),
+                (folder_of(target),),
+                (folder_of(folder_of(target)),),
+            ],
+        )
+
+    def forget(self, entry):
+        """Forget a file that was not moved. Its folder will be scanned again on the next run."""
+        path = os.path.normpath(entry.path)
+        self.connection.execute("DELETE FROM files WHERE path = ?", (path,))
+        self.connection.execute(
+            "UPDATE folders SET mtime_ns = NULL WHERE path = ?", (folder_of(path),)
+        )
+
+    def commit(self):
+        """Write the changes to disk"""
+        self.connection.commit()
+
+    def close(self):
+        """Close the manifest. Uncommitted changes are discarded."""
+        self.connection.close()
+
+
+def folder_of(path):
+    """The folder of a path relative to the root folder, in the form used by scan"""
+    return os.path.dirname(os.path.normpath(path)) or "."
+
+
+def _row(folder, entry):
+    return (
+        os.path.normpath(entry.path),
+        folder,
+        entry.st_size,
+        entry.st_mtime_ns,
+        entry.st_ino,
+        entry.st_dev,
+    )
@@ -0,0 +1,181 @@
+"""Move the files to their targets, and write the scripts that do and reverse the moves.
+These functions are shared by sortpics and 'sortpics watch'"""
+
+import os
+import shlex
+import logging
+from datetime import datetime
+from .transfer import transfer
+from .scan import FileEntry
+from .journal import Journal, apply
+from .table import FileTable
+from .takeout import SIDECAR_EXTENSION
+
+LOGGER = logging.getLogger(__name__)
+
+try:
+    shlex.join([])
+except AttributeError:
+    shlex.join = lambda args: " ".join(shlex.quote(arg) for arg in args)
+
+
+def move(
+    folder,
+    filenames,
+    targets,
+    test=True,
+    entries=None,
+    on_move=None,
+    jobs=1,
+    journal=None,
+    plan_only=False,
+    script=None,
+    undo=None,
+    mode="move",
+):
+    """A function that moves the given filenames to their targets.
+
+    When the FileEntry records of the folder are given, they tell which targets already exist,
+    and no further stat call is made in test mode. The function on_move(filename, target) is
+    called after each move. The moves are done by transfer, with jobs threads. When a journal
+    path is given, the planned moves are written to that journal before any file is moved.
+    The script and undo commands are appended to the given script and undo objects, e.g.
+    a ScriptWriter, or to new lists. Outside of test mode, an undo command is appended only
+    once its move is done. With mode='hardlink', 'reflink' or 'copy', the files
+    are linked, cloned or copied to their targets, and the source files are kept.
+    """
+    if undo is None:
+        undo = []
+    if script is None:
+        script = []
+    undo.append(shlex.join(["cd", folder]))
+    script.append(shlex.join(["cd", folder]))
+
+    mkdirs = set()
+    index = None
+    if isinstance(entries, FileTable):
+        index = entries.index()
+    elif entries is not None:
+        index = {os.path.normpath(entry.path): entry for entry in entries}
+
+    # The state of the files after the planned moves (None for the files moved away)
+    planned = {}
+    moves = []
+    # Moves to a target that an earlier move frees up
+    deferred = []
+
+    for filename, target in sorted(zip(filenames, targets)):
+        if target is None:
+            continue
+
+        target_key = os.path.normpath(target)
+        if target_key in planned:
+            target_stat = planned[target_key]
+        else:
+            target_stat = _stat(folder, target, index)
+        if target_stat is not None:
+            if os.path.samestat(_stat(folder, filename, index), target_stat):
+                continue
+
+            LOGGER.warning("# Target exists: %s", shlex.join(["mv", filename, target]))
+            continue
+
+        new_dir = os.path.dirname(target)
+        if new_dir and new_dir not in mkdirs:
+            script.append(shlex.join(["mkdir", "-p", new_dir]))
+            mkdirs.add(new_dir)
+
+        cmd = shlex.join(MODE_COMMANDS[mode] + [filename, target])
+        script.append(cmd)
+        print(cmd)
+
+        if test:
+            undo.append(undo_command(mode, filename, target))
+        else:
+            source = FileEntry.from_stat(filename, _stat(folder, filename, index))
+            (deferred if target_key in planned else moves).append((source, target))
+            planned[target_key] = source
+            if mode == "move":
+                planned[os.path.normpath(filename)] = None
+
+    def done(source, target):
+        undo.append(undo_command(mode, source, target))
+        if on_move is not None:
+            on_move(source, target)
+
+    if not test and journal is not None:
+        planned_moves = [(source, target, 0) for source, target in moves] + [
+            (source, target, 1) for source, target in deferred
+        ]
+        if planned_moves or plan_only:
+            with Journal.create(
+                journal,
+                folder,
+                planned_moves,
+                created=datetime.now().isoformat(),
+                mode=mode,
+            ) as log:
+                if not plan_only:
+                    apply(log, jobs=jobs, on_move=done)
+    elif not test:
+        moves = [(source.path, target) for source, target in moves]
+        transfer(folder, moves, jobs=jobs, on_move=done, mode=mode)
+        deferred = [(source.path, target) for source, target in deferred]
+        transfer(folder, deferred, on_move=done, mode=mode)
+
+    return script, undo
+
+
+def _stat(folder, path, index=None):
+    """The FileEntry record, or the os.stat result for the given path, or None if the file does not exist"""
+    if index is not None:
+        return index.get(os.path.normpath(path))
+    try:
+        return os.stat(os.path.join(folder, path))
+    except FileNotFoundError:
+        return None
+
+
+# The command that moves, links, clones or copies a file in the scripts, for each mode
+MODE_COMMANDS = {
+    "move": ["mv"],
+    "hardlink": ["ln"],
+    "reflink": ["cp", "-p", "--reflink=auto"],
+    "copy": ["cp", "-p"],
+}
+
+
+def undo_command(mode, source, target):
+    """The command that reverses the move of source to target"""
+    if mode == "move":
+        return shlex.join(["mv", target, source])
+    return shlex.join(["rm", target])
+
+
+class ScriptWriter:
+    """Write the commands of a script as they are appended, rather than keeping them in memory"""
+
+    def __init__(self, stream=None):
+        self.stream = stream
+
+    def append(self, command):
+        if self.stream is not None:
+            self.stream.write(command + "\n")
+
+
+def date_subfolder(target, subfolder="%Y-%m"):
+    """The date subfolder, e.g. 2020-05, for a normalized file name"""
+    return datetime.strptime(target[:10], "%Y-%m-%d").strftime(subfolder)
+
+
+def sidecar_targets(filenames, targets, pairs):
+    """Give the Takeout sidecars the target of their media file, in place, for the
+    {media file: sidecar} pairs of a TakeoutSidecars"""
+    if not pairs:
+        return
+    rows = set(pairs).union(pairs.values())
+    rows = {filename: i for i, filename in enumerate(filenames) if filename in rows}
+    for media, sidecar in pairs.items():
+        target = targets[rows[media]]
+        if target is not None and sidecar in rows:
+            targets[rows[sidecar]] = target + SIDECAR_EXTENSION
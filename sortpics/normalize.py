@@ -1,11 +1,21 @@
 """Normalize file names using their creation date"""
 
 import os
+from array import array
 from itertools import groupby
+from collections import deque
 from datetime import timedelta
-from tqdm import tqdm
-from .timestamp import creation_date
+from functools import partial
+from .timestamp import creation_date, media_creation_date, best_creation_date
 from .tags import parse_tags
+from .parallel import imap
+from .scan import FileEntry
+from .stats import collect, timed
+from .hashing import identical_files
+from .table import NO_DATE, to_microseconds, from_microseconds, _DatetimeColumn
+
+# A marker for the files that are not in the cache
+_MISSING = object()
 
 
 def normalize_filename(filename, date, millisecond=False):
@@ -29,33 +39,35 @@ def normalize_filename(filename, date, millisecond=False):
     return formatted_date + ext
 
 
-def normalize_filenames(filenames, folder=""):
-    """
-    Return normalized filenames in the form YYYY-MM-DD h.m.s[.ms] [tag].ext
-
-    :param filenames: an enumerable with file names
-    :return: a list with the target file names (may contain duplicates).
-    """
-
-    filenames = list(filenames)
-    progress_bar = tqdm(filenames)
-    datetimes = []
-    for filename in progress_bar:
-        progress_bar.set_postfix_str(filename)
-        datetimes.append(creation_date(os.path.join(folder, filename)))
+# The extensions of the still images of animated (live) photos, by order of preference
+LIVE_PHOTO_EXTENSIONS = (".jpg", ".heic", ".jpeg")
 
-    # Use same datetimes for animated images
-    for i, filename in enumerate(filenames):
-        if not filename.endswith((".MOV", ".mov")):
-            continue
 
+def live_photo_pairs(filenames):
+    """
+    Yield the pairs (i, j) where filenames[i] is a .MOV movie, and filenames[j] is the
+    still image with the same name, e.g. IMG_1555.MOV and IMG_1555.JPG
+    """
+    stills = {}
+    for j, filename in enumerate(filenames):
         name, ext = os.path.splitext(filename)
-        jpg_ext = ".JPG" if ext == ".MOV" else ".jpg"
         try:
-            j = filenames.index(name + jpg_ext)
+            preference = LIVE_PHOTO_EXTENSIONS.index(ext.lower())
         except ValueError:
             continue
+        if name not in stills or preference < stills[name][0]:
+            stills[name] = preference, j
+
+    for i, filename in enumerate(filenames):
+        name, ext = os.path.splitext(filename)
+        if ext.lower() == ".mov" and name in stills:
+            yield i, stills[name][1]
+
 
+def align_live_photo_dates(filenames, datetimes):
+    """Give the movie of each live photo the datetime of its still image, in place,
+    unless the two datetimes are more than 14 hours apart"""
+    for i, j in live_photo_pairs(filenames):
         dt_jpg = datetimes[j]
         dt_mov = datetimes[i]
         if dt_jpg is None or dt_mov is None:
@@ -66,25 +78,231 @@ def normalize_filenames(filenames, folder=""):
             continue
         datetimes[i] = dt_jpg
 
-    # Show the millisecond resolution only if necessary
-    same_second_datetimes = {}
-    for datetime in datetimes:
-        if datetime is None:
-            continue
-        time_sec = datetime.replace(microsecond=0)
-        same_second_datetimes.setdefault(time_sec, set()).add(datetime)
+
+def iter_creation_dates(
+    filenames,
+    folder="",
+    jobs=1,
+    executor="thread",
+    cache=None,
+    stats=None,
+    jobs_per_mount=None,
+    sidecars=None,
+    progress=True,
+    path_policy=None,
+):
+    """
+    Yield the pairs (file, creation date) for the given files, in the same order.
+
+    The file names are consumed lazily, so the extraction starts while the folder is still being walked.
+
+    :param filenames: an iterable with file names relative to folder, or with FileEntry records
+    :param jobs: the number of workers
+    :param executor: either 'serial', 'thread' (I/O bound extraction), 'process' (CPU bound),
+        or 'async' (network mounts with a high latency, see imap_creation_dates)
+    :param cache: an optional MetadataCache. Only the files that are not in the cache are parsed.
+        The cache holds the dates in the file metadata, and the dates in the path are taken
+        into account after each lookup, so that a file that was moved gets the same date
+        with and without the cache.
+    :param stats: an optional RunStats, that records the extractor calls and the slowest files
+    :param jobs_per_mount: with the 'async' executor, the maximum number of reads on each device
+    :param sidecars: an optional TakeoutSidecars. The files that have a sidecar are not parsed,
+        and the sidecars themselves have no creation date.
+    :param progress: show a progress bar
+    :param path_policy: an optional PathPolicy. The files whose name has a trusted datetime
+        are not opened.
+    """
+    # The files that were read from the input but not yielded yet, with their cached date (if any)
+    pending = deque()
+
+    def to_be_parsed():
+        for file in filenames:
+            filename = _filename(file)
+            if sidecars is not None:
+                try:
+                    timestamp = sidecars.creation_date(filename)
+                except KeyError:
+                    pass
+                else:
+                    if timestamp is not None:
+                        timestamp = best_creation_date(
+                            timestamp, os.path.join(folder, filename)
+                        )
+                        if stats is not None:
+                            stats.count("sidecar dates")
+                    pending.append((file, None, timestamp))
+                    continue
+
+            if path_policy is not None:
+                timestamp = path_policy.creation_date(filename)
+                if timestamp is not None:
+                    if stats is not None:
+                        stats.count("opens avoided")
+                    pending.append((file, None, timestamp))
+                    continue
+
+            if cache is None:
+                pending.append((file, None, _MISSING))
+                yield os.path.join(folder, filename)
+                continue
+
+            stat = (
+                file
+                if isinstance(file, FileEntry)
+                else os.stat(os.path.join(folder, filename))
+            )
+            try:
+                timestamp = best_creation_date(
+                    cache.lookup(filename, stat), os.path.join(folder, filename)
+                )
+                pending.append((file, stat, timestamp))
+                if stats is not None:
+                    stats.count("cache hits")
+            except KeyError:
+                pending.append((file, stat, _MISSING))
+                yield os.path.join(folder, filename)
+
+    from tqdm import tqdm
+
+    progress_bar = tqdm(
+        total=len(filenames) if hasattr(filenames, "__len__") else None,
+        disable=not progress,
+    )
+    if executor == "async":
+        from .aio import imap_creation_dates
+
+        results = imap_creation_dates(
+            to_be_parsed(),
+            jobs,
+            jobs_per_mount,
+            stats=stats is not None,
+            path_dates=cache is None,
+        )
+    else:
+        # With a cache, the dates in the file metadata are cached, and the path is used below
+        read = creation_date if cache is None else media_creation_date
+        func = read if stats is None else partial(collect, read)
+        results = imap(func, to_be_parsed(), jobs=jobs, executor=executor)
+    for datetime in results:
+        while pending[0][2] is not _MISSING:
+            file, _, cached = pending.popleft()
+            progress_bar.update()
+            yield file, cached
+
+        file, stat, _ = pending.popleft()
+        if stats is not None:
+            datetime, seconds, events = datetime
+            stats.record(_filename(file), seconds, events)
+            stats.count("files parsed")
+        progress_bar.set_postfix_str(_filename(file), refresh=False)
+        progress_bar.update()
+        if cache is not None:
+            cache.store(_filename(file), stat, datetime)
+            datetime = best_creation_date(
+                datetime, os.path.join(folder, _filename(file))
+            )
+        yield file, datetime
+
+    while pending:
+        file, _, cached = pending.popleft()
+        progress_bar.update()
+        yield file, cached
+    progress_bar.close()
+
+    if cache is not None:
+        cache.commit()
+
+
+def _filename(file):
+    return file.path if isinstance(file, FileEntry) else file
+
+
+def creation_dates(filenames, folder="", jobs=1, executor="thread", cache=None):
+    """Return the list of the creation dates of the given files, see iter_creation_dates"""
+    return [
+        datetime
+        for _, datetime in iter_creation_dates(
+            filenames, folder, jobs=jobs, executor=executor, cache=cache
+        )
+    ]
+
+
+def normalize_filenames(filenames, folder="", jobs=1, executor="thread", cache=None):
+    """
+    Return normalized filenames in the form YYYY-MM-DD h.m.s[.ms] [tag].ext
+
+    :param filenames: an enumerable with file names
+    :param jobs: the number of workers used to extract the creation dates
+    :param executor: the executor used when jobs > 1, see iter_creation_dates
+    :param cache: an optional MetadataCache for the creation dates
+    :return: a list with the target file names (may contain duplicates).
+    """
+    filenames = list(filenames)
+    datetimes = creation_dates(
+        filenames, folder, jobs=jobs, executor=executor, cache=cache
+    )
+    return normalize_targets(filenames, datetimes, folder)
+
+
+def normalize_targets(
+    filenames,
+    datetimes,
+    folder="",
+    sizes=None,
+    stats=None,
+    cache=None,
+    jobs=1,
+    existing=None,
+    target_path=None,
+):
+    """
+    Return the normalized filenames, given the creation dates of the files.
+
+    The datetimes of animated images are updated in place. The file sizes,
+    when known, are used to choose between duplicated targets. The time spent
+    on the duplicates is recorded in the optional RunStats. The content hashes
+    are stored in the optional MetadataCache, and computed with jobs threads.
+    The files that are already at their target are given by existing, and
+    the paths of the targets by target_path, see non_duplicate_targets.
+    """
+    # Use same datetimes for animated images
+    align_live_photo_dates(filenames, datetimes)
+
+    # Show the millisecond resolution only for the seconds with several distinct datetimes.
+    # The datetimes are sorted and grouped by second, as integers
+    timestamps = (
+        datetimes.timestamps
+        if isinstance(datetimes, _DatetimeColumn)
+        else array("q", map(to_microseconds, datetimes))
+    )
+    millisecond = bytearray(len(timestamps))
+    order = sorted(range(len(timestamps)), key=timestamps.__getitem__)
+    for _, group in groupby(
+        (i for i in order if timestamps[i] != NO_DATE),
+        key=lambda i: timestamps[i] // 1000000,
+    ):
+        group = list(group)
+        if timestamps[group[0]] != timestamps[group[-1]]:
+            for i in group:
+                millisecond[i] = 1
+    del order
 
     targets = []
-    for filename, datetime in zip(filenames, datetimes):
-        if datetime is None:
+    for i, filename in enumerate(filenames):
+        if timestamps[i] == NO_DATE:
             targets.append(None)
             continue
 
-        time_sec = datetime.replace(microsecond=0)
-        millisecond = len(same_second_datetimes[time_sec]) > 1
-        targets.append(normalize_filename(filename, datetime, millisecond))
+        targets.append(
+            normalize_filename(
+                filename, from_microseconds(timestamps[i]), millisecond[i]
+            )
+        )
 
-    return non_duplicate_targets(filenames, targets, folder)
+    with timed(stats, "duplicates"):
+        return non_duplicate_targets(
+            filenames, targets, folder, sizes, cache, jobs, existing, target_path
+        )
 
 
 def filesize(filename):
@@ -92,29 +310,145 @@ def filesize(filename):
     return os.stat(filename).st_size
 
 
-def non_duplicate_targets(filenames, targets, folder=""):
-    """When a duplicated target is identified, the corresponding targets are replaced by None, except for the largest
-    file in the group."""
+def non_duplicate_targets(
+    filenames,
+    targets,
+    folder="",
+    sizes=None,
+    cache=None,
+    jobs=1,
+    existing=None,
+    target_path=None,
+):
+    """When files have the same target, the largest file keeps the target, and the other files get
+    a target with a ' (1)', ' (2)'... suffix, by decreasing size. The targets of the files that have
+    the same content as a file that comes before them are replaced by None.
 
-    reverse_mapping = sorted(
-        (target, filename)
-        for target, filename in zip(targets, filenames)
-        if target is not None
-    )
-    largest_source_per_target = {}
+    The file sizes are taken from the optional list sizes, or from the disk. The contents are
+    only compared for files that have the same size and target, or that have the same size as
+    a file at one of the suffixed targets, see identical_files.
+
+    The optional function existing(target) returns the (filename, size) of the file that is
+    already at that target, if any, e.g. in 'sortpics watch'. That file keeps its target.
+    So does a file that is already at its target, i.e. whose filename is target_path(target),
+    or the target itself when target_path is None.
+    """
 
-    for target, group in groupby(reverse_mapping, lambda pair: pair[0]):
-        filename_list = [filename for _, filename in group]
-        if len(filename_list) <= 1:
+    # The index of the files for each target. Lists are only created for duplicated targets
+    sources_per_target = {}
+    for i, target in enumerate(targets):
+        if target is None:
             continue
+        sources = sources_per_target.setdefault(target, i)
+        if sources == i:
+            continue
+        if isinstance(sources, int):
+            sources_per_target[target] = [sources, i]
+        else:
+            sources.append(i)
+    targets = list(targets)
+    new_targets = set()
 
-        sizes = [
-            (filesize(os.path.join(folder, filename)), filename)
-            for filename in filename_list
-        ]
-        largest_source_per_target[target] = sorted(sizes)[-1][1]
+    def is_used(candidate):
+        return (
+            candidate in new_targets
+            or candidate in sources_per_target
+            or (existing is not None and existing(candidate) is not None)
+        )
 
-    return [
-        target if filename == largest_source_per_target.get(target, filename) else None
-        for (filename, target) in zip(filenames, targets)
-    ]
+    def file_size(i):
+        return (
+            filesize(os.path.join(folder, filenames[i])) if sizes is None else sizes[i]
+        )
+
+    # The files that are not moved, but whose content is compared with that of the files
+    # of a group, have negative and unique indices
+    references = []
+
+    def reference(filename, size):
+        references.append(filename)
+        return size, filename, -len(references)
+
+    groups = {}
+    # The files at the suffixed targets ' (1)', ' (2)'... of each group
+    siblings = {}
+    for target, group in sources_per_target.items():
+        if isinstance(group, int):
+            if existing is None:
+                continue
+            found = existing(target)
+            if found is None:
+                continue
+            group = [group]
+        else:
+            found = None if existing is None else existing(target)
+
+        groups[target] = sorted(
+            ((file_size(i), filenames[i], i) for i in group), reverse=True
+        )
+        # The file that is already at the target comes first
+        path = os.path.normpath(target if target_path is None else target_path(target))
+        for position, (_, filename, _) in enumerate(groups[target]):
+            if os.path.normpath(filename) == path:
+                groups[target].insert(0, groups[target].pop(position))
+                break
+        else:
+            if found is not None:
+                groups[target].insert(0, reference(*found))
+
+        # The files that are or will be at the suffixed targets, e.g. those sorted by
+        # a previous run, are not copied there again
+        siblings[target] = []
+        name, ext = os.path.splitext(target)
+        rank = 1
+        while True:
+            candidate = f"{name} ({rank}){ext}"
+            found = None if existing is None else existing(candidate)
+            sources = sources_per_target.get(candidate, ())
+            if sources == () and found is None:
+                break
+            siblings[target].extend(
+                reference(filenames[i], file_size(i))
+                for i in ([sources] if isinstance(sources, int) else sources)
+            )
+            if found is not None:
+                siblings[target].append(reference(*found))
+            rank += 1
+
+    same_content = identical_files(
+        [
+            [(filename, size, i) for size, filename, i in group + siblings[target]]
+            for target, group in groups.items()
+        ],
+        folder,
+        cache=cache,
+        jobs=jobs,
+    )
+
+    for target, group in groups.items():
+        kept = set()
+        elsewhere = {same_content.get(i, i) for _, _, i in siblings[target]}
+        for size, filename, i in group:
+            key = same_content.get(i, i)
+            if i < 0:
+                kept.add(key)
+                continue
+            if key in kept or key in elsewhere:
+                targets[i] = None
+                continue
+            if kept:
+                targets[i] = _suffixed_target(target, len(kept), is_used)
+                new_targets.add(targets[i])
+            kept.add(key)
+
+    return targets
+
+
+def _suffixed_target(target, rank, is_used):
+    """The target with a ' (rank)' suffix, or with a larger rank if is_used(target) is true"""
+    name, ext = os.path.splitext(target)
+    while True:
+        candidate = f"{name} ({rank}){ext}"
+        if not is_used(candidate):
+            return candidate
+        rank += 1
@@ -0,0 +1,55 @@
+"""Run the metadata extraction in parallel"""
+
+from collections import deque
+from itertools import islice
+from concurrent.futures import ThreadPoolExecutor
+
+EXECUTORS = ("serial", "thread", "process")
+
+
+def _apply_chunk(func, chunk):
+    return [func(item) for item in chunk]
+
+
+def _chunks(iterable, chunksize):
+    iterator = iter(iterable)
+    while True:
+        chunk = list(islice(iterator, chunksize))
+        if not chunk:
+            return
+        yield chunk
+
+
+def imap(func, iterable, jobs=1, executor="serial", chunksize=None):
+    """Apply func to each item of the iterable, and yield the results in the input order.
+
+    Unlike Executor.map, the iterable is consumed lazily: at most a few chunks per worker
+    are in flight at any time.
+    """
+    if executor not in EXECUTORS:
+        raise ValueError(f"executor should be one of {EXECUTORS}, not {executor}")
+
+    if executor == "serial" or jobs == 1:
+        yield from map(func, iterable)
+        return
+
+    if executor == "thread":
+        pool_class = ThreadPoolExecutor
+        chunksize = chunksize or 1
+    else:
+        # multiprocessing is imported only when it is used
+        from concurrent.futures import ProcessPoolExecutor
+
+        pool_class = ProcessPoolExecutor
+        # Larger chunks amortize the inter-process communication
+        chunksize = chunksize or 16
+
+    with pool_class(max_workers=jobs) as pool:
+        pending = deque()
+        for chunk in _chunks(iterable, chunksize):
+            pending.append(pool.submit(_apply_chunk, func, chunk))
+            if len(pending) >= 4 * jobs:
+                yield from pending.popleft().result()
+
+        while pending:
+            yield from pending.popleft().result()
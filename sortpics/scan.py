@@ -0,0 +1,105 @@
+"""Walk the folder to normalize"""
+
+import os
+
+
+class FileEntry:
+    """A compact record for a file found by scan. The attribute names are those of os.stat_result,
+    so that the record can be used in place of the result of os.stat"""
+
+    __slots__ = ("path", "st_size", "st_mtime_ns", "st_ino", "st_dev")
+
+    def __init__(self, path, st_size, st_mtime_ns, st_ino, st_dev):
+        self.path = path
+        self.st_size = st_size
+        self.st_mtime_ns = st_mtime_ns
+        self.st_ino = st_ino
+        self.st_dev = st_dev
+
+    @classmethod
+    def from_stat(cls, path, stat):
+        """The record for the given path and os.stat result"""
+        return cls(path, stat.st_size, stat.st_mtime_ns, stat.st_ino, stat.st_dev)
+
+    def __repr__(self):
+        return f"FileEntry({self.path!r}, st_size={self.st_size})"
+
+
+def scan(folder, manifest=None, on_listing=None, select=None):
+    """Yield a FileEntry for each non-hidden file in the folder, as they are found.
+    Each file is stat'ed exactly once.
+
+    When a Manifest is given, the folders that have not changed since the last run are not listed,
+    only the files that are not in the manifest are yielded, and the manifest is updated.
+
+    The function on_listing(relative_root, names) is called with the non-hidden names in each
+    folder that is listed, before the files of that folder are yielded.
+
+    The files whose relative path is rejected by the optional function select(path), e.g. the
+    files of the other shards, are neither stat'ed nor yielded.
+    """
+    pending = [(folder, ".")]
+    while pending:
+        root, relative_root = pending.pop()
+        if manifest is not None:
+            try:
+                mtime_ns = os.stat(root).st_mtime_ns
+            except OSError:
+                continue
+            subfolders = manifest.subfolders(relative_root, mtime_ns)
+            if subfolders is not None:
+                pending.extend(
+                    (os.path.join(folder, subfolder), subfolder)
+                    for subfolder in reversed(subfolders)
+                )
+                continue
+            known_files = manifest.known_files(relative_root)
+
+        try:
+            with os.scandir(root) as iterator:
+                entries = sorted(iterator, key=lambda entry: entry.name)
+        except OSError:
+            continue
+        if on_listing is not None:
+            on_listing(
+                relative_root, [entry.name for entry in entries if entry.name[0] != "."]
+            )
+
+        subdirs = []
+        files = []
+        for entry in entries:
+            if entry.name[0] == ".":
+                continue
+            try:
+                if entry.is_dir():
+                    if not entry.is_symlink():
+                        subdirs.append(entry)
+                    continue
+                path = os.path.join(relative_root, entry.name)
+                if select is not None and not select(path):
+                    continue
+                stat = entry.stat()
+            except OSError:
+                continue
+            file = FileEntry.from_stat(path, stat)
+            files.append(file)
+            if manifest is not None and known_files.get(entry.name) == (
+                stat.st_size,
+                stat.st_mtime_ns,
+            ):
+                continue
+            yield file
+
+        subfolders = [_join(relative_root, entry.name) for entry in subdirs]
+        if manifest is not None:
+            manifest.update_folder(relative_root, mtime_ns, subfolders, files)
+
+        pending.extend(
+            (entry.path, subfolder)
+            for entry, subfolder in zip(reversed(subdirs), reversed(subfolders))
+        )
+
+
+def _join(relative_root, name):
+    """Like os.path.join, but the sub-folders of '.' have no './' prefix, as in os.path.relpath"""
+    return name if relative_root == "." else os.path.join(relative_root, name)
@@ -0,0 +1,131 @@
+"""Sharded runs: each worker scans one root, or one hash partition of the paths of a root,
+and writes the files and their creation dates to a partial file. The partial files of all
+the workers are then merged into a single plan, see 'sortpics merge'.
+
+A partial file is a JSON lines file. The first line is a header with the root folder and the
+shard, then comes one line per file, one line per Google Takeout sidecar with its media file,
+and a last line with the number of files."""
+
+import os
+import json
+import zlib
+from .scan import FileEntry
+from .table import FileTable, NO_DATE, from_microseconds
+
+
+def parse_shard(text):
+    """The (index, count) of a shard given as 'I/N', e.g. '0/4' for the first of four shards"""
+    try:
+        index, count = (int(value) for value in text.split("/"))
+    except ValueError:
+        raise ValueError(f"A shard should be given as I/N, e.g. 0/4, not {text!r}")
+    if not 0 <= index < count:
+        raise ValueError(
+            f"The shard index should be between 0 and {count - 1} in {text}"
+        )
+    return index, count
+
+
+def in_shard(path, shard):
+    """Is the path in the given (index, count) shard? The partition depends only on the path
+    relative to the root, so that it is the same on every host"""
+    if shard is None:
+        return True
+    index, count = shard
+    key = os.path.normpath(path).encode("utf-8", "surrogateescape")
+    return zlib.crc32(key) % count == index
+
+
+def write_partial(path, folder, table, shard=None, created=None, pairs=None):
+    """Write the files in the FileTable, found in the given folder, and the optional
+    {media file: sidecar} pairs of a TakeoutSidecars, to a partial file"""
+    with open(path, "w") as stream:
+        header = {
+            "sortpics_partial": 1,
+            "folder": os.path.abspath(folder),
+            "shard": None if shard is None else list(shard),
+            "created": created,
+        }
+        stream.write(json.dumps(header) + "\n")
+        for i in range(len(table)):
+            record = {
+                "path": table.path(i),
+                "size": table.sizes[i],
+                "mtime_ns": table.mtimes[i],
+                "inode": table.inodes[i],
+                "device": table.devices[i],
+                "date": None if table.timestamps[i] == NO_DATE else table.timestamps[i],
+            }
+            stream.write(json.dumps(record) + "\n")
+        for media, sidecar in (pairs or {}).items():
+            stream.write(json.dumps({"media": media, "sidecar": sidecar}) + "\n")
+        stream.write(json.dumps({"files": len(table)}) + "\n")
+
+
+def read_partials(paths):
+    """Read the partial files, and return a FileTable with the absolute paths of all the files,
+    the list of the root folders, and the {media file: sidecar} pairs of the Takeout sidecars,
+    with absolute paths. A ValueError is raised if a partial file is incomplete,
+    or if a shard of a root is missing"""
+    table = FileTable()
+    shards = {}
+    pairs = {}
+    for path in paths:
+        with open(path) as stream:
+            header = json.loads(stream.readline())
+            if "sortpics_partial" not in header:
+                raise ValueError(f"{path} is not a sortpics partial file")
+            folder = header["folder"]
+            count = None
+            for line in stream:
+                record = json.loads(line)
+                if "files" in record:
+                    count = record["files"]
+                    break
+                if "sidecar" in record:
+                    media = os.path.normpath(os.path.join(folder, record["media"]))
+                    pairs[media] = os.path.normpath(
+                        os.path.join(folder, record["sidecar"])
+                    )
+                    continue
+                entry = FileEntry(
+                    os.path.normpath(os.path.join(folder, record["path"])),
+                    record["size"],
+                    record["mtime_ns"],
+                    record["inode"],
+                    record["device"],
+                )
+                date = record["date"]
+                table.append(entry, None if date is None else from_microseconds(date))
+
+        if count is None:
+            raise ValueError(
+                f"{path} is incomplete, please run 'sortpics scan' on that shard again"
+            )
+
+        shard = header["shard"] or (0, 1)
+        known = shards.setdefault(folder, (shard[1], set()))
+        if known[0] != shard[1]:
+            raise ValueError(
+                f"{folder} was split in {known[0]} and in {shard[1]} shards"
+            )
+        if shard[0] in known[1]:
+            raise ValueError(
+                f"The shard {shard[0]}/{shard[1]} of {folder} is given twice"
+            )
+        known[1].add(shard[0])
+
+    for folder, (count, indices) in shards.items():
+        missing = sorted(set(range(count)) - indices)
+        if missing:
+            raise ValueError(
+                f"The shard(s) {', '.join(f'{i}/{count}' for i in missing)} of {folder} are missing"
+            )
+
+    roots = sorted(shards)
+    for parent in roots:
+        for child in roots:
+            if child.startswith(os.path.join(parent, "")):
+                raise ValueError(f"The root {child} is in the root {parent}")
+
+    return table, roots, pairs
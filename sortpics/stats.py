@@ -0,0 +1,230 @@
+"""Timings and counters for a sortpics run, enabled with --stats or --stats-json"""
+
+import io
+import json
+import time
+import heapq
+import threading
+import functools
+from contextlib import contextmanager
+from .fileio import open_path
+
+# The upper bounds of the latency histogram buckets, in milliseconds
+LATENCY_BUCKETS_MS = (0.1, 0.3, 1, 3, 10, 30, 100, 300, 1000, float("inf"))
+
+# The events of the extractors called in the current thread, when stats are collected
+_LOCAL = threading.local()
+
+
+class RunStats:
+    """The wall and CPU time per stage, the calls, failures, latencies and bytes read
+    per extractor, a few counters, and the slowest files"""
+
+    def __init__(self, slowest=10):
+        self.stages = {}
+        self.extractors = {}
+        self.counters = {}
+        self.slowest_count = slowest
+        self.slowest = []
+
+    @contextmanager
+    def stage(self, name):
+        """Time the code in the with block"""
+        wall, cpu = time.perf_counter(), time.process_time()
+        try:
+            yield
+        finally:
+            self.add_stage_time(
+                name, time.perf_counter() - wall, time.process_time() - cpu
+            )
+
+    def add_stage_time(self, name, wall, cpu=0.0):
+        """Add the given wall and CPU time to the stage"""
+        totals = self.stages.setdefault(name, [0.0, 0.0])
+        totals[0] += wall
+        totals[1] += cpu
+
+    def timed_iter(self, name, iterable):
+        """Yield the items of the iterable, and count the time spent in the iterable as a stage"""
+        iterator = iter(iterable)
+        while True:
+            with self.stage(name):
+                try:
+                    item = next(iterator)
+                except StopIteration:
+                    return
+            yield item
+
+    def count(self, name, increment=1):
+        """Increment a counter"""
+        self.counters[name] = self.counters.get(name, 0) + increment
+
+    def record(self, filename, seconds, events):
+        """Record the events returned by collect for one file"""
+        for extractor, elapsed, failed, bytes_read in events:
+            stats = self.extractors.setdefault(
+                extractor,
+                {
+                    "calls": 0,
+                    "failures": 0,
+                    "seconds": 0.0,
+                    "bytes_read": 0,
+                    "histogram": [0] * len(LATENCY_BUCKETS_MS),
+                },
+            )
+            stats["calls"] += 1
+            stats["failures"] += failed
+            stats["seconds"] += elapsed
+            stats["bytes_read"] += bytes_read
+            for i, bound in enumerate(LATENCY_BUCKETS_MS):
+                if elapsed * 1000 <= bound:
+                    stats["histogram"][i] += 1
+                    break
+
+        item = (seconds, filename)
+        if len(self.slowest) < self.slowest_count:
+            heapq.heappush(self.slowest, item)
+        elif item > self.slowest[0]:
+            heapq.heapreplace(self.slowest, item)
+
+    def to_dict(self):
+        """The stats, in a form that can be serialized to JSON"""
+        return {
+            "stages": {
+                name: {"wall_seconds": wall, "cpu_seconds": cpu}
+                for name, (wall, cpu) in self.stages.items()
+            },
+            "extractors": self.extractors,
+            "latency_buckets_ms": [
+                bound if bound != float("inf") else None for bound in LATENCY_BUCKETS_MS
+            ],
+            "counters": self.counters,
+            "slowest_files": [
+                {"filename": filename, "seconds": seconds}
+                for seconds, filename in sorted(self.slowest, reverse=True)
+            ],
+        }
+
+    def write_json(self, path):
+        """Write the stats to a JSON file"""
+        with open(path, "w") as stream:
+            json.dump(self.to_dict(), stream, indent=2)
+            stream.write("\n")
+
+    def summary(self):
+        """A human readable summary of the stats"""
+        lines = [f"# {'stage':<20} {'wall (s)':>10} {'cpu (s)':>10}"]
+        for name, (wall, cpu) in self.stages.items():
+            lines.append(f"# {name:<20} {wall:>10.3f} {cpu:>10.3f}")
+
+        if self.extractors:
+            lines.append(
+                f"# {'extractor':<20} {'calls':>10} {'failures':>10} {'mean (ms)':>10} {'MB read':>10}"
+            )
+            for name, stats in self.extractors.items():
+                mean_ms = 1000 * stats["seconds"] / stats["calls"]
+                lines.append(
+                    f"# {name:<20} {stats['calls']:>10} {stats['failures']:>10} "
+                    f"{mean_ms:>10.3f} {stats['bytes_read'] / 1e6:>10.3f}"
+                )
+
+        for name, value in self.counters.items():
+            lines.append(f"# {name}: {value}")
+
+        if self.slowest:
+            lines.append("# slowest files:")
+            for seconds, filename in sorted(self.slowest, reverse=True):
+                lines.append(f"#   {1000 * seconds:10.1f} ms  {filename}")
+        return "\n".join(lines)
+
+
+@contextmanager
+def timed(stats, name):
+    """Time the with block as a stage of stats, unless stats is None"""
+    if stats is None:
+        yield
+        return
+    with stats.stage(name):
+        yield
+
+
+def collect(func, filename):
+    """Call func(filename), and return (result, seconds, events) where events are the
+    (extractor, seconds, failed, bytes read) of the instrumented functions called by func
+    """
+    _LOCAL.events = events = []
+    start = time.perf_counter()
+    try:
+        return func(filename), time.perf_counter() - start, events
+    finally:
+        _LOCAL.events = None
+
+
+def instrumented(name):
+    """A decorator that records the calls to an extractor, when collect is active"""
+
+    def decorator(func):
+        @functools.wraps(func)
+        def wrapper(filename, *args, **kwargs):
+            events = getattr(_LOCAL, "events", None)
+            if events is None:
+                return func(filename, *args, **kwargs)
+
+            outer_bytes = getattr(_LOCAL, "bytes_read", 0)
+            _LOCAL.bytes_read = 0
+            start = time.perf_counter()
+            failed = True
+            try:
+                result = func(filename, *args, **kwargs)
+                failed = False
+                return result
+            finally:
+                elapsed = time.perf_counter() - start
+                events.append((name, elapsed, failed, _LOCAL.bytes_read))
+                _LOCAL.bytes_read += outer_bytes
+
+        return wrapper
+
+    return decorator
+
+
+def open_counted(filename):
+    """Open the file (or the archive member, see open_path) in binary mode.
+    When collect is active, the bytes read are counted."""
+    stream = open_path(filename)
+    if getattr(_LOCAL, "events", None) is None:
+        return stream
+    return _CountingReader(stream)
+
+
+class _CountingReader(io.RawIOBase):
+    """A binary file that counts the bytes read"""
+
+    def __init__(self, stream):
+        super().__init__()
+        self.stream = stream
+        self.name = stream.name
+
+    def readable(self):
+        return True
+
+    def seekable(self):
+        return True
+
+    def readinto(self, buffer):
+        size = self.stream.readinto(buffer)
+        _LOCAL.bytes_read = getattr(_LOCAL, "bytes_read", 0) + (size or 0)
+        return size
+
+    def seek(self, offset, whence=io.SEEK_SET):
+        return self.stream.seek(offset, whence)
+
+    def tell(self):
+        return self.stream.tell()
+
+    def fileno(self):
+        return self.stream.fileno()
+
+    def close(self):
+        self.stream.close()
+        super().close()
@@ -0,0 +1,161 @@
+"""A compact, columnar table of the files found by scan and of their creation dates.
+
+A list of FileEntry records and of datetime objects costs several Python objects per file.
+Here, the directories are interned, the base names are kept in a list, and the sizes, mtimes,
+inodes, devices and creation dates (in microseconds since the epoch) are stored in arrays.
+"""
+
+import os
+from array import array
+from datetime import datetime, timedelta
+from .scan import FileEntry
+
+EPOCH = datetime(1970, 1, 1)
+# The value of the timestamps column for the files without a creation date
+NO_DATE = -(2**63)
+
+
+def to_microseconds(timestamp):
+    """The microseconds since the epoch for a (naive) datetime, or NO_DATE for None"""
+    if timestamp is None:
+        return NO_DATE
+    # The time zone, if any, does not appear in the normalized names
+    delta = timestamp.replace(tzinfo=None) - EPOCH
+    return (delta.days * 86400 + delta.seconds) * 1000000 + delta.microseconds
+
+
+def from_microseconds(microseconds):
+    """The datetime for a value of the timestamps column"""
+    if microseconds == NO_DATE:
+        return None
+    return EPOCH + timedelta(microseconds=microseconds)
+
+
+class FileTable:
+    """The files of a sortpics run, with their creation dates"""
+
+    def __init__(self):
+        self.folders = []
+        self._folder_ids = {}
+        self.folder_ids = array("l")
+        self.names = []
+        self.sizes = array("q")
+        self.mtimes = array("q")
+        self.inodes = array("Q")
+        self.devices = array("Q")
+        self.timestamps = array("q")
+
+    def append(self, entry, timestamp):
+        """Add a FileEntry (or a stat result with a path attribute) and its creation date"""
+        folder, name = os.path.split(entry.path)
+        folder_id = self._folder_ids.get(folder)
+        if folder_id is None:
+            folder_id = self._folder_ids[folder] = len(self.folders)
+            self.folders.append(folder)
+        self.folder_ids.append(folder_id)
+        self.names.append(name)
+        self.sizes.append(entry.st_size)
+        self.mtimes.append(entry.st_mtime_ns)
+        self.inodes.append(entry.st_ino)
+        self.devices.append(entry.st_dev)
+        self.timestamps.append(to_microseconds(timestamp))
+
+    def __len__(self):
+        return len(self.names)
+
+    def path(self, i):
+        """The path of the i-th file, as found by scan"""
+        return os.path.join(self.folders[self.folder_ids[i]], self.names[i])
+
+    def entry(self, i):
+        """A FileEntry record for the i-th file"""
+        return FileEntry(
+            self.path(i),
+            self.sizes[i],
+            self.mtimes[i],
+            self.inodes[i],
+            self.devices[i],
+        )
+
+    def datetime(self, i):
+        """The creation date of the i-th file, or None"""
+        return from_microseconds(self.timestamps[i])
+
+    @property
+    def filenames(self):
+        """A read-only sequence of the paths, that are created on access"""
+        return _Column(self.path, self)
+
+    @property
+    def entries(self):
+        """A read-only sequence of the FileEntry records, that are created on access"""
+        return _Column(self.entry, self)
+
+    @property
+    def datetimes(self):
+        """A sequence of the creation dates, backed by the timestamps column"""
+        return _DatetimeColumn(self.timestamps)
+
+    def index(self):
+        """An index of the files by path, that shares the base names with the table"""
+        return _Index(self)
+
+
+class _Index:
+    """A mapping from the normalized paths to the FileEntry records of a table"""
+
+    def __init__(self, table):
+        self.table = table
+        self.folders = {}
+        by_id = []
+        for folder in table.folders:
+            by_id.append(self.folders.setdefault(os.path.normpath(folder), {}))
+        for i, (folder_id, name) in enumerate(zip(table.folder_ids, table.names)):
+            by_id[folder_id][name] = i
+
+    def get(self, path, default=None):
+        folder, name = os.path.split(path)
+        i = self.folders.get(folder or ".", {}).get(name)
+        if i is None:
+            return default
+        return self.table.entry(i)
+
+
+class _Column:
+    """A read-only sequence with the values of a function of the row number"""
+
+    def __init__(self, func, table):
+        self.func = func
+        self.table = table
+
+    def __len__(self):
+        return len(self.table)
+
+    def __getitem__(self, i):
+        if i < 0:
+            i += len(self)
+        if not 0 <= i < len(self):
+            raise IndexError(i)
+        return self.func(i)
+
+    def __iter__(self):
+        return map(self.func, range(len(self)))
+
+
+class _DatetimeColumn:
+    """A mutable sequence of datetimes (or None), stored as microseconds since the epoch"""
+
+    def __init__(self, timestamps):
+        self.timestamps = timestamps
+
+    def __len__(self):
+        return len(self.timestamps)
+
+    def __getitem__(self, i):
+        return from_microseconds(self.timestamps[i])
+
+    def __setitem__(self, i, timestamp):
+        self.timestamps[i] = to_microseconds(timestamp)
+
+    def __iter__(self):
+        return map(from_microseconds, self.timestamps)
@@ -0,0 +1,166 @@
+"""Google Takeout sidecars: the photos and videos exported with https://takeout.google.com come
+with a '<name>.json' file that has their creation date in 'photoTakenTime'.
+
+The sidecars of a folder are read at once, when the first file of that folder is looked up,
+and are matched with the media files using the naming rules of Takeout:
+- the sidecar of 'IMG_1234.JPG' is 'IMG_1234.JPG.json', or, in recent exports,
+  'IMG_1234.JPG.supplemental-metadata.json',
+- the sidecar names are truncated to 51 characters, including '.json',
+- the sidecar of the second 'IMG_1234.JPG' in an album, 'IMG_1234(1).JPG', is 'IMG_1234.JPG(1).json',
+- the edited copy 'IMG_1234-edited.JPG' has no sidecar of its own, it uses that of 'IMG_1234.JPG'.
+"""
+
+import os
+import re
+import json
+from datetime import datetime
+from .fileio import open_path
+
+SIDECAR_EXTENSION = ".json"
+# The sidecar names are truncated to that many characters, including the extension
+MAX_SIDECAR_NAME = 51
+SUPPLEMENTAL_METADATA = ".supplemental-metadata"
+# The suffix of the edited copies, in a few languages
+EDITED_SUFFIXES = ("-edited", "-bearbeitet", "-modifié", "-editado", "-modificato")
+
+_DUPLICATE = re.compile(r"(.*)\(([0-9]+)\)$")
+
+
+def read_sidecar(path):
+    """The creation date in a Takeout sidecar, as a naive datetime in the local time,
+    or None if the file is not a Takeout sidecar"""
+    try:
+        with open_path(path) as stream:
+            data = json.load(stream)
+        timestamp = int(data["photoTakenTime"]["timestamp"])
+        if timestamp <= 0:
+            return None
+        # The timestamps out of the range of the platform raise an OverflowError or an OSError
+        return datetime.fromtimestamp(timestamp)
+    except (OSError, OverflowError, ValueError, TypeError, KeyError):
+        return None
+
+
+def sidecar_key(name):
+    """The (media name, possibly truncated, duplicate number) that a sidecar name refers to"""
+    stem = name[: -len(SIDECAR_EXTENSION)]
+    number = 0
+    match = _DUPLICATE.match(stem)
+    if match:
+        stem, number = match.group(1), int(match.group(2))
+
+    # The '.supplemental-metadata' suffix may be truncated, e.g. to '.supplemental-met'
+    dot = stem.rfind(".")
+    if dot > 0 and len(stem) - dot > 1 and SUPPLEMENTAL_METADATA.startswith(stem[dot:]):
+        media = stem[:dot]
+        # '.s' or '.su' could also be a short file extension
+        if os.path.splitext(media)[1] or len(stem) - dot > 3:
+            stem = media
+    return stem, number
+
+
+def media_keys(name):
+    """The keys of the sidecars that could describe the given media file, by order of preference,
+    and whether the media file is an edited copy"""
+    stem, ext = os.path.splitext(name)
+    stems = [(stem, 0)]
+    match = _DUPLICATE.match(stem)
+    if match:
+        stems.append((match.group(1), int(match.group(2))))
+    for stem, number in stems:
+        yield (stem + ext, number), False
+    for stem, number in stems:
+        for suffix in EDITED_SUFFIXES:
+            if stem.endswith(suffix):
+                yield (stem[: -len(suffix)] + ext, number), True
+
+
+class TakeoutSidecars:
+    """The creation dates in the Takeout sidecars of the files in a folder. The pairs
+    {media file: sidecar} are recorded as the media files are looked up, so that the
+    sidecars can be moved together with their media file (not with the edited copies).
+    The files of a directory are listed with os.scandir, or with the given listdir function,
+    unless the listings of the directories are given by add_listing, e.g. by scan.
+    """
+
+    def __init__(self, folder="", listdir=None):
+        self.folder = folder
+        self.listdir = listdir
+        self.pairs = {}
+        self._dirname = None
+        self._dates = {}
+        self._truncated = set()
+        self._sidecars = set()
+        # The names of the sidecars, by directory, when the directories are listed by scan
+        self._listings = None
+
+    def add_listing(self, dirname, names):
+        """Record the names of the files in a directory. Once a listing is added, the directories
+        are not listed anymore, and those without a listing have no sidecar."""
+        if self._listings is None:
+            self._listings = {}
+        names = [name for name in names if name.endswith(SIDECAR_EXTENSION)]
+        if names:
+            self._listings[dirname] = names
+
+    def _load(self, dirname):
+        """Read all the sidecars in the directory"""
+        self._dirname = dirname
+        self._dates = {}
+        self._truncated = set()
+        self._sidecars = set()
+        if self._listings is not None:
+            names = self._listings.get(dirname, ())
+        elif self.listdir is not None:
+            names = [
+                name
+                for name in self.listdir(dirname)
+                if name.endswith(SIDECAR_EXTENSION)
+            ]
+        else:
+            try:
+                with os.scandir(os.path.join(self.folder, dirname) or ".") as iterator:
+                    names = [
+                        entry.name
+                        for entry in iterator
+                        if entry.name.endswith(SIDECAR_EXTENSION) and entry.is_file()
+                    ]
+            except OSError:
+                return
+
+        for name in names:
+            date = read_sidecar(os.path.join(self.folder, dirname, name))
+            if date is None:
+                continue
+            self._sidecars.add(name)
+            key = sidecar_key(name)
+            self._dates.setdefault(key, (date, name))
+            if len(name) >= MAX_SIDECAR_NAME - len("(0)"):
+                # The media name might have been truncated
+                self._truncated.add(len(key[0]))
+
+    def creation_date(self, filename):
+        """The creation date in the sidecar of the given file, None if the file is a sidecar,
+        or raise a KeyError if the file has no sidecar"""
+        dirname, name = os.path.split(filename)
+        if dirname != self._dirname:
+            self._load(dirname)
+
+        if name in self._sidecars:
+            return None
+
+        for (media, number), edited in media_keys(name):
+            found = self._dates.get((media, number))
+            if found is None:
+                for length in sorted(self._truncated, reverse=True):
+                    if length < len(media):
+                        found = self._dates.get((media[:length], number))
+                        if found is not None:
+                            break
+            if found is not None:
+                date, sidecar = found
+                if not edited:
+                    self.pairs[filename] = os.path.join(dirname, sidecar)
+                return date
+
+        raise KeyError(filename)
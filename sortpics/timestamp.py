@@ -2,10 +2,12 @@
 
 import os
 import re
+import fnmatch
 from datetime import datetime, timedelta
-from PIL import Image
-from hachoir.parser import createParser
-from hachoir.metadata import extractMetadata
+from functools import lru_cache
+from .exif import read_exif_tags, DATE_TAGS, EXIF_IFD_POINTER, TIFF_EXTENSIONS
+from .isobmff import read_mvhd_creation_time, ISOBMFF_EXTENSIONS, HEIF_EXTENSIONS
+from .stats import instrumented, open_counted
 
 try:
     fromisoformat = datetime.fromisoformat
@@ -19,77 +21,134 @@ except AttributeError:
         return datetime.strptime(string, "%Y-%m-%d %H:%M:%S")
 
 
-DATE = re.compile(r"(.*)([0-9]{4})[-/]?([0-9]{2})[-/]?([0-9]{2})(.*)")
+# The date and datetime layouts, e.g. 20191225, 2019-12-25, 2019/12/25, 20191225_150712,
+# 2019-12-25 15.07.12... When a string has several dates, the leading .* selects the last one.
+# The separators are never digits, so a match is found without backtracking inside the date.
+DATE = re.compile(r".*([0-9]{4})[-/]?([0-9]{2})[-/]?([0-9]{2})")
 DATETIME = re.compile(
-    r"(.*)([0-9]{4})-?([0-9]{2})-?([0-9]{2})[ _]?-?([0-9]{2})[\.-]?([0-9]{2})[\.-]?([0-9]{2})(.*)"
+    r".*([0-9]{4})-?([0-9]{2})-?([0-9]{2})[ _]?-?([0-9]{2})[\.-]?([0-9]{2})[\.-]?([0-9]{2})"
 )
 JPEG_EXTENSIONS = (".jpg", ".jpeg", ".JPG", ".JPEG")
+# The extensions of the files whose dates are read by read_exif_tags
+EXIF_EXTENSIONS = (".jpg", ".jpeg") + HEIF_EXTENSIONS + TIFF_EXTENSIONS
 
 
-def _find_date(string):
-    match = DATE.match(string)
-    if not match:
-        raise ValueError(f"Cannot find a date in {string}")
-
-    _, year, month, day, _ = match.groups()
-    return datetime(int(year), int(month), int(day))
-
+def _date(match):
+    """The datetime for a match of DATE or DATETIME, or None"""
+    if match is None:
+        return None
+    try:
+        return datetime(*map(int, match.groups()))
+    except ValueError:
+        # The last match is not a valid date
+        return None
 
-def _find_datetime(string):
-    match = DATETIME.match(string)
-    if not match:
-        raise ValueError(f"Cannot find a datetime in {string}")
 
-    _, year, month, day, hour, minute, second, _ = match.groups()
-    return datetime(
-        int(year), int(month), int(day), int(hour), int(minute), int(second)
-    )
+@lru_cache(maxsize=4096)
+def _date_from_folder(dirname):
+    """The date in the folder name, or None. All the files in a folder share that date."""
+    return _date(DATE.match(dirname))
 
 
+@instrumented("path")
 def creation_date_from_path(filename):
     """The creation time from the file name or parent folder"""
+    basename = os.path.basename(filename)
+    date = _date(DATETIME.match(basename))
+    if date is None:
+        last_date = DATE.match(basename)
+        if last_date is not None:
+            # A date at the beginning of the file name has precedence
+            date = _date(
+                last_date if last_date.end() <= 10 else DATE.match(basename[:10])
+            ) or _date(last_date)
+    if date is None:
+        date = _date_from_folder(os.path.dirname(filename))
+    if date is None:
+        raise ValueError(f"No date found in path for {filename}")
+    return date
+
+
+def path_datetime(filename):
+    """The datetime in the file name, e.g. VID_20150103_141719.3gp, when it has a resolution
+    of one second, or None"""
+    return _date(DATETIME.match(os.path.basename(filename)))
+
+
+class PathPolicy:
+    """Which files are dated with the datetime in their name, without reading their metadata.
+
+    The rules are (glob pattern, trust) pairs, e.g. ('VID_*', True). The patterns are matched,
+    case-insensitively, with the file name, or with the path when they contain a '/'.
+    The last matching rule wins, and the files that match no rule are read."""
+
+    def __init__(self, rules=()):
+        self.rules = [
+            (
+                re.compile(fnmatch.translate(pattern), re.IGNORECASE).match,
+                "/" in pattern,
+                trust,
+            )
+            for pattern, trust in rules
+        ]
+
+    def trusts(self, filename):
+        """Is the datetime in the file name trusted?"""
+        trusted = False
+        for match, on_path, trust in self.rules:
+            name = (
+                filename.replace(os.sep, "/") if on_path else os.path.basename(filename)
+            )
+            if match(name):
+                trusted = trust
+        return trusted
+
+    def creation_date(self, filename):
+        """The datetime in the name of the file, when it is trusted and has a resolution
+        of one second, or None if the file should be read"""
+        if not self.trusts(filename):
+            return None
+        return path_datetime(filename)
+
+
+@instrumented("exif")
+def creation_date_from_exif(filename):
+    """The creation date from the exif data"""
     try:
-        return _find_datetime(os.path.basename(filename))
-    except ValueError:
-        pass
-
-    try:
-        return _find_date(os.path.basename(filename)[:10])
-    except ValueError:
-        pass
-
-    try:
-        return _find_date(os.path.basename(filename))
-    except ValueError:
-        pass
-
-    try:
-        return _find_date(os.path.dirname(filename))
+        exif = read_exif_tags(filename)
     except ValueError:
-        pass
+        if not filename.endswith(JPEG_EXTENSIONS):
+            # Pillow cannot open HEIF or RAW files
+            return creation_date_from_hachoir(filename)
+        exif = _pillow_exif_tags(filename)
 
-    raise ValueError(f"No date found in path for {filename}")
+    return _date_from_exif_tags(exif, filename)
 
 
-def creation_date_from_exif(filename):
-    """The creation date from the exif data"""
+@instrumented("pillow")
+def _pillow_exif_tags(filename):
+    """The exif tags in IFD0 and in the Exif IFD, as read by Pillow"""
     # Source: https://orthallelous.wordpress.com/2015/04/19/extracting-date-and-time-from-images-with-python/
-    with Image.open(filename) as img:
+    from PIL import Image
+
+    with open_counted(filename) as stream, Image.open(stream) as img:
         exif = img.getexif()
 
     if exif is None:
         raise ValueError(f"No exif data for {filename}")
 
-    # for subsecond prec, see doi.org/10.3189/2013JoG12J126 , sect. 2.2, 2.3
-    tags = [
-        (36867, 37521),  # (DateTimeOriginal, SubsecTimeOriginal)
-        (36868, 37522),  # (DateTimeDigitized, SubsecTimeDigitized)
-        (306, 37520),  # (DateTime, SubsecTime)
-    ]
+    tags = dict(exif)
+    if EXIF_IFD_POINTER in exif:
+        tags.update(exif.get_ifd(EXIF_IFD_POINTER))
+    return tags
+
 
-    for tag in tags:
+def _date_from_exif_tags(exif, filename):
+    """The creation date from a dictionary of exif tags"""
+    # for subsecond prec, see doi.org/10.3189/2013JoG12J126 , sect. 2.2, 2.3
+    for tag in DATE_TAGS:
         dat = exif.get(tag[0])
-        sub = exif.get(tag[1], 0)
+        sub = exif.get(tag[1]) or 0
 
         # PIL.PILLOW_VERSION >= 3.0 returns a tuple
         dat = dat[0] if isinstance(dat, tuple) else dat
@@ -107,25 +166,50 @@ def creation_date_from_exif(filename):
     raise ValueError(f"No date found in the exif data for {filename}")
 
 
+@instrumented("hachoir")
 def creation_date_from_hachoir(filename):
     """The creation date from the file metadata"""
-    parser = createParser(filename)
-    metadata = extractMetadata(parser)
+    from hachoir.parser import createParser
+    from hachoir.metadata import extractMetadata
+
+    with open_counted(filename) as stream:
+        parser = createParser(stream, real_filename=filename)
+        metadata = extractMetadata(parser)
     if metadata is None:
         raise ValueError(f"Hachoir found no metadata for {filename}")
     return metadata.get("creation_date")
 
 
-def creation_date(filename):
-    """Our best guess for the creation date of the file"""
+@instrumented("mvhd")
+def creation_date_from_mvhd(filename):
+    """The creation date of a MP4, MOV or 3GP video, from the moov/mvhd box"""
+    try:
+        timestamp = read_mvhd_creation_time(filename)
+    except ValueError:
+        return creation_date_from_hachoir(filename)
+
+    if timestamp is None:
+        raise ValueError(f"No creation time in the mvhd box of {filename}")
+    return timestamp
+
+
+def media_creation_date(filename):
+    """The creation date in the file metadata, or None"""
     try:
         if filename.endswith(JPEG_EXTENSIONS):
-            timestamp = creation_date_from_exif(filename)
-        else:
-            timestamp = creation_date_from_hachoir(filename)
+            return creation_date_from_exif(filename)
+        extension = os.path.splitext(filename)[1].lower()
+        if extension in EXIF_EXTENSIONS:
+            return creation_date_from_exif(filename)
+        if extension in ISOBMFF_EXTENSIONS:
+            return creation_date_from_mvhd(filename)
+        return creation_date_from_hachoir(filename)
     except ValueError:
-        timestamp = None
+        return None
+
 
+def best_creation_date(timestamp, filename):
+    """Choose between the creation date in the file metadata (possibly None), and the date in the path"""
     try:
         path_date = creation_date_from_path(filename)
     except ValueError:
@@ -141,3 +225,8 @@ def creation_date(filename):
         return path_date
 
     return timestamp
+
+
+def creation_date(filename):
+    """Our best guess for the creation date of the file"""
+    return best_creation_date(media_creation_date(filename), filename)
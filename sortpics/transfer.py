@@ -0,0 +1,209 @@
+"""Move the files to their targets, with atomic renames, and parallel copies across devices.
+
+The files can also be hard linked, cloned (reflink) or copied to their target, so that the
+original tree is left untouched. The copies are done in the kernel with os.copy_file_range
+or os.sendfile when available."""
+
+import os
+import time
+import errno
+import shutil
+import logging
+from .parallel import imap
+
+LOGGER = logging.getLogger(__name__)
+
+MODES = ("move", "hardlink", "reflink", "copy")
+# The verb used in the report, for each mode
+_DONE = {"move": "Moved", "hardlink": "Linked", "reflink": "Cloned", "copy": "Copied"}
+# Why some files were copied, for each mode
+_COPIED = {
+    "move": "copied across devices",
+    "hardlink": "copied instead of linked",
+    "reflink": "copied instead of cloned",
+}
+# The ioctl that shares the extents of a file with another file, on Btrfs, XFS...
+FICLONE = 0x40049409
+# The errors of FICLONE, os.copy_file_range and os.sendfile when they are not supported
+_NOT_SUPPORTED = (
+    errno.EXDEV,
+    errno.ENOSYS,
+    errno.EOPNOTSUPP,
+    errno.ENOTTY,
+    errno.EINVAL,
+)
+CHUNK_SIZE = 1024 * 1024
+
+
+def transfer(folder, moves, jobs=1, on_move=None, mode="move"):
+    """Move the files in the list of (source, target) pairs, relative to folder.
+
+    The target directories are created first. Then each file is renamed, or, if the target
+    is on another device, copied to a temporary file next to the target, renamed, and unlinked.
+    With mode='hardlink', 'reflink' or 'copy', the source is kept, and the target is a hard link,
+    a clone, or a copy of the source. The hard links and the clones fall back to a copy when the
+    filesystem does not support them. Existing targets are never overwritten. The function
+    on_move(source, target) is called after each successful move. Return the number of files moved.
+    """
+    start = time.perf_counter()
+    for new_dir in sorted({os.path.dirname(target) for _, target in moves}):
+        if new_dir:
+            os.makedirs(os.path.join(folder, new_dir), exist_ok=True)
+
+    moved = copied_files = copied_bytes = 0
+    for (source, target), result in zip(
+        moves,
+        imap(
+            _move_one,
+            ((folder, source, target, mode) for source, target in moves),
+            jobs=jobs,
+            executor="thread",
+        ),
+    ):
+        if isinstance(result, OSError):
+            LOGGER.warning("# Could not move %s to %s: %s", source, target, result)
+            continue
+
+        moved += 1
+        if result is not None:
+            copied_files += 1
+            copied_bytes += result
+        if on_move is not None:
+            on_move(source, target)
+
+    elapsed = time.perf_counter() - start
+    if moved:
+        report = f"# {_DONE[mode]} {moved} files in {elapsed:.2f}s ({moved / elapsed:.0f} files/s)"
+        if copied_files:
+            throughput = (
+                f"{copied_bytes / 1e6:.1f} MB, {copied_bytes / 1e6 / elapsed:.1f} MB/s"
+            )
+            if mode == "copy":
+                report += f" ({throughput})"
+            else:
+                report += (
+                    f", including {copied_files} files {_COPIED[mode]} ({throughput})"
+                )
+        print(report)
+    return moved
+
+
+def _move_one(args):
+    """Move, link, clone or copy one file. Return None if no data was copied, the number of bytes
+    if the file was copied, or the OSError if the move failed"""
+    folder, source, target, mode = args
+    source = os.path.join(folder, source)
+    target = os.path.join(folder, target)
+    try:
+        if os.path.lexists(target):
+            raise FileExistsError(errno.EEXIST, "Target exists", target)
+        if mode == "move":
+            try:
+                os.rename(source, target)
+                return None
+            except OSError as err:
+                if err.errno != errno.EXDEV:
+                    raise
+            return _copy_then_unlink(source, target)
+        if mode == "hardlink":
+            try:
+                os.link(source, target)
+                return None
+            except OSError as err:
+                if err.errno not in (errno.EXDEV, errno.EPERM, errno.EMLINK):
+                    raise
+        return _copy(source, target, reflink=mode == "reflink")
+    except OSError as err:
+        return err
+
+
+def _copy_then_unlink(source, target):
+    """Copy the file to its target, see _copy, and remove the source.
+    If interrupted, or if the copy is incomplete, the source file is left untouched."""
+    size = _copy(source, target)
+    os.unlink(source)
+    return size
+
+
+def _copy(source, target, reflink=False):
+    """Copy, or clone if reflink is True, the file to a hidden temporary file next to the target,
+    and rename it. Return None if the file was cloned, or the number of bytes copied"""
+    target_dir, target_name = os.path.split(target)
+    partial = os.path.join(target_dir, f".{target_name}.sortpics-partial")
+    try:
+        with open(source, "rb") as source_stream, open(partial, "xb") as stream:
+            if reflink and _clone(source_stream, stream):
+                size = None
+            else:
+                size = _copy_data(source_stream, stream)
+            stream.flush()
+            expected = os.fstat(source_stream.fileno()).st_size
+            if os.fstat(stream.fileno()).st_size != expected:
+                raise OSError(errno.EIO, "Incomplete copy", source)
+        shutil.copystat(source, partial)
+        if os.path.lexists(target):
+            raise FileExistsError(errno.EEXIST, "Target exists", target)
+        os.rename(partial, target)
+    except BaseException:
+        if os.path.lexists(partial):
+            os.unlink(partial)
+        raise
+    return size
+
+
+def _clone(source, target):
+    """Share the data of the source with the target, with the FICLONE ioctl.
+    Return False if the filesystem does not support it"""
+    try:
+        import fcntl
+    except ImportError:
+        return False
+    try:
+        fcntl.ioctl(target.fileno(), FICLONE, source.fileno())
+    except OSError as err:
+        if err.errno in _NOT_SUPPORTED:
+            return False
+        raise
+    return True
+
+
+def _copy_file_range(source_fd, target_fd, offset, count):
+    return os.copy_file_range(source_fd, target_fd, count, offset, offset)
+
+
+def _sendfile(source_fd, target_fd, offset, count):
+    os.lseek(target_fd, offset, os.SEEK_SET)
+    return os.sendfile(target_fd, source_fd, offset, count)
+
+
+def _copy_data(source, target):
+    """Copy the content of the source stream to the target stream, in the kernel when possible.
+    Return the number of bytes copied"""
+    size = os.fstat(source.fileno()).st_size
+    copied = 0
+    for kernel_copy in (_copy_file_range, _sendfile):
+        try:
+            while copied < size:
+                count = kernel_copy(
+                    source.fileno(),
+                    target.fileno(),
+                    copied,
+                    min(size - copied, 1 << 30),
+                )
+                if not count:
+                    # A short copy, e.g. on some network filesystems, ends in user space
+                    break
+                copied += count
+            if copied >= size:
+                return copied
+        except AttributeError:
+            # os.copy_file_range is new in Python 3.8, and os.sendfile is not available on Windows
+            continue
+        except OSError as err:
+            if err.errno not in _NOT_SUPPORTED:
+                raise
+
+    source.seek(copied)
+    target.seek(copied)
+    shutil.copyfileobj(source, target, CHUNK_SIZE)
+    return target.tell()
@@ -0,0 +1,336 @@
+"""Sort the files as they arrive in a folder: 'sortpics watch' watches the folder with inotify,
+and moves the new files to their normalized target, in batches.
+
+The folder is walked once, when the watch starts, to build an in-memory index of the files that
+are already there. Then the files that are written (IN_CLOSE_WRITE) or moved (IN_MOVED_TO) in
+the folder are debounced: a batch is sorted when no event came during the debounce delay, or when
+its first file has waited for MAX_DELAY_RATIO times that delay. Only the creation dates of the
+files in the batch are extracted, and their targets are compared with the index. Between two
+batches, the process waits in select, so it uses no CPU.
+"""
+
+import os
+import time
+import logging
+from collections import OrderedDict
+from contextlib import ExitStack
+from datetime import datetime
+from .inotify import (
+    Inotify,
+    IN_CLOSE_WRITE,
+    IN_MOVED_TO,
+    IN_CREATE,
+    IN_ISDIR,
+    IN_Q_OVERFLOW,
+)
+from .scan import FileEntry
+from .normalize import (
+    iter_creation_dates,
+    normalize_targets,
+    align_live_photo_dates,
+    LIVE_PHOTO_EXTENSIONS,
+)
+from .takeout import TakeoutSidecars
+from .moves import move, date_subfolder, sidecar_targets, ScriptWriter
+
+LOGGER = logging.getLogger(__name__)
+
+WATCH_MASK = IN_CLOSE_WRITE | IN_MOVED_TO | IN_CREATE
+# A batch is sorted at the latest after that many debounce delays, even if events keep coming
+MAX_DELAY_RATIO = 10
+# The still images of the live photos that are remembered, for the movies that come in a later batch
+MAX_RECENT_STILLS = 10000
+
+
+class Watcher:
+    """Watch a folder with inotify, and move the new files to their normalized target.
+    The batches are sorted by poll. The undo commands are appended to the optional undo object,
+    e.g. a ScriptWriter."""
+
+    def __init__(
+        self,
+        folder=".",
+        subfolder="%Y-%m",
+        debounce=2.0,
+        jobs=1,
+        executor="thread",
+        undo=None,
+    ):
+        self.folder = folder
+        self.subfolder = subfolder
+        self.debounce = debounce
+        self.jobs = jobs
+        self.executor = executor
+        self.undo = ScriptWriter() if undo is None else undo
+        self.inotify = Inotify()
+        # The files in the folder, by normalized path relative to the folder
+        self.index = {}
+        # The files of the next batch, with the time of their last event
+        self.pending = {}
+        self.first_event = self.last_event = None
+        # The (filename, datetime) of the stills of the live photos, by filename without extension
+        self.recent_stills = OrderedDict()
+        for entry in self._watch_tree(""):
+            self.index[entry.path] = entry
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.inotify.close()
+
+    def _watch_tree(self, directory):
+        """Watch the directory and its non-hidden subdirectories, and yield a FileEntry
+        for each non-hidden file in them. Each directory is watched before it is listed,
+        so that no new file is missed."""
+        pending = [directory]
+        while pending:
+            directory = pending.pop()
+            try:
+                self.inotify.add_watch(os.path.join(self.folder, directory), WATCH_MASK)
+                with os.scandir(os.path.join(self.folder, directory)) as iterator:
+                    entries = sorted(iterator, key=lambda entry: entry.name)
+            except OSError as err:
+                # e.g. ENOSPC when fs.inotify.max_user_watches is reached
+                LOGGER.warning("# Could not watch %s: %s", directory or ".", err)
+                continue
+
+            for entry in entries:
+                if entry.name[0] == ".":
+                    continue
+                path = os.path.join(directory, entry.name)
+                try:
+                    if entry.is_dir():
+                        if not entry.is_symlink():
+                            pending.append(path)
+                        continue
+                    yield FileEntry.from_stat(path, entry.stat())
+                except OSError:
+                    continue
+
+    def _is_known(self, entry):
+        """Is the file in the index, unchanged?"""
+        known = self.index.get(entry.path)
+        return known is not None and (
+            known.st_ino,
+            known.st_size,
+            known.st_mtime_ns,
+        ) == (entry.st_ino, entry.st_size, entry.st_mtime_ns)
+
+    def _add_pending(self, path):
+        now = time.monotonic()
+        if not self.pending:
+            self.first_event = now
+        self.pending[path] = self.last_event = now
+
+    def _on_event(self, directory, name, mask):
+        if mask & IN_Q_OVERFLOW:
+            # Some events were lost, so the new files are found with a walk
+            for entry in self._watch_tree(""):
+                if not self._is_known(entry):
+                    self._add_pending(entry.path)
+            return
+
+        if directory is None or not name or name[0] == ".":
+            return
+        path = os.path.normpath(
+            os.path.relpath(os.path.join(directory, name), self.folder)
+        )
+        if mask & IN_ISDIR:
+            if mask & (IN_CREATE | IN_MOVED_TO):
+                for entry in self._watch_tree(path):
+                    if not self._is_known(entry):
+                        self._add_pending(entry.path)
+            return
+        if mask & (IN_CLOSE_WRITE | IN_MOVED_TO):
+            self._add_pending(path)
+
+    def poll(self, timeout=None):
+        """Wait for at most timeout seconds (forever if None), or until the next batch is ready,
+        and sort that batch. Return the number of files moved"""
+        wait = timeout
+        if self.pending:
+            deadline = min(
+                self.last_event + self.debounce,
+                self.first_event + MAX_DELAY_RATIO * self.debounce,
+            )
+            wait = max(0.0, deadline - time.monotonic())
+            if timeout is not None:
+                wait = min(wait, timeout)
+
+        for directory, name, mask in self.inotify.read_events(wait):
+            self._on_event(directory, name, mask)
+
+        if not self.pending:
+            return 0
+        now = time.monotonic()
+        if (
+            now < self.last_event + self.debounce
+            and now < self.first_event + MAX_DELAY_RATIO * self.debounce
+        ):
+            return 0
+
+        # The files that are still being written wait for the next batch
+        ready = [
+            path
+            for path, last_event in self.pending.items()
+            if now >= last_event + self.debounce
+        ]
+        for path in ready:
+            del self.pending[path]
+        self.first_event = now
+        return self.sort(ready)
+
+    def sort(self, paths):
+        """Move the given files, relative to the folder, to their normalized target.
+        Return the number of files moved"""
+        entries = []
+        for path in sorted(set(paths)):
+            try:
+                entry = FileEntry.from_stat(
+                    path, os.stat(os.path.join(self.folder, path))
+                )
+            except OSError:
+                # The file was removed or moved away
+                continue
+            if not self._is_known(entry):
+                entries.append(entry)
+        if not entries:
+            return 0
+
+        sidecars = TakeoutSidecars(self.folder)
+        datetimes = [
+            timestamp
+            for _, timestamp in iter_creation_dates(
+                entries,
+                self.folder,
+                jobs=self.jobs,
+                executor=self.executor,
+                sidecars=sidecars,
+                progress=False,
+            )
+        ]
+        filenames = [entry.path for entry in entries]
+        self._pair_with_recent_stills(filenames, datetimes)
+        targets = normalize_targets(
+            filenames,
+            datetimes,
+            self.folder,
+            sizes=[entry.st_size for entry in entries],
+            jobs=self.jobs,
+            existing=self._existing,
+        )
+        if self.subfolder:
+            for i, target in enumerate(targets):
+                if target is not None:
+                    targets[i] = os.path.join(
+                        date_subfolder(target, self.subfolder), target
+                    )
+        sidecar_targets(filenames, targets, sidecars.pairs)
+
+        for entry in entries:
+            self.index[entry.path] = entry
+        # move needs the records of the files and of the existing targets
+        keys = set(filenames).union(
+            os.path.normpath(target) for target in targets if target
+        )
+        known_entries = [self.index[key] for key in keys if key in self.index]
+        self._remember_stills(filenames, datetimes)
+
+        moved = []
+
+        def on_move(filename, target):
+            entry = self.index.pop(os.path.normpath(filename))
+            entry.path = os.path.normpath(target)
+            self.index[entry.path] = entry
+            moved.append(target)
+
+        move(
+            self.folder,
+            filenames,
+            targets,
+            test=False,
+            entries=known_entries,
+            on_move=on_move,
+            jobs=self.jobs,
+            undo=self.undo,
+        )
+        return len(moved)
+
+    def _existing(self, target):
+        """The (filename, size) of the file in the index that is at the given target, if any"""
+        if self.subfolder:
+            target = os.path.join(date_subfolder(target, self.subfolder), target)
+        entry = self.index.get(os.path.normpath(target))
+        return None if entry is None else (entry.path, entry.st_size)
+
+    def _pair_with_recent_stills(self, filenames, datetimes):
+        """Give the movies of the batch the datetime of their still image, when that still image
+        was sorted in an earlier batch"""
+        stills = []
+        for filename in filenames:
+            name, ext = os.path.splitext(filename)
+            if ext.lower() == ".mov" and name in self.recent_stills:
+                stills.append(self.recent_stills[name])
+        if not stills:
+            return
+
+        all_datetimes = list(datetimes) + [timestamp for _, timestamp in stills]
+        align_live_photo_dates(
+            list(filenames) + [still for still, _ in stills], all_datetimes
+        )
+        datetimes[:] = all_datetimes[: len(filenames)]
+
+    def _remember_stills(self, filenames, datetimes):
+        for filename, timestamp in zip(filenames, datetimes):
+            name, ext = os.path.splitext(filename)
+            if timestamp is not None and ext.lower() in LIVE_PHOTO_EXTENSIONS:
+                self.recent_stills.pop(name, None)
+                self.recent_stills[name] = filename, timestamp
+        while len(self.recent_stills) > MAX_RECENT_STILLS:
+            self.recent_stills.popitem(last=False)
+
+
+def watch(
+    folder=".",
+    subfolder="%Y-%m",
+    debounce=2.0,
+    jobs=1,
+    executor="thread",
+    scripts=True,
+):
+    """The function that is called by 'sortpics watch': sort the new files in the folder
+    until the process is interrupted"""
+    now = datetime.now().isoformat()
+    undo_script_name = f'.sortpics_undo_watch_{now.replace(":", ".")}.sh'
+    with ExitStack() as stack:
+        undo = ScriptWriter()
+        if scripts:
+            # The undo script is line buffered, so that it is complete when the watch is killed
+            undo = ScriptWriter(
+                stack.enter_context(
+                    open(os.path.join(folder, undo_script_name), "w", buffering=1)
+                )
+            )
+            undo.append("#!/bin/bash")
+            undo.append(
+                f"# This script reverses the renaming done by 'sortpics watch' since {now}"
+            )
+
+        watcher = stack.enter_context(
+            Watcher(
+                folder, subfolder, debounce, jobs=jobs, executor=executor, undo=undo
+            )
+        )
+        print(
+            f"# Watching {len(watcher.inotify.directories)} folders with "
+            f"{len(watcher.index)} files in {folder}, press Ctrl+C to stop"
+        )
+        try:
+            while True:
+                watcher.poll()
+        except KeyboardInterrupt:
+            pass
+
+    if scripts:
+        print(f"# Undo the renaming with 'bash {undo_script_name}'")
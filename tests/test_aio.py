@@ -0,0 +1,78 @@
+import os
+import time
+import threading
+from datetime import datetime
+from unittest.mock import patch
+from PIL import Image
+from sortpics import stats
+from sortpics.aio import imap_creation_dates
+from sortpics.normalize import iter_creation_dates
+from sortpics.timestamp import creation_date
+
+LATENCY = 0.02
+
+
+class LatencyShim:
+    """Open files with an artificial latency, and record the maximum number of concurrent opens"""
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.in_flight = 0
+        self.max_in_flight = 0
+
+    def __call__(self, filename):
+        with self.lock:
+            self.in_flight += 1
+            self.max_in_flight = max(self.max_in_flight, self.in_flight)
+        time.sleep(LATENCY)
+        with self.lock:
+            self.in_flight -= 1
+        return open(filename, "rb")
+
+
+def write_photos(folder, count):
+    exif = Image.Exif()
+    exif[306] = "2020:05:23 16:55:13"
+    filenames = []
+    for i in range(count):
+        filename = f"IMG_{i:04d}.JPG"
+        Image.new("RGB", (8, 8)).save(str(folder.join(filename)), exif=exif)
+        filenames.append(filename)
+    # A file whose path date overrides the metadata
+    subfolder = folder.mkdir("2019-12-25")
+    Image.new("RGB", (8, 8)).save(str(subfolder.join("IMG_9999.JPG")), exif=exif)
+    filenames.append(os.path.join("2019-12-25", "IMG_9999.JPG"))
+    return filenames
+
+
+def test_async_reads_are_concurrent_and_limited_per_mount(tmpdir):
+    filenames = write_photos(tmpdir, 40)
+    paths = [str(tmpdir.join(filename)) for filename in filenames]
+    shim = LatencyShim()
+
+    with patch("sortpics.exif.open_counted", shim):
+        start = time.perf_counter()
+        dates = list(imap_creation_dates(iter(paths), jobs=32, jobs_per_mount=8))
+        elapsed = time.perf_counter() - start
+
+    assert dates == [creation_date(path) for path in paths]
+    assert dates[0] == datetime(2020, 5, 23, 16, 55, 13)
+    assert dates[-1] == datetime(2019, 12, 25)
+    assert shim.max_in_flight == 8
+    # A serial read would take len(paths) * LATENCY
+    assert elapsed < len(paths) * LATENCY / 2
+
+
+def test_iter_creation_dates_with_the_async_executor(tmpdir):
+    filenames = write_photos(tmpdir, 5)
+    run_stats = stats.RunStats()
+    result = list(
+        iter_creation_dates(
+            filenames, str(tmpdir), jobs=4, executor="async", stats=run_stats
+        )
+    )
+    assert result == [
+        (filename, creation_date(str(tmpdir.join(filename)))) for filename in filenames
+    ]
+    assert run_stats.extractors["exif"]["calls"] == 6
+    assert run_stats.extractors["path"]["calls"] == 6
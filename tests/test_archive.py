@@ -0,0 +1,162 @@
+import io
+import os
+import json
+import tarfile
+import zipfile
+import shutil
+import pytest
+import subprocess
+from datetime import datetime
+from unittest.mock import patch
+from PIL import Image
+from sortpics.archive import Archive
+from sortpics.fileio import open_path
+from sortpics.cli import sortpics
+from sortpics.timestamp import creation_date
+
+
+def jpeg_bytes(date):
+    exif = Image.Exif()
+    exif[306] = date
+    stream = io.BytesIO()
+    Image.new("RGB", (8, 8)).save(stream, format="JPEG", exif=exif)
+    return stream.getvalue()
+
+
+MEMBERS = {
+    "Takeout/Google Photos/Album/IMG_0001.JPG": jpeg_bytes("2020:05:23 16:55:13"),
+    "Takeout/Google Photos/Album/IMG_0002.JPG": jpeg_bytes("2019:12:25 10:00:00"),
+    "Takeout/Google Photos/Album/IMG_0002.JPG.json": json.dumps(
+        {"photoTakenTime": {"timestamp": "1323960596"}}
+    ).encode(),
+    "Takeout/Google Photos/Album/VID_20200601_080000.mp4": b"not a video",
+}
+
+
+def write_archive(path):
+    if path.endswith(".zip"):
+        with zipfile.ZipFile(path, "w", zipfile.ZIP_DEFLATED) as archive:
+            for name, data in MEMBERS.items():
+                archive.writestr(name, data)
+        return
+
+    with tarfile.open(path, "w:gz" if path.endswith(".tar.gz") else "w") as archive:
+        for name, data in MEMBERS.items():
+            info = tarfile.TarInfo(name)
+            info.size = len(data)
+            archive.addfile(info, io.BytesIO(data))
+
+
+@pytest.mark.parametrize("name", ["takeout.zip", "takeout.tar", "takeout.tar.gz"])
+def test_read_members_in_archive(tmpdir, name):
+    path = str(tmpdir.join(name))
+    write_archive(path)
+    with Archive(path) as archive:
+        assert [entry.path for entry in archive.scan()] == list(MEMBERS)
+        assert archive.listdir("Takeout/Google Photos/Album") == [
+            os.path.basename(name) for name in MEMBERS
+        ]
+        member = os.path.join(path, "Takeout/Google Photos/Album/IMG_0001.JPG")
+        with open_path(member) as stream:
+            assert stream.read() == MEMBERS["Takeout/Google Photos/Album/IMG_0001.JPG"]
+        assert creation_date(member) == datetime(2020, 5, 23, 16, 55, 13)
+
+
+def test_seek_in_non_seekable_zip_members(tmpdir):
+    # The zip members are not seekable in Python 3.6
+    path = str(tmpdir.join("takeout.zip"))
+    write_archive(path)
+    data = MEMBERS["Takeout/Google Photos/Album/IMG_0001.JPG"]
+    with Archive(path), patch.object(
+        zipfile.ZipExtFile, "seekable", return_value=False
+    ), patch.object(zipfile.ZipExtFile, "seek", side_effect=AssertionError):
+        member = os.path.join(path, "Takeout/Google Photos/Album/IMG_0001.JPG")
+        with open_path(member) as stream:
+            stream.seek(100)
+            assert stream.read(10) == data[100:110]
+            stream.seek(20)
+            assert stream.read(10) == data[20:30]
+            stream.seek(-5, io.SEEK_END)
+            assert stream.read() == data[-5:]
+        assert creation_date(member) == datetime(2020, 5, 23, 16, 55, 13)
+
+
+def test_compressed_tar_is_decompressed_once(tmpdir):
+    path = str(tmpdir.join("takeout.tar.gz"))
+    write_archive(path)
+    extractfile = tarfile.TarFile.extractfile
+    extracted = []
+
+    def counted_extractfile(self, member):
+        extracted.append(member.name)
+        return extractfile(self, member)
+
+    with patch.object(tarfile.TarFile, "extractfile", counted_extractfile):
+        sortpics(path, test=False)
+
+    assert sorted(extracted) == sorted(MEMBERS)
+    assert tmpdir.join("2020-05").join("2020-05-23 16.55.13.JPG").read_binary() == (
+        MEMBERS["Takeout/Google Photos/Album/IMG_0001.JPG"]
+    )
+    # The spool folder is removed
+    assert not [
+        name for name in os.listdir(str(tmpdir)) if name.startswith(".sortpics-")
+    ]
+
+
+def test_process_executor_is_not_supported_for_archives(tmpdir):
+    path = str(tmpdir.join("takeout.zip"))
+    write_archive(path)
+    with pytest.raises(ValueError, match="--executor process"):
+        sortpics(path, test=False, executor="process")
+
+
+@pytest.mark.parametrize("name", ["takeout.zip", "takeout.tar", "takeout.tar.gz"])
+def test_sortpics_on_an_archive(tmpdir, name):
+    path = str(tmpdir.join(name))
+    write_archive(path)
+    sortpics(path, test=False)
+
+    taken = datetime.fromtimestamp(1323960596)
+    target = taken.strftime("%Y-%m/%Y-%m-%d %H.%M.%S.JPG")
+    assert tmpdir.join("2020-05").join("2020-05-23 16.55.13.JPG").read_binary() == (
+        MEMBERS["Takeout/Google Photos/Album/IMG_0001.JPG"]
+    )
+    assert tmpdir.join(target).read_binary() == (
+        MEMBERS["Takeout/Google Photos/Album/IMG_0002.JPG"]
+    )
+    assert tmpdir.join(target + ".json").check()
+    assert tmpdir.join("2020-06").join("2020-06-01 08.00.00.mp4").check()
+
+    # The archive is not modified, and the extracted files can be removed with the undo script
+    (undo,) = [
+        file for file in os.listdir(str(tmpdir)) if file.startswith(".sortpics_undo")
+    ]
+    with open(str(tmpdir.join(undo))) as stream:
+        assert "rm '2020-05/2020-05-23 16.55.13.JPG'" in stream.read().splitlines()
+
+    # The targets are not overwritten
+    sortpics(path, test=False)
+    assert len(os.listdir(str(tmpdir.join("2020-05")))) == 1
+
+
+@pytest.mark.skipif(
+    shutil.which("tar") is None or shutil.which("bash") is None,
+    reason="The script needs tar and bash",
+)
+def test_script_extracts_the_members_of_a_tar_made_from_the_current_directory(tmpdir):
+    source = tmpdir.mkdir("source")
+    source.join("IMG_2.JPG").write_binary(jpeg_bytes("2019:12:25 10:00:00"))
+    path = str(tmpdir.join("x.tar.gz"))
+    subprocess.check_call(["tar", "czf", path, "."], cwd=str(source))
+    with tarfile.open(path) as archive:
+        assert archive.getnames() == [".", "./IMG_2.JPG"]
+
+    sortpics(path, test=True)
+    (script,) = [
+        file for file in os.listdir(str(tmpdir)) if file.startswith(".sortpics_test")
+    ]
+    subprocess.check_call(["bash", script], cwd=str(tmpdir))
+    assert tmpdir.join("2019-12").join("2019-12-25 10.00.00.JPG").read_binary() == (
+        source.join("IMG_2.JPG").read_binary()
+    )
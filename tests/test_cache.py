@@ -0,0 +1,114 @@
+import os
+import pytest
+from unittest.mock import patch
+from datetime import datetime
+from sortpics.cache import MetadataCache
+from sortpics.normalize import creation_dates
+
+
+def test_cache_lookup(tmpdir):
+    tmpdir.join("a.jpg").write("a")
+    tmpdir.join("b.jpg").write("b")
+    stat_a = os.stat(str(tmpdir.join("a.jpg")))
+    stat_b = os.stat(str(tmpdir.join("b.jpg")))
+
+    with MetadataCache(str(tmpdir.join("cache.db"))) as cache:
+        cache.store("a.jpg", stat_a, datetime(2020, 5, 23, 16, 55, 13, 123456))
+        cache.store("b.jpg", stat_b, None)
+
+    with MetadataCache(str(tmpdir.join("cache.db"))) as cache:
+        assert cache.lookup("a.jpg", stat_a) == datetime(
+            2020, 5, 23, 16, 55, 13, 123456
+        )
+        assert cache.lookup("b.jpg", stat_b) is None
+
+    with MetadataCache(str(tmpdir.join("cache.db")), rebuild=True) as cache:
+        with pytest.raises(KeyError):
+            cache.lookup("a.jpg", stat_a)
+
+
+def test_modified_file_is_not_in_cache(tmpdir):
+    tmpdir.join("a.jpg").write("a")
+    stat = os.stat(str(tmpdir.join("a.jpg")))
+
+    with MetadataCache(str(tmpdir.join("cache.db"))) as cache:
+        cache.store("a.jpg", stat, datetime(2020, 5, 23))
+        tmpdir.join("a.jpg").write("modified")
+        with pytest.raises(KeyError):
+            cache.lookup("a.jpg", os.stat(str(tmpdir.join("a.jpg"))))
+
+
+def test_renamed_file_is_found_in_cache(tmpdir):
+    tmpdir.join("a.jpg").write("a")
+    with MetadataCache(str(tmpdir.join("cache.db"))) as cache:
+        cache.store("a.jpg", os.stat(str(tmpdir.join("a.jpg"))), datetime(2020, 5, 23))
+        os.rename(str(tmpdir.join("a.jpg")), str(tmpdir.join("2020-05-23 a.jpg")))
+        stat = os.stat(str(tmpdir.join("2020-05-23 a.jpg")))
+        assert cache.lookup("2020-05-23 a.jpg", stat) == datetime(2020, 5, 23)
+
+
+def test_cached_files_are_not_parsed_again(tmpdir):
+    timestamps = {"a.jpg": datetime(2020, 5, 23, 16, 55, 13), "b.jpg": None}
+    for filename in timestamps:
+        tmpdir.join(filename).write(filename)
+
+    parsed = []
+
+    def creation_date(path):
+        parsed.append(os.path.basename(path))
+        return timestamps[os.path.basename(path)]
+
+    filenames = list(timestamps)
+    with patch("sortpics.normalize.media_creation_date", creation_date):
+        with MetadataCache(str(tmpdir.join("cache.db"))) as cache:
+            assert creation_dates(filenames, str(tmpdir), cache=cache) == [
+                timestamps["a.jpg"],
+                None,
+            ]
+            assert parsed == filenames
+            assert creation_dates(filenames, str(tmpdir), cache=cache) == [
+                timestamps["a.jpg"],
+                None,
+            ]
+            assert parsed == filenames
+
+
+def test_moved_file_has_the_same_date_with_and_without_cache(tmpdir):
+    tmpdir.mkdir("2019-12-25").join("a.jpg").write("a")
+    tmpdir.mkdir("misc")
+
+    def media_creation_date(path):
+        return datetime(2019, 6, 1, 12, 0, 0)
+
+    with patch("sortpics.normalize.media_creation_date", media_creation_date), patch(
+        "sortpics.timestamp.media_creation_date", media_creation_date
+    ):
+        with MetadataCache(str(tmpdir.join("cache.db"))) as cache:
+            # The date in the path wins over the incompatible date in the metadata
+            assert creation_dates(
+                [os.path.join("2019-12-25", "a.jpg")], str(tmpdir), cache=cache
+            ) == [datetime(2019, 12, 25)]
+
+            os.rename(
+                str(tmpdir.join("2019-12-25", "a.jpg")),
+                str(tmpdir.join("misc", "a.jpg")),
+            )
+            filenames = [os.path.join("misc", "a.jpg")]
+            assert (
+                creation_dates(filenames, str(tmpdir), cache=cache)
+                == creation_dates(filenames, str(tmpdir))
+                == [datetime(2019, 6, 1, 12, 0, 0)]
+            )
+
+
+def test_cache_with_an_older_schema_is_rebuilt(tmpdir):
+    path = str(tmpdir.join("cache.db"))
+    tmpdir.join("a.jpg").write("a")
+    stat = os.stat(str(tmpdir.join("a.jpg")))
+    with MetadataCache(path) as cache:
+        cache.store("a.jpg", stat, datetime(2020, 1, 1))
+        cache.connection.execute("PRAGMA user_version = 0")
+
+    with MetadataCache(path) as cache:
+        with pytest.raises(KeyError):
+            cache.lookup("a.jpg", stat)
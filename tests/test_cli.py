@@ -51,14 +51,14 @@ def test_sortpics_cli(
         os.makedirs(tmpdir.join(dirname), exist_ok=True)
         tmpdir.join(dirname).join(basename).write("\n")
 
-    # Patch the timestamp function
+    # Patch the timestamp function (the dates in the file metadata are cached)
     def creation_date(filename):
         for sample_file, timestamp, _ in files:
             if os.path.basename(filename) == os.path.basename(sample_file):
                 return timestamp
         raise ValueError(f"{filename} was not found")
 
-    with patch("sortpics.normalize.creation_date", creation_date):
+    with patch("sortpics.normalize.media_creation_date", creation_date):
         sortpics_cli(["--folder", str(tmpdir)])
 
     out, _ = capsys.readouterr()
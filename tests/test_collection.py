@@ -1,6 +1,6 @@
 import pytest
 from unittest.mock import patch
-from sortpics.normalize import normalize_filenames
+from sortpics.normalize import normalize_filenames, live_photo_pairs
 from datetime import datetime
 
 
@@ -37,6 +37,32 @@ def test_same_name_files_with_different_timestamps_are_not_animated_photos(
         ]
 
 
+def test_heic_live_photos_are_moved_in_pair(
+    timestamps={
+        "2020/IMG_2505.mov": datetime(2020, 3, 1, 15, 25, 14),
+        "2020/IMG_2505.heic": datetime(2020, 3, 1, 17, 25, 12, 567000),
+    }
+):
+    with patch("sortpics.normalize.creation_date", mock_creation_date(timestamps)):
+        assert normalize_filenames(timestamps.keys()) == [
+            "2020-03-01 17.25.12.mov",
+            "2020-03-01 17.25.12.heic",
+        ]
+
+
+def test_live_photo_pairs():
+    filenames = [
+        "a/IMG_1.MOV",
+        "a/IMG_1.HEIC",
+        "a/IMG_1.JPG",
+        "b/IMG_1.MOV",
+        "b/IMG_1.jpeg",
+        "b/IMG_2.MOV",
+        "c/IMG_1.JPG",
+    ]
+    assert list(live_photo_pairs(filenames)) == [(0, 2), (3, 4)]
+
+
 def test_same_second_photos_get_ms_resolution(
     timestamps={
         "IMG_2505.JPG": datetime(2020, 3, 1, 17, 25, 12, 567000),
@@ -1,5 +1,11 @@
+import pytest
 from datetime import datetime
-from sortpics.timestamp import creation_date_from_path, fromisoformat
+from sortpics.timestamp import (
+    creation_date_from_path,
+    fromisoformat,
+    path_datetime,
+    PathPolicy,
+)
 
 
 def test_fromisoformat():
@@ -30,3 +36,49 @@ def test_file_date_overtakes_parent_date():
     assert creation_date_from_path(
         "Folder/2018-02-01/2017-02-01 18.55.15 Photo 1.JPG"
     ) == datetime(2017, 2, 1, 18, 55, 15)
+
+
+def test_the_last_date_in_a_name_is_used():
+    assert creation_date_from_path("VID_20191225_150712.mp4") == datetime(
+        2019, 12, 25, 15, 7, 12
+    )
+    assert creation_date_from_path("2019/12/25/2018-01-02 to 2018-01-03.jpg") == (
+        datetime(2018, 1, 2)
+    )
+    assert creation_date_from_path("Photo 2018-01-02 to 2018-01-03.jpg") == (
+        datetime(2018, 1, 3)
+    )
+    assert creation_date_from_path("2018/01/02 to 2018/01/03/Photo.jpg") == (
+        datetime(2018, 1, 3)
+    )
+
+
+def test_invalid_dates_fall_back_to_the_parent_folder():
+    assert creation_date_from_path("2019-12-25/IMG_20191399_999999.jpg") == datetime(
+        2019, 12, 25
+    )
+    with pytest.raises(ValueError):
+        creation_date_from_path("Folder/IMG_1234.JPG")
+    with pytest.raises(ValueError):
+        creation_date_from_path("2019-12-25 to 2019-13-01/IMG_1234.JPG")
+
+
+def test_path_datetime():
+    assert path_datetime("DCIM/VID_20150103_141719.3gp") == datetime(
+        2015, 1, 3, 14, 17, 19
+    )
+    assert path_datetime("2015-01-03/IMG_0001.JPG") is None
+    assert path_datetime("IMG-20150103-WA0001.jpg") is None
+
+
+def test_path_policy():
+    policy = PathPolicy([("*", True), ("screenshot_*", False), ("WhatsApp/*", False)])
+    assert policy.creation_date("VID_20150103_141719.3gp") == datetime(
+        2015, 1, 3, 14, 17, 19
+    )
+    # The last matching rule wins, and the patterns are not case sensitive
+    assert policy.creation_date("Screenshot_20150103-141719.png") is None
+    assert policy.creation_date("WhatsApp/IMG_20150103_141719.jpg") is None
+    # Only names with a datetime to the second are trusted
+    assert policy.creation_date("IMG_20150103.jpg") is None
+    assert PathPolicy().creation_date("VID_20150103_141719.3gp") is None
@@ -0,0 +1,218 @@
+import struct
+import pytest
+from datetime import datetime
+from unittest.mock import patch
+from PIL import Image
+from sortpics.exif import read_exif_tags, parse_tiff_tags
+from sortpics.stats import collect
+from sortpics.timestamp import creation_date, creation_date_from_exif
+from utils import box, write_jpeg
+
+
+def little_endian_tiff(ifd0, exif_ifd):
+    """A TIFF structure with ASCII tags, and a pointer to the Exif IFD"""
+
+    def ifd(tags, offset, next_ifd=None):
+        entries = []
+        values = b""
+        data_offset = offset + 2 + 12 * (len(tags) + (next_ifd is not None)) + 4
+        for tag, value in sorted(tags.items()):
+            value = value.encode("ascii") + b"\x00"
+            if len(value) <= 4:
+                entries.append(
+                    struct.pack("<HHI4s", tag, 2, len(value), value.ljust(4, b"\x00"))
+                )
+                continue
+            entries.append(
+                struct.pack("<HHII", tag, 2, len(value), data_offset + len(values))
+            )
+            values += value
+        if next_ifd is not None:
+            entries.append(struct.pack("<HHII", 34665, 4, 1, next_ifd))
+        return (
+            struct.pack("<H", len(entries)) + b"".join(entries) + b"\x00" * 4 + values
+        )
+
+    first = ifd(ifd0, 8, next_ifd=0)
+    first = ifd(ifd0, 8, next_ifd=8 + len(first))
+    return b"II*\x00" + struct.pack("<I", 8) + first + ifd(exif_ifd, 8 + len(first))
+
+
+def test_read_exif_tags_in_ifd0_and_exif_ifd(tmpdir):
+    path = str(tmpdir.join("img.jpg"))
+    write_jpeg(
+        path,
+        ifd0={306: "2020:05:23 16:55:13", 271: "Camera"},
+        exif_ifd={36867: "2020:05:22 10:00:00", 37521: "123"},
+    )
+    assert read_exif_tags(path) == {
+        306: "2020:05:23 16:55:13",
+        36867: "2020:05:22 10:00:00",
+        37521: "123",
+    }
+    assert creation_date_from_exif(path) == datetime(2020, 5, 22, 10, 0, 0, 123000)
+
+
+def test_datetime_original_has_priority_over_datetime(tmpdir):
+    path = str(tmpdir.join("img.jpg"))
+    write_jpeg(
+        path,
+        ifd0={306: "2020:05:23 16:55:13"},
+        exif_ifd={36868: "2020:05:23 16:55:12", 37520: "5"},
+    )
+    assert creation_date_from_exif(path) == datetime(2020, 5, 23, 16, 55, 12)
+
+
+def test_no_exif(tmpdir):
+    path = str(tmpdir.join("img.jpg"))
+    Image.new("RGB", (8, 8)).save(path)
+    assert read_exif_tags(path) == {}
+    with pytest.raises(ValueError, match="No date found"):
+        creation_date_from_exif(path)
+
+
+def test_fallback_to_pillow(tmpdir):
+    path = str(tmpdir.join("img.jpg"))
+    write_jpeg(path, ifd0={306: "2020:05:23 16:55:13"}, format="PNG")
+    with pytest.raises(ValueError, match="Not a JPEG"):
+        read_exif_tags(path)
+    assert creation_date_from_exif(path) == datetime(2020, 5, 23, 16, 55, 13)
+
+
+def test_parse_little_endian_tiff():
+    tiff = little_endian_tiff(
+        {306: "2020:05:23 16:55:13"}, {36867: "2020:05:22 10:00:00", 37521: "12"}
+    )
+    assert parse_tiff_tags(tiff) == {
+        306: "2020:05:23 16:55:13",
+        36867: "2020:05:22 10:00:00",
+        37521: "12",
+    }
+
+
+def test_truncated_tiff():
+    tiff = little_endian_tiff({306: "2020:05:23 16:55:13"}, {})
+    with pytest.raises(ValueError):
+        parse_tiff_tags(tiff[:20])
+
+
+def write_heic(path, tiff, idat=False):
+    """A HEIF image with an Exif item, stored in mdat, or in the idat box of the meta box"""
+    exif_item = struct.pack(">I", 6) + b"Exif\x00\x00" + tiff
+    infe = box(b"infe", b"\x02\x00\x00\x00" + struct.pack(">HH4s", 1, 0, b"hvc1"))
+    infe += box(b"infe", b"\x02\x00\x00\x00" + struct.pack(">HH4s", 2, 0, b"Exif"))
+    iinf = box(b"iinf", b"\x00\x00\x00\x00" + struct.pack(">H", 2) + infe)
+    ftyp = box(b"ftyp", b"heic\x00\x00\x00\x00mif1heic")
+
+    def iloc(exif_offset):
+        # version 1, offset_size=4, length_size=4, base_offset_size=0
+        items = struct.pack(">HHHHII", 1, 0, 0, 1, 0, 100)
+        items += struct.pack(
+            ">HHHHII", 2, 1 if idat else 0, 0, 1, exif_offset, len(exif_item)
+        )
+        return box(b"iloc", b"\x01\x00\x00\x00\x44\x00" + struct.pack(">H", 2) + items)
+
+    hdlr = box(b"hdlr", b"\x00" * 8 + b"pict" + b"\x00" * 13)
+    if idat:
+        meta = box(
+            b"meta", b"\x00" * 4 + hdlr + iinf + iloc(0) + box(b"idat", exif_item)
+        )
+        data = ftyp + meta + box(b"mdat", b"\x00" * 100)
+    else:
+        meta_size = len(box(b"meta", b"\x00" * 4 + hdlr + iinf + iloc(0)))
+        exif_offset = len(ftyp) + meta_size + 8 + 100
+        meta = box(b"meta", b"\x00" * 4 + hdlr + iinf + iloc(exif_offset))
+        data = ftyp + meta + box(b"mdat", b"\x00" * 100 + exif_item)
+    with open(path, "wb") as stream:
+        stream.write(data)
+
+
+@pytest.mark.parametrize("idat", [False, True])
+def test_read_heic_exif_item(tmpdir, idat):
+    path = str(tmpdir.join("IMG_0001.HEIC"))
+    tiff = little_endian_tiff(
+        {306: "2020:05:23 16:55:13"}, {36867: "2020:05:22 10:00:00", 37521: "12"}
+    )
+    write_heic(path, tiff, idat=idat)
+    assert read_exif_tags(path)[36867] == "2020:05:22 10:00:00"
+    with patch("sortpics.timestamp.creation_date_from_hachoir") as hachoir:
+        assert creation_date(path) == datetime(2020, 5, 22, 10, 0, 0, 120000)
+        hachoir.assert_not_called()
+
+
+_EXIF_INFE = box(b"infe", b"\x02\x00\x00\x00" + struct.pack(">HH4s", 1, 0, b"Exif"))
+_ILOC = box(
+    b"iloc", b"\x01\x00\x00\x00\x44\x00" + struct.pack(">HHHHHII", 1, 1, 0, 0, 1, 0, 4)
+)
+
+
+@pytest.mark.parametrize(
+    "iinf, iloc",
+    [
+        # An empty iinf box
+        (box(b"iinf", b""), _ILOC),
+        # A truncated infe box
+        (box(b"iinf", b"\x00" * 6 + box(b"infe", b"")), _ILOC),
+        (box(b"iinf", b"\x00" * 6 + box(b"infe", b"\x02\x00\x00\x00\x00")), _ILOC),
+        # A short iloc box
+        (box(b"iinf", b"\x00" * 6 + _EXIF_INFE), box(b"iloc", b"\x01\x00")),
+        # An extent after the end of the file
+        (
+            box(b"iinf", b"\x00" * 6 + _EXIF_INFE),
+            box(
+                b"iloc",
+                b"\x01\x00\x00\x00\x44\x00"
+                + struct.pack(">HHHHHII", 1, 1, 0, 0, 1, 2**31, 4),
+            ),
+        ),
+    ],
+    ids=["empty_iinf", "empty_infe", "short_infe", "short_iloc", "extent_after_eof"],
+)
+def test_truncated_heic_boxes(tmpdir, iinf, iloc):
+    path = str(tmpdir.join("IMG_0001.HEIC"))
+    hdlr = box(b"hdlr", b"\x00" * 8 + b"pict" + b"\x00" * 13)
+    tmpdir.join("IMG_0001.HEIC").write_binary(
+        box(b"ftyp", b"heic\x00\x00\x00\x00mif1heic")
+        + box(b"meta", b"\x00" * 4 + hdlr + iinf + iloc + box(b"idat", b"\x00" * 4))
+    )
+    with pytest.raises(ValueError):
+        read_exif_tags(path)
+    with patch("sortpics.timestamp.creation_date_from_hachoir", return_value=None):
+        assert creation_date_from_exif(path) is None
+
+
+@pytest.mark.parametrize("extension", ["DNG", "CR2", "nef", "ARW", "tif"])
+def test_read_raw_tiff_ifds(tmpdir, extension):
+    path = str(tmpdir.join(f"IMG_0001.{extension}"))
+    tiff = little_endian_tiff(
+        {306: "2020:05:23 16:55:13"}, {36867: "2020:05:22 10:00:00"}
+    )
+    # The image data follows the IFDs, and is not read
+    tmpdir.join(f"IMG_0001.{extension}").write_binary(tiff + b"\x00" * 10**6)
+    assert read_exif_tags(path) == {
+        306: "2020:05:23 16:55:13",
+        36867: "2020:05:22 10:00:00",
+    }
+    assert creation_date(path) == datetime(2020, 5, 22, 10, 0, 0)
+
+    # Only a prefix of the file is read
+    _, _, events = collect(creation_date_from_exif, path)
+    assert [(name, bytes_read) for name, _, _, bytes_read in events] == [
+        ("exif", 64 * 1024)
+    ]
+
+
+def test_jpeg_content_in_a_heic_file(tmpdir):
+    path = str(tmpdir.join("IMG_0001.HEIC"))
+    write_jpeg(path, ifd0={306: "2020:05:23 16:55:13"})
+    assert creation_date(path) == datetime(2020, 5, 23, 16, 55, 13)
+
+
+def test_fallback_to_hachoir_for_an_invalid_heic(tmpdir):
+    path = str(tmpdir.join("IMG_0001.HEIC"))
+    tmpdir.join("IMG_0001.HEIC").write("not an image")
+    with patch(
+        "sortpics.timestamp.creation_date_from_hachoir",
+        return_value=datetime(2020, 5, 23),
+    ):
+        assert creation_date_from_exif(path) == datetime(2020, 5, 23)
@@ -0,0 +1,76 @@
+import os
+from datetime import datetime
+from unittest.mock import patch
+from sortpics.cli import sortpics
+
+
+def run_incremental(folder, timestamps, test=False):
+    """Run sortpics in incremental mode, and return the names of the parsed files"""
+    parsed = []
+
+    def creation_date(path):
+        parsed.append(os.path.basename(path))
+        return timestamps[os.path.basename(path)]
+
+    with patch("sortpics.normalize.creation_date", creation_date):
+        sortpics(str(folder), test=test, scripts=False, cache=False, incremental=True)
+    return parsed
+
+
+def test_incremental_mode_only_parses_new_files(tmpdir):
+    timestamps = {
+        "IMG_1.JPG": datetime(2020, 5, 23, 16, 55, 13),
+        "IMG_2.JPG": datetime(2020, 5, 24, 10, 0, 0),
+        "IMG_3.JPG": datetime(2020, 6, 1, 10, 0, 0),
+        "IMG_4.JPG": datetime(2020, 5, 23, 16, 55, 13),
+    }
+    ingest = tmpdir.mkdir("ingest")
+    ingest.join("IMG_1.JPG").write("1")
+    ingest.join("IMG_2.JPG").write("2")
+
+    # A test run does not update the manifest
+    assert sorted(run_incremental(tmpdir, timestamps, test=True)) == [
+        "IMG_1.JPG",
+        "IMG_2.JPG",
+    ]
+    assert sorted(run_incremental(tmpdir, timestamps)) == ["IMG_1.JPG", "IMG_2.JPG"]
+    assert tmpdir.join("2020-05").join("2020-05-23 16.55.13.JPG").read() == "1"
+    assert tmpdir.join("2020-05").join("2020-05-24 10.00.00.JPG").read() == "2"
+
+    # Nothing new
+    assert run_incremental(tmpdir, timestamps) == []
+
+    # New files in the ingest folder
+    ingest.join("IMG_3.JPG").write("3")
+    ingest.join("IMG_4.JPG").write("4")
+    assert sorted(run_incremental(tmpdir, timestamps)) == ["IMG_3.JPG", "IMG_4.JPG"]
+    assert tmpdir.join("2020-06").join("2020-06-01 10.00.00.JPG").read() == "3"
+
+    # IMG_4.JPG has the same target as IMG_1.JPG, which was sorted in the previous run
+    assert tmpdir.join("2020-05").join("2020-05-23 16.55.13.JPG").read() == "1"
+    assert tmpdir.join("2020-05").join("2020-05-23 16.55.13 (1).JPG").read() == "4"
+    assert run_incremental(tmpdir, timestamps) == []
+
+    # A copy of IMG_1.JPG is not moved, and is not parsed again
+    ingest.join("IMG_5.JPG").write("1")
+    timestamps["IMG_5.JPG"] = timestamps["IMG_1.JPG"]
+    assert run_incremental(tmpdir, timestamps) == ["IMG_5.JPG"]
+    assert ingest.join("IMG_5.JPG").read() == "1"
+    assert run_incremental(tmpdir, timestamps) == []
+
+
+def test_incremental_mode_parses_files_that_were_not_moved_again(tmpdir):
+    timestamps = {"IMG_1.JPG": datetime(2020, 5, 23, 16, 55, 13)}
+    ingest = tmpdir.mkdir("ingest")
+    ingest.join("IMG_1.JPG").write("1")
+
+    with patch(
+        "sortpics.transfer._move_one",
+        return_value=PermissionError(13, "Permission denied"),
+    ):
+        assert run_incremental(tmpdir, timestamps) == ["IMG_1.JPG"]
+    assert ingest.join("IMG_1.JPG").read() == "1"
+
+    assert run_incremental(tmpdir, timestamps) == ["IMG_1.JPG"]
+    assert tmpdir.join("2020-05").join("2020-05-23 16.55.13.JPG").read() == "1"
+    assert run_incremental(tmpdir, timestamps) == []
@@ -0,0 +1,66 @@
+import struct
+import pytest
+from datetime import datetime
+from unittest.mock import patch
+from sortpics.isobmff import read_mvhd_creation_time, MAC_EPOCH
+from sortpics.timestamp import creation_date, creation_date_from_mvhd
+from utils import box
+
+
+def mvhd(timestamp, version=0):
+    seconds = int((timestamp - MAC_EPOCH).total_seconds()) if timestamp else 0
+    if version == 0:
+        payload = struct.pack(">B3xIIII", 0, seconds, seconds, 1000, 5000)
+    else:
+        payload = struct.pack(">B3xQQIQ", 1, seconds, seconds, 1000, 5000)
+    return box(b"mvhd", payload + b"\x00" * 80)
+
+
+def write_video(path, timestamp, version=0, moov_at_end=True, mdat_size=1000):
+    ftyp = box(b"ftyp", b"isom\x00\x00\x00\x00isommp41")
+    mdat = box(b"mdat", b"\x00" * mdat_size)
+    moov = box(b"moov", mvhd(timestamp, version) + box(b"trak", b""))
+    with open(path, "wb") as stream:
+        stream.write(ftyp + (mdat + moov if moov_at_end else moov + mdat))
+
+
+@pytest.mark.parametrize("version", [0, 1])
+@pytest.mark.parametrize("moov_at_end", [True, False])
+def test_read_mvhd_creation_time(tmpdir, version, moov_at_end):
+    path = str(tmpdir.join("VID.mp4"))
+    write_video(path, datetime(2020, 5, 23, 16, 55, 13), version, moov_at_end)
+    assert read_mvhd_creation_time(path) == datetime(2020, 5, 23, 16, 55, 13)
+
+
+def test_large_mdat_is_skipped(tmpdir):
+    path = str(tmpdir.join("VID.mp4"))
+    write_video(path, datetime(2020, 5, 23, 16, 55, 13), mdat_size=10**7)
+    assert read_mvhd_creation_time(path) == datetime(2020, 5, 23, 16, 55, 13)
+
+
+def test_unset_creation_time(tmpdir):
+    path = str(tmpdir.join("VID.mp4"))
+    write_video(path, None)
+    assert read_mvhd_creation_time(path) is None
+    with pytest.raises(ValueError, match="No creation time"):
+        creation_date_from_mvhd(path)
+
+
+def test_same_date_as_hachoir(tmpdir):
+    path = str(tmpdir.join("VID.mov"))
+    write_video(path, datetime(2020, 5, 23, 16, 55, 13))
+    with patch("sortpics.timestamp.creation_date_from_hachoir") as hachoir:
+        assert creation_date(path) == datetime(2020, 5, 23, 16, 55, 13)
+        hachoir.assert_not_called()
+
+
+def test_fallback_to_hachoir(tmpdir):
+    path = str(tmpdir.join("VID.mp4"))
+    tmpdir.join("VID.mp4").write("not a video")
+    with pytest.raises(ValueError, match="Not an ISO base media file"):
+        read_mvhd_creation_time(path)
+    with patch(
+        "sortpics.timestamp.creation_date_from_hachoir",
+        return_value=datetime(2020, 5, 23),
+    ):
+        assert creation_date_from_mvhd(path) == datetime(2020, 5, 23)
@@ -0,0 +1,126 @@
+import os
+import json
+import pytest
+import subprocess
+from datetime import datetime
+from unittest.mock import patch
+from sortpics.cli import sortpics
+from sortpics.journal import Journal, JOURNAL_PREFIX
+from sortpics.transfer import _move_one
+
+TIMESTAMPS = {
+    "IMG_1.JPG": datetime(2020, 5, 23, 16, 55, 13),
+    "IMG_2.JPG": datetime(2020, 5, 24, 10, 0, 0),
+    "IMG_3.JPG": datetime(2020, 6, 1, 10, 0, 0),
+}
+
+
+def interrupted_run(folder, interrupt_at="IMG_2.JPG", after_move=False):
+    """Run sortpics --no-test, and interrupt it when interrupt_at is moved, before
+    or after the move is done"""
+    for filename in TIMESTAMPS:
+        folder.join(filename).write(filename)
+
+    def interrupted_move(args):
+        if args[1].endswith(interrupt_at):
+            if after_move:
+                _move_one(args)
+            raise KeyboardInterrupt
+        return _move_one(args)
+
+    with patch("sortpics.transfer._move_one", interrupted_move), patch(
+        "sortpics.normalize.creation_date",
+        lambda path: TIMESTAMPS[os.path.basename(path)],
+    ):
+        with pytest.raises(KeyboardInterrupt):
+            sortpics(str(folder), test=False, cache=False)
+
+    (journal,) = [
+        name for name in os.listdir(str(folder)) if name.startswith(JOURNAL_PREFIX)
+    ]
+    return str(folder.join(journal))
+
+
+def test_the_journal_records_the_plan_and_the_completed_moves(tmpdir):
+    journal = interrupted_run(tmpdir)
+    with Journal.open(journal) as log:
+        assert [(entry.path, target) for entry, target, _ in log.moves] == [
+            ("./IMG_1.JPG", "2020-05/2020-05-23 16.55.13.JPG"),
+            ("./IMG_2.JPG", "2020-05/2020-05-24 10.00.00.JPG"),
+            ("./IMG_3.JPG", "2020-06/2020-06-01 10.00.00.JPG"),
+        ]
+        assert log.completed() == [("./IMG_1.JPG", "2020-05/2020-05-23 16.55.13.JPG")]
+
+
+def test_resume_an_interrupted_run_and_undo_it(tmpdir):
+    journal = interrupted_run(tmpdir)
+    sortpics(resume=journal)
+
+    assert tmpdir.join("2020-05").join("2020-05-24 10.00.00.JPG").read() == "IMG_2.JPG"
+    assert tmpdir.join("2020-06").join("2020-06-01 10.00.00.JPG").read() == "IMG_3.JPG"
+    assert not tmpdir.join("IMG_2.JPG").exists()
+
+    (undo_script,) = [
+        name for name in os.listdir(str(tmpdir)) if name.startswith(".sortpics_undo")
+    ]
+    subprocess.check_call(["bash", str(tmpdir.join(undo_script))])
+    for filename in TIMESTAMPS:
+        assert tmpdir.join(filename).read() == filename
+
+
+def test_undo_script_reverses_the_moves_done_but_not_recorded(tmpdir):
+    interrupted_run(tmpdir, after_move=True)
+    assert tmpdir.join("2020-05").join("2020-05-24 10.00.00.JPG").read() == "IMG_2.JPG"
+
+    (undo_script,) = [
+        name for name in os.listdir(str(tmpdir)) if name.startswith(".sortpics_undo")
+    ]
+    subprocess.check_call(["bash", str(tmpdir.join(undo_script))])
+    for filename in TIMESTAMPS:
+        assert tmpdir.join(filename).read() == filename
+
+
+def test_resume_marks_the_moves_done_but_not_recorded(tmpdir):
+    journal = interrupted_run(tmpdir)
+    tmpdir.join("2020-05").join("2020-05-24 10.00.00.JPG").write("IMG_2.JPG")
+    os.utime(
+        str(tmpdir.join("2020-05").join("2020-05-24 10.00.00.JPG")),
+        ns=(0, os.stat(str(tmpdir.join("IMG_2.JPG"))).st_mtime_ns),
+    )
+    os.unlink(str(tmpdir.join("IMG_2.JPG")))
+
+    sortpics(resume=journal, scripts=False)
+    with Journal.open(journal) as log:
+        assert len(log.completed()) == 3
+
+
+def test_changed_files_are_not_moved_on_resume(tmpdir):
+    journal = interrupted_run(tmpdir)
+    tmpdir.join("IMG_2.JPG").write("changed")
+
+    sortpics(resume=journal, scripts=False)
+    assert tmpdir.join("IMG_2.JPG").read() == "changed"
+    assert tmpdir.join("2020-06").join("2020-06-01 10.00.00.JPG").exists()
+
+
+def test_incomplete_plan(tmpdir):
+    journal = str(tmpdir.join(JOURNAL_PREFIX + "test.jsonl"))
+    with open(journal, "w") as stream:
+        stream.write(json.dumps({"sortpics_journal": 1, "folder": str(tmpdir)}) + "\n")
+
+    with pytest.raises(ValueError, match="incomplete"):
+        Journal.open(journal)
+
+
+def test_no_undo_script_when_nothing_is_moved(tmpdir, capsys):
+    tmpdir.mkdir("2020-05").join("2020-05-23 16.55.13.JPG").write("IMG_1.JPG")
+    with patch(
+        "sortpics.normalize.creation_date",
+        return_value=datetime(2020, 5, 23, 16, 55, 13),
+    ):
+        sortpics(str(tmpdir), test=False, cache=False)
+
+    assert not [
+        name for name in os.listdir(str(tmpdir)) if name.startswith(".sortpics_undo")
+    ]
+    assert "Undo" not in capsys.readouterr().out
@@ -1,4 +1,7 @@
+import os
 from unittest.mock import patch
+from sortpics.cache import MetadataCache
+from sortpics.hashing import PARTIAL_HASH_BYTES
 from sortpics.normalize import non_duplicate_targets
 
 
@@ -17,9 +20,123 @@ def test_filesize_not_called(
 
 
 def test_largest_file_preserved(
-    filenames=["a.jpg", "b.jpg", "c.jpg"],
+    filenames=["a.jpg", "d.jpg", "c.jpg"],
     targets=["a.jpg", "b.jpg", "b.jpg"],
-    sizes={"b.jpg": 4, "c.jpg": 5},
+    sizes={"d.jpg": 4, "c.jpg": 5},
 ):
     with patch("sortpics.normalize.filesize", mock_filesize(sizes)):
-        assert non_duplicate_targets(filenames, targets) == ["a.jpg", None, "b.jpg"]
+        assert non_duplicate_targets(filenames, targets) == [
+            "a.jpg",
+            "b (1).jpg",
+            "b.jpg",
+        ]
+
+
+def test_file_at_its_target_is_preserved(tmpdir):
+    tmpdir.mkdir("2020-05").join("b.jpg").write("sorted")
+    tmpdir.join("c.jpg").write("larger")
+    tmpdir.join("d.jpg").write("much larger")
+    filenames = [os.path.join("2020-05", "b.jpg"), "c.jpg", "d.jpg"]
+
+    assert non_duplicate_targets(
+        filenames,
+        ["b.jpg"] * 3,
+        str(tmpdir),
+        target_path=lambda target: os.path.join("2020-05", target),
+    ) == ["b.jpg", "b (2).jpg", "b (1).jpg"]
+
+
+def test_identical_files_are_not_moved_twice(tmpdir):
+    tmpdir.join("a.jpg").write("same")
+    tmpdir.join("b.jpg").write("same")
+    tmpdir.join("c.jpg").write("diff")
+    tmpdir.join("d.jpg").write("larger")
+    filenames = ["a.jpg", "b.jpg", "c.jpg", "d.jpg"]
+    targets = ["x.jpg"] * 4
+
+    assert non_duplicate_targets(filenames, targets, str(tmpdir)) == [
+        None,
+        "x (2).jpg",
+        "x (1).jpg",
+        "x.jpg",
+    ]
+
+
+def test_large_files_are_compared_entirely(tmpdir):
+    content = b"\x00" * (3 * PARTIAL_HASH_BYTES)
+    tmpdir.join("a.jpg").write_binary(content)
+    tmpdir.join("b.jpg").write_binary(content)
+    changed = bytearray(content)
+    changed[len(content) // 2] = 1
+    tmpdir.join("c.jpg").write_binary(bytes(changed))
+    filenames = ["a.jpg", "b.jpg", "c.jpg"]
+
+    assert non_duplicate_targets(filenames, ["x.jpg"] * 3, str(tmpdir), jobs=2) == [
+        None,
+        "x (1).jpg",
+        "x.jpg",
+    ]
+
+
+def test_suffixed_targets_are_unique(tmpdir):
+    tmpdir.join("a.jpg").write("a")
+    tmpdir.join("b.jpg").write("b")
+    tmpdir.join("c.jpg").write("c")
+    filenames = ["a.jpg", "b.jpg", "c.jpg"]
+    targets = ["x.jpg", "x.jpg", "x (1).jpg"]
+    with patch("sortpics.normalize.filesize", mock_filesize({})):
+        assert non_duplicate_targets(
+            filenames, targets, str(tmpdir), sizes=[1, 1, 1]
+        ) == ["x (2).jpg", "x.jpg", "x (1).jpg"]
+
+
+def test_hashes_are_cached(tmpdir):
+    tmpdir.join("a.jpg").write("same")
+    tmpdir.join("b.jpg").write("same")
+    filenames = ["a.jpg", "b.jpg"]
+    cache_path = str(tmpdir.join("cache.db"))
+
+    with MetadataCache(cache_path) as cache:
+        assert non_duplicate_targets(
+            filenames, ["x.jpg", "x.jpg"], str(tmpdir), cache=cache
+        ) == [None, "x.jpg"]
+
+    with MetadataCache(cache_path) as cache, patch("sortpics.hashing.HASHES", {}):
+        assert non_duplicate_targets(
+            filenames, ["x.jpg", "x.jpg"], str(tmpdir), cache=cache
+        ) == [None, "x.jpg"]
+        assert cache.lookup_hash(
+            "a.jpg", os.stat(str(tmpdir.join("a.jpg"))), "partial"
+        ) == cache.lookup_hash("b.jpg", os.stat(str(tmpdir.join("b.jpg"))), "partial")
+
+
+def test_copies_of_the_files_at_suffixed_targets_are_not_moved(tmpdir):
+    tmpdir.join("x.jpg").write("a")
+    tmpdir.join("x (1).jpg").write("b")
+    tmpdir.join("IMG_2.jpg").write("b")
+    tmpdir.join("IMG_3.jpg").write("c")
+    filenames = ["x.jpg", "x (1).jpg", "IMG_2.jpg", "IMG_3.jpg"]
+    targets = ["x.jpg", "x (1).jpg", "x.jpg", "x.jpg"]
+
+    assert non_duplicate_targets(filenames, targets, str(tmpdir)) == [
+        "x.jpg",
+        "x (1).jpg",
+        None,
+        "x (2).jpg",
+    ]
+
+
+def test_copies_of_the_existing_files_at_suffixed_targets_are_not_moved(tmpdir):
+    library = tmpdir.mkdir("library")
+    library.join("x.jpg").write("a")
+    library.join("x (1).jpg").write("b")
+    tmpdir.join("IMG_1.jpg").write("a")
+    tmpdir.join("IMG_2.jpg").write("b")
+
+    def existing(target):
+        path = library.join(target)
+        return (str(path), path.size()) if path.check() else None
+
+    assert non_duplicate_targets(
+        ["IMG_1.jpg", "IMG_2.jpg"], ["x.jpg", "x.jpg"], str(tmpdir), existing=existing
+    ) == [None, None]
@@ -0,0 +1,78 @@
+import os
+import pytest
+from unittest.mock import patch
+from datetime import datetime, timedelta
+from sortpics.parallel import imap, EXECUTORS
+from sortpics.normalize import normalize_filenames, iter_creation_dates
+from sortpics.cache import MetadataCache
+
+
+@pytest.mark.parametrize("executor", EXECUTORS)
+def test_imap_preserves_order(executor):
+    assert list(imap(abs, range(-100, 0), jobs=3, executor=executor)) == list(
+        range(100, 0, -1)
+    )
+
+
+def test_imap_raises_on_unknown_executor():
+    with pytest.raises(ValueError):
+        list(imap(abs, [1], jobs=2, executor="cluster"))
+
+
+def test_imap_consumes_the_iterable_lazily():
+    consumed = []
+
+    def items():
+        for i in range(1000):
+            consumed.append(i)
+            yield i
+
+    results = imap(abs, items(), jobs=2, executor="thread")
+    assert next(results) == 0
+    assert len(consumed) < 1000
+
+
+def test_parallel_normalize_filenames_matches_serial():
+    start = datetime(2020, 3, 1, 17, 25, 12)
+    timestamps = {
+        f"IMG_{i:04d}.JPG": start + timedelta(seconds=i // 3, milliseconds=i)
+        for i in range(200)
+    }
+
+    def creation_date(file):
+        return timestamps[file]
+
+    with patch("sortpics.normalize.creation_date", creation_date):
+        serial = normalize_filenames(timestamps.keys(), executor="serial")
+        threaded = normalize_filenames(timestamps.keys(), jobs=8, executor="thread")
+
+    assert threaded == serial
+
+
+def test_iter_creation_dates_with_cache_preserves_order(tmpdir):
+    filenames = [f"IMG_{i:04d}.JPG" for i in range(50)]
+    for filename in filenames:
+        tmpdir.join(filename).write(filename)
+
+    def creation_date(path):
+        i = int(os.path.basename(path)[4:8])
+        return datetime(2020, 1, 1) + timedelta(days=i)
+
+    with patch("sortpics.normalize.media_creation_date", creation_date):
+        with MetadataCache(str(tmpdir.join(".cache.db"))) as cache:
+            # Cache one file out of three
+            list(iter_creation_dates(filenames[::3], str(tmpdir), cache=cache))
+            result = list(
+                iter_creation_dates(
+                    (filename for filename in filenames),
+                    str(tmpdir),
+                    jobs=4,
+                    executor="thread",
+                    cache=cache,
+                )
+            )
+
+    assert result == [
+        (filename, datetime(2020, 1, 1) + timedelta(days=i))
+        for i, filename in enumerate(filenames)
+    ]
@@ -0,0 +1,108 @@
+import os
+import json
+import shutil
+import subprocess
+from datetime import datetime
+from unittest.mock import patch
+from sortpics.cli import sortpics_cli
+
+TIMESTAMPS = {
+    "IMG_1.JPG": datetime(2020, 5, 23, 16, 55, 13),
+    "IMG_2.JPG": datetime(2020, 5, 24, 10, 0, 0),
+}
+
+
+def make_plan(folder, plan):
+    for filename in TIMESTAMPS:
+        folder.join(filename).write(filename)
+
+    with patch(
+        "sortpics.normalize.creation_date",
+        lambda path: TIMESTAMPS[os.path.basename(path)],
+    ):
+        sortpics_cli(["plan", "--folder", str(folder), "--out", plan, "--no-cache"])
+
+
+def test_plan_then_apply(tmpdir, capsys):
+    folder = tmpdir.mkdir("photos")
+    plan = str(tmpdir.join("plan.jsonl"))
+    make_plan(folder, plan)
+    assert "sortpics apply" in capsys.readouterr().out
+
+    # Nothing is moved by plan
+    assert sorted(os.listdir(str(folder))) == ["IMG_1.JPG", "IMG_2.JPG"]
+    with open(plan) as stream:
+        records = [json.loads(line) for line in stream]
+    assert records[1]["source"] == "./IMG_1.JPG"
+    assert records[1]["target"] == "2020-05/2020-05-23 16.55.13.JPG"
+    assert records[1]["size"] == len("IMG_1.JPG")
+    assert records[-1] == {"planned": 2}
+
+    sortpics_cli(["apply", plan, "--jobs", "2"])
+    assert folder.join("2020-05").join("2020-05-23 16.55.13.JPG").read() == "IMG_1.JPG"
+    assert folder.join("2020-05").join("2020-05-24 10.00.00.JPG").read() == "IMG_2.JPG"
+
+
+def test_plans_with_the_same_name_have_distinct_undo_scripts(tmpdir):
+    folder = tmpdir.mkdir("photos")
+    plan = str(tmpdir.join("plan.jsonl"))
+    undo_scripts = set()
+    for _ in range(2):
+        make_plan(folder, plan)
+        sortpics_cli(["apply", plan])
+        (undo_script,) = {
+            name
+            for name in os.listdir(str(folder))
+            if name.startswith(".sortpics_undo_plan_")
+        }.difference(undo_scripts)
+        undo_scripts.add(undo_script)
+        subprocess.check_call(["bash", str(folder.join(undo_script))])
+        os.unlink(plan)
+
+    assert len(undo_scripts) == 2
+
+
+def test_apply_a_plan_made_on_a_replica(tmpdir):
+    replica = tmpdir.mkdir("replica")
+    plan = str(tmpdir.join("plan.jsonl"))
+    make_plan(replica, plan)
+
+    folder = tmpdir.join("photos")
+    shutil.copytree(str(replica), str(folder))
+    folder.join("IMG_2.JPG").write("changed since the plan")
+
+    sortpics_cli(["apply", plan, "--folder", str(folder)])
+    assert folder.join("2020-05").join("2020-05-23 16.55.13.JPG").read() == "IMG_1.JPG"
+    assert folder.join("IMG_2.JPG").read() == "changed since the plan"
+    assert sorted(os.listdir(str(replica))) == ["IMG_1.JPG", "IMG_2.JPG"]
+
+
+def test_plan_with_hard_links_to_another_folder(tmpdir, capsys, caplog):
+    folder = tmpdir.mkdir("photos")
+    library = str(tmpdir.join("library"))
+    plan = str(tmpdir.join("plan.jsonl"))
+    for filename in TIMESTAMPS:
+        folder.join(filename).write(filename)
+
+    with patch(
+        "sortpics.normalize.creation_date",
+        lambda path: TIMESTAMPS[os.path.basename(path)],
+    ):
+        sortpics_cli(
+            ["plan", "--folder", str(folder), "--out", plan, "--no-cache"]
+            + ["--dest", library, "--mode", "hardlink"]
+        )
+
+    sortpics_cli(["apply", plan])
+    target = os.path.join(library, "2020-05", "2020-05-23 16.55.13.JPG")
+    assert os.path.samefile(target, str(folder.join("IMG_1.JPG")))
+    assert "# Linked 2 files" in capsys.readouterr().out
+
+    # The links are found when the plan is applied again
+    sortpics_cli(["apply", plan])
+    assert "was not moved" not in caplog.text
+    assert "Target exists" not in caplog.text
+    (undo_script,) = [
+        name for name in os.listdir(str(folder)) if name.startswith(".sortpics_undo")
+    ]
+    assert folder.join(undo_script).read().splitlines()[-1].startswith("rm ")
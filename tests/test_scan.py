@@ -0,0 +1,81 @@
+import os
+from unittest.mock import patch
+from sortpics.scan import scan
+from sortpics.cli import move
+
+
+def test_scan_skips_hidden_files_and_folders(tmpdir):
+    tmpdir.join("a.jpg").write("a")
+    tmpdir.join(".hidden.jpg").write("h")
+    tmpdir.mkdir("2020").mkdir("05").join("b.jpg").write("bb")
+    tmpdir.mkdir(".git").join("c.jpg").write("c")
+
+    entries = list(scan(str(tmpdir)))
+    assert [entry.path for entry in entries] == [
+        os.path.join(".", "a.jpg"),
+        os.path.join("2020", "05", "b.jpg"),
+    ]
+    for entry in entries:
+        stat = os.stat(os.path.join(str(tmpdir), entry.path))
+        assert entry.st_size == stat.st_size
+        assert entry.st_mtime_ns == stat.st_mtime_ns
+        assert os.path.samestat(entry, stat)
+
+
+def test_scan_lists_all_the_names_but_yields_the_selected_files(tmpdir):
+    for name in ["a.jpg", "a.jpg.json", "b.jpg"]:
+        tmpdir.join(name).write(name)
+
+    listings = []
+    entries = list(
+        scan(
+            str(tmpdir),
+            on_listing=lambda root, names: listings.append((root, names)),
+            select=lambda path: path.endswith(".jpg"),
+        )
+    )
+    assert [entry.path for entry in entries] == [
+        os.path.join(".", "a.jpg"),
+        os.path.join(".", "b.jpg"),
+    ]
+    assert listings == [(".", ["a.jpg", "a.jpg.json", "b.jpg"])]
+
+
+def test_move_uses_the_scanned_entries(tmpdir):
+    tmpdir.join("a.jpg").write("a")
+    tmpdir.join("b.jpg").write("b")
+    tmpdir.mkdir("2020-05").join("2020-05-23 a.jpg").write("other")
+    entries = list(scan(str(tmpdir)))
+    filenames = [entry.path for entry in entries]
+    targets = {
+        "./a.jpg": "2020-05/2020-05-23 a.jpg",
+        "./b.jpg": "2020-05/2020-05-23 b.jpg",
+        "2020-05/2020-05-23 a.jpg": "2020-05/2020-05-23 a.jpg",
+    }
+
+    with patch("os.stat", side_effect=AssertionError("os.stat should not be called")):
+        script, undo = move(
+            str(tmpdir),
+            filenames,
+            [targets[filename] for filename in filenames],
+            entries=entries,
+        )
+
+    assert script[1:] == [
+        "mkdir -p 2020-05",
+        "mv ./b.jpg '2020-05/2020-05-23 b.jpg'",
+    ]
+
+
+def test_move_in_another_folder(tmpdir):
+    tmpdir.join("a.jpg").write("a")
+    entries = list(scan(str(tmpdir)))
+    move(
+        str(tmpdir),
+        ["./a.jpg"],
+        ["2020-05/2020-05-23 a.jpg"],
+        test=False,
+        entries=entries,
+    )
+    assert tmpdir.join("2020-05").join("2020-05-23 a.jpg").read() == "a"
+    assert not tmpdir.join("a.jpg").exists()
@@ -0,0 +1,124 @@
+import os
+import json
+import pytest
+from datetime import datetime
+from unittest.mock import patch
+from sortpics.cli import sortpics_cli
+from sortpics.shard import in_shard, parse_shard, read_partials
+
+TIMESTAMPS = {
+    "IMG_1.JPG": datetime(2020, 5, 23, 16, 55, 13, 100000),
+    "IMG_2.JPG": datetime(2020, 5, 23, 16, 55, 13, 200000),
+    "IMG_3.JPG": datetime(2020, 5, 24, 10, 0, 0),
+    "IMG_4.JPG": datetime(2020, 5, 24, 10, 0, 0),
+    "IMG_5.JPG": datetime(2020, 6, 1, 8, 0, 0),
+}
+
+
+def scan_shard(folder, partial, *args):
+    with patch(
+        "sortpics.normalize.creation_date",
+        lambda path: TIMESTAMPS[os.path.basename(path)],
+    ):
+        sortpics_cli(
+            ["scan", "--folder", str(folder), "--out", partial, "--no-cache"]
+            + list(args)
+        )
+
+
+def test_parse_shard():
+    assert parse_shard("1/4") == (1, 4)
+    with pytest.raises(ValueError):
+        parse_shard("4/4")
+    with pytest.raises(ValueError):
+        parse_shard("1")
+
+
+def test_shards_are_a_partition():
+    paths = [f"./Album {i}/IMG_{i}.JPG" for i in range(100)]
+    counts = [sum(in_shard(path, (i, 3)) for path in paths) for i in range(3)]
+    assert sum(counts) == 100
+    assert min(counts) > 0
+
+
+def test_merge_two_roots_and_two_shards(tmpdir):
+    disk1 = tmpdir.mkdir("disk1")
+    disk2 = tmpdir.mkdir("disk2")
+    dest = tmpdir.mkdir("dest")
+    disk1.join("IMG_1.JPG").write("1")
+    disk1.mkdir("album").join("IMG_3.JPG").write("same")
+    disk2.join("IMG_2.JPG").write("2")
+    disk2.join("IMG_4.JPG").write("same")
+    disk2.join("IMG_5.JPG").write("5")
+
+    partials = [str(tmpdir.join(f"part{i}.jsonl")) for i in range(3)]
+    scan_shard(disk1, partials[0])
+    scan_shard(disk2, partials[1], "--shard", "0/2")
+    scan_shard(disk2, partials[2], "--shard", "1/2")
+
+    with pytest.raises(ValueError, match="1/2 of .*disk2 are missing"):
+        read_partials(partials[:2])
+
+    plan = str(tmpdir.join("plan.jsonl"))
+    sortpics_cli(["merge"] + partials + ["--folder", str(dest), "--out", plan])
+    sortpics_cli(["apply", plan])
+
+    # The milliseconds are shown for the two files of different roots in the same second
+    assert dest.join("2020-05").join("2020-05-23 16.55.13.100.JPG").read() == "1"
+    assert dest.join("2020-05").join("2020-05-23 16.55.13.200.JPG").read() == "2"
+    # The identical files are moved only once
+    assert sorted(os.listdir(str(dest.join("2020-05")))) == [
+        "2020-05-23 16.55.13.100.JPG",
+        "2020-05-23 16.55.13.200.JPG",
+        "2020-05-24 10.00.00.JPG",
+    ]
+    assert dest.join("2020-06").join("2020-06-01 08.00.00.JPG").read() == "5"
+
+
+def test_merge_into_a_destination_with_files(tmpdir):
+    disk = tmpdir.mkdir("disk")
+    dest = tmpdir.mkdir("dest")
+    dest.mkdir("2020-05").join("2020-05-24 10.00.00.JPG").write("sorted")
+    dest.mkdir("2020-06").join("2020-06-01 08.00.00.JPG").write("other")
+    disk.join("IMG_3.JPG").write("sorted")
+    disk.join("IMG_5.JPG").write("new")
+
+    partial = str(tmpdir.join("part.jsonl"))
+    scan_shard(disk, partial)
+    plan = str(tmpdir.join("plan.jsonl"))
+    sortpics_cli(["merge", partial, "--folder", str(dest), "--out", plan])
+    sortpics_cli(["apply", plan])
+
+    # The copy of the sorted file is not moved, the other file gets a suffix
+    assert disk.join("IMG_3.JPG").read() == "sorted"
+    assert os.listdir(str(dest.join("2020-05"))) == ["2020-05-24 10.00.00.JPG"]
+    assert sorted(os.listdir(str(dest.join("2020-06")))) == [
+        "2020-06-01 08.00.00 (1).JPG",
+        "2020-06-01 08.00.00.JPG",
+    ]
+    assert dest.join("2020-06").join("2020-06-01 08.00.00 (1).JPG").read() == "new"
+
+
+def test_merge_moves_the_takeout_sidecars(tmpdir):
+    takeout = tmpdir.mkdir("takeout")
+    dest = tmpdir.mkdir("dest")
+    for i in range(1, 5):
+        takeout.join(f"IMG_{i}.JPG").write(str(i))
+        takeout.join(f"IMG_{i}.JPG.json").write(
+            json.dumps({"photoTakenTime": {"timestamp": str(1590000000 + i)}})
+        )
+
+    # The media files and their sidecars may be in different shards
+    partials = [str(tmpdir.join(f"part{i}.jsonl")) for i in range(2)]
+    scan_shard(takeout, partials[0], "--shard", "0/2")
+    scan_shard(takeout, partials[1], "--shard", "1/2")
+    plan = str(tmpdir.join("plan.jsonl"))
+    sortpics_cli(["merge"] + partials + ["--folder", str(dest), "--out", plan])
+    sortpics_cli(["apply", plan])
+
+    assert os.listdir(str(takeout)) == []
+    for i in range(1, 5):
+        taken = datetime.fromtimestamp(1590000000 + i)
+        target = dest.join(taken.strftime("%Y-%m/%Y-%m-%d %H.%M.%S.JPG"))
+        assert target.read() == str(i)
+        assert json.loads(dest.join(target.relto(dest) + ".json").read())
@@ -0,0 +1,15 @@
+import sys
+import subprocess
+
+
+def test_heavy_dependencies_are_imported_lazily():
+    modules = subprocess.check_output(
+        [
+            sys.executable,
+            "-c",
+            "import sys, sortpics.cli; print(' '.join(sys.modules))",
+        ],
+        universal_newlines=True,
+    ).split()
+    for name in ["PIL", "hachoir", "tqdm", "multiprocessing", "asyncio"]:
+        assert name not in modules
@@ -0,0 +1,120 @@
+import json
+from datetime import datetime
+from sortpics.cli import sortpics, sortpics_cli
+from sortpics.stats import RunStats, collect, instrumented, open_counted
+from sortpics.timestamp import creation_date
+from utils import write_jpeg
+
+
+@instrumented("reader")
+def read_header(filename):
+    with open_counted(filename) as stream:
+        return stream.read(10)
+
+
+@instrumented("failing")
+def failing(filename):
+    read_header(filename)
+    raise ValueError("Unsupported file")
+
+
+def test_collect_records_calls_failures_and_bytes_read(tmpdir):
+    path = str(tmpdir.join("file.bin"))
+    with open(path, "wb") as stream:
+        stream.write(b"x" * 100)
+
+    result, seconds, events = collect(read_header, path)
+    assert result == b"x" * 10
+    assert seconds >= 0
+    assert [(name, failed, size) for name, _, failed, size in events] == [
+        ("reader", False, 10)
+    ]
+
+    _, _, events = collect(lambda filename: _catch(failing, filename), path)
+    assert [(name, failed, size) for name, _, failed, size in events] == [
+        ("reader", False, 10),
+        ("failing", True, 10),
+    ]
+
+
+def _catch(func, filename):
+    try:
+        return func(filename)
+    except ValueError:
+        return None
+
+
+def test_no_events_are_recorded_outside_of_collect(tmpdir):
+    path = str(tmpdir.join("file.bin"))
+    with open(path, "wb") as stream:
+        stream.write(b"x" * 100)
+    assert read_header(path) == b"x" * 10
+
+
+def test_run_stats_keeps_the_slowest_files():
+    stats = RunStats(slowest=2)
+    for i, seconds in enumerate([0.1, 0.3, 0.2, 0.05]):
+        stats.record(f"file_{i}", seconds, [("exif", seconds, False, 100)])
+
+    result = stats.to_dict()
+    assert result["extractors"]["exif"]["calls"] == 4
+    assert result["extractors"]["exif"]["bytes_read"] == 400
+    assert sum(result["extractors"]["exif"]["histogram"]) == 4
+    assert [file["filename"] for file in result["slowest_files"]] == [
+        "file_1",
+        "file_2",
+    ]
+
+
+def test_creation_date_of_a_jpeg_is_read_with_the_exif_reader(tmpdir):
+    path = str(tmpdir.join("IMG_0001.JPG"))
+    write_jpeg(path, {306: "2020:05:23 16:55:13"})
+
+    timestamp, _, events = collect(creation_date, path)
+    assert timestamp == datetime(2020, 5, 23, 16, 55, 13)
+    names = [name for name, *_ in events]
+    assert names == ["exif", "path"]
+    assert events[0][3] > 0
+
+
+def test_sortpics_writes_stats(tmpdir, capsys):
+    write_jpeg(str(tmpdir.join("IMG_0001.JPG")), {306: "2020:05:23 16:55:13"})
+    stats_json = str(tmpdir.join("stats.json"))
+
+    sortpics(str(tmpdir), scripts=False, cache=False, stats=True, stats_json=stats_json)
+    assert "exif" in capsys.readouterr().out
+
+    with open(stats_json) as stream:
+        result = json.load(stream)
+    assert set(result["stages"]) == {"walk", "extract", "duplicates", "plan", "move"}
+    assert result["extractors"]["exif"]["calls"] == 1
+    assert result["counters"] == {"files parsed": 1}
+    assert result["slowest_files"][0]["filename"] == "./IMG_0001.JPG"
+
+
+def test_trusted_path_datetimes_are_not_opened(tmpdir, capsys):
+    write_jpeg(
+        str(tmpdir.join("IMG_20200523_165513.JPG")), {306: "2020:05:23 16:55:14"}
+    )
+    write_jpeg(str(tmpdir.join("IMG_0001.JPG")), {306: "2020:05:24 10:00:00"})
+    stats_json = str(tmpdir.join("stats.json"))
+
+    sortpics_cli(
+        [
+            "--folder",
+            str(tmpdir),
+            "--no-scripts",
+            "--no-cache",
+            "--stats-json",
+            stats_json,
+            "--trust-path-datetime",
+        ]
+    )
+    out = capsys.readouterr().out
+    # The datetime in the name is used, not the one in the EXIF data
+    assert "mv ./IMG_20200523_165513.JPG '2020-05/2020-05-23 16.55.13.JPG'" in out
+
+    with open(stats_json) as stream:
+        result = json.load(stream)
+    assert result["extractors"]["exif"]["calls"] == 1
+    assert result["counters"] == {"files parsed": 1, "opens avoided": 1}
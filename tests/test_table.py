@@ -0,0 +1,68 @@
+from datetime import datetime
+from sortpics.scan import FileEntry
+from sortpics.table import FileTable, NO_DATE, from_microseconds, to_microseconds
+from sortpics.normalize import normalize_targets
+
+
+def test_microseconds_round_trip():
+    for date in [
+        datetime(2020, 5, 23, 16, 55, 13, 123456),
+        datetime(1901, 1, 1),
+        datetime(2099, 12, 31, 23, 59, 59, 999999),
+    ]:
+        assert from_microseconds(to_microseconds(date)) == date
+    assert to_microseconds(None) == NO_DATE
+    assert from_microseconds(NO_DATE) is None
+
+
+def test_file_table():
+    table = FileTable()
+    table.append(FileEntry("./a/IMG_1.JPG", 10, 1, 2, 3), datetime(2020, 5, 23))
+    table.append(FileEntry("./a/IMG_2.JPG", 20, 4, 5, 3), None)
+    table.append(FileEntry("./IMG_3.JPG", 30, 6, 7, 3), datetime(2021, 1, 1))
+
+    assert len(table) == 3
+    assert table.folders == ["./a", "."]
+    assert list(table.filenames) == ["./a/IMG_1.JPG", "./a/IMG_2.JPG", "./IMG_3.JPG"]
+    assert list(table.datetimes) == [datetime(2020, 5, 23), None, datetime(2021, 1, 1)]
+    entry = table.entries[-1]
+    assert (entry.path, entry.st_size, entry.st_mtime_ns, entry.st_ino) == (
+        "./IMG_3.JPG",
+        30,
+        6,
+        7,
+    )
+
+    index = table.index()
+    assert index.get("a/IMG_2.JPG").path == "./a/IMG_2.JPG"
+    assert index.get("IMG_3.JPG").st_size == 30
+    assert index.get("a/IMG_3.JPG") is None
+
+
+def test_normalize_targets_on_a_table_or_on_lists():
+    dates = [
+        datetime(2020, 5, 23, 16, 55, 13, 100000),
+        datetime(2020, 5, 23, 16, 55, 13, 200000),
+        datetime(2020, 5, 23, 16, 55, 14, 300000),
+        datetime(2020, 5, 23, 16, 55, 14, 300000),
+        None,
+    ]
+    table = FileTable()
+    for i, date in enumerate(dates):
+        table.append(FileEntry(f"./IMG_{i}.JPG", i, 0, i, 0), date)
+
+    expected = [
+        "2020-05-23 16.55.13.100.JPG",
+        "2020-05-23 16.55.13.200.JPG",
+        "2020-05-23 16.55.14 (1).JPG",
+        "2020-05-23 16.55.14.JPG",
+        None,
+    ]
+    assert (
+        normalize_targets(table.filenames, table.datetimes, sizes=table.sizes)
+        == expected
+    )
+    assert (
+        normalize_targets(list(table.filenames), dates, sizes=list(table.sizes))
+        == expected
+    )
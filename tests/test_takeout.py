@@ -0,0 +1,129 @@
+import os
+import json
+import pytest
+from datetime import datetime
+from unittest.mock import patch
+from sortpics.cli import sortpics
+from sortpics.takeout import TakeoutSidecars, read_sidecar, sidecar_key
+
+TAKEN = 1323960596
+
+
+def write_sidecar(path, timestamp=TAKEN):
+    with open(path, "w") as stream:
+        json.dump(
+            {
+                "title": os.path.basename(path)[:-5],
+                "photoTakenTime": {"timestamp": str(timestamp)},
+            },
+            stream,
+        )
+
+
+@pytest.mark.parametrize(
+    "name, key",
+    [
+        ("IMG_1234.JPG.json", ("IMG_1234.JPG", 0)),
+        ("IMG_1234.JPG(1).json", ("IMG_1234.JPG", 1)),
+        ("IMG_1234.JPG.supplemental-metadata.json", ("IMG_1234.JPG", 0)),
+        ("IMG_1234.JPG.supplemental-met.json", ("IMG_1234.JPG", 0)),
+        ("IMG_1234.JPG.supplemental-metadata(2).json", ("IMG_1234.JPG", 2)),
+        ("Photo (1).jpg.json", ("Photo (1).jpg", 0)),
+    ],
+)
+def test_sidecar_key(name, key):
+    assert sidecar_key(name) == key
+
+
+def test_takeout_naming_rules(tmpdir):
+    long_name = "Screenshot_20111215-144956_a_very_long_application_name.png"
+    for name in [
+        "IMG_1234.JPG.json",
+        "IMG_1234.JPG(1).json",
+        "Photo (1).jpg.json",
+        long_name[:46] + ".json",
+    ]:
+        write_sidecar(str(tmpdir.join(name)), TAKEN + len(name))
+    tmpdir.join("metadata.json").write('{"title": "Album"}')
+
+    sidecars = TakeoutSidecars(str(tmpdir))
+    expected = {
+        "IMG_1234.JPG": "IMG_1234.JPG.json",
+        "IMG_1234(1).JPG": "IMG_1234.JPG(1).json",
+        "Photo (1).jpg": "Photo (1).jpg.json",
+        long_name: long_name[:46] + ".json",
+    }
+    for media, sidecar in expected.items():
+        assert sidecars.creation_date(media) == datetime.fromtimestamp(
+            TAKEN + len(sidecar)
+        )
+        assert sidecars.pairs[media] == sidecar
+
+    # The edited copy has the date of the original, but the sidecar moves with the original
+    assert sidecars.creation_date("IMG_1234-edited.JPG") == sidecars.creation_date(
+        "IMG_1234.JPG"
+    )
+    assert "IMG_1234-edited.JPG" not in sidecars.pairs
+
+    assert sidecars.creation_date("IMG_1234.JPG.json") is None
+    with pytest.raises(KeyError):
+        sidecars.creation_date("IMG_5678.JPG")
+    with pytest.raises(KeyError):
+        sidecars.creation_date("metadata.json")
+
+
+@pytest.mark.parametrize("timestamp", [0, -1, 99999999999999, "not a number"])
+def test_invalid_sidecar_timestamps(tmpdir, timestamp):
+    path = str(tmpdir.join("IMG_1234.JPG.json"))
+    write_sidecar(path, timestamp)
+    assert read_sidecar(path) is None
+
+
+def test_sidecars_are_used_and_moved(tmpdir):
+    album = tmpdir.mkdir("Google Photos").mkdir("Photos from 2011")
+    album.join("IMG_1234.JPG").write("image")
+    write_sidecar(str(album.join("IMG_1234.JPG.json")))
+    album.join("IMG_5678.JPG").write("image without sidecar")
+
+    with patch(
+        "sortpics.normalize.creation_date", return_value=datetime(2020, 5, 23)
+    ) as parse:
+        sortpics(str(tmpdir), test=False, scripts=False, cache=False)
+    parse.assert_called_once_with(str(album.join("IMG_5678.JPG")))
+
+    taken = datetime.fromtimestamp(TAKEN)
+    target = taken.strftime("%Y-%m-%d %H.%M.%S") + ".JPG"
+    month = tmpdir.join(taken.strftime("%Y-%m"))
+    assert month.join(target).read() == "image"
+    assert json.loads(month.join(target + ".json").read())["photoTakenTime"]
+    assert tmpdir.join("2020-05").join("2020-05-23 IMG_5678.JPG").check()
+
+
+def test_sidecars_are_found_in_the_listings_of_scan(tmpdir):
+    album = tmpdir.mkdir("Google Photos").mkdir("Photos from 2011")
+    album.join("IMG_1234.JPG").write("image")
+    write_sidecar(str(album.join("IMG_1234.JPG.json")))
+    tmpdir.mkdir("Camera").join("IMG_5678.JPG").write("image without sidecar")
+
+    listed = []
+    scandir = os.scandir
+
+    def count_scandir(path="."):
+        listed.append(os.path.relpath(path, str(tmpdir)))
+        return scandir(path)
+
+    with patch(
+        "sortpics.normalize.creation_date", return_value=datetime(2020, 5, 23)
+    ) as parse, patch("os.scandir", count_scandir):
+        sortpics(str(tmpdir), test=True, scripts=False, cache=False)
+    parse.assert_called_once_with(os.path.join(str(tmpdir), "Camera", "IMG_5678.JPG"))
+
+    # Each folder is listed once, by scan
+    assert sorted(listed) == sorted(
+        [
+            ".",
+            "Camera",
+            "Google Photos",
+            os.path.join("Google Photos", "Photos from 2011"),
+        ]
+    )
@@ -0,0 +1,259 @@
+import os
+import errno
+import shlex
+import pytest
+from datetime import datetime
+from unittest.mock import patch
+from sortpics.transfer import transfer, _move_one
+from sortpics.cli import move, sortpics
+
+
+def test_transfer_creates_directories_and_renames(tmpdir, capsys):
+    tmpdir.join("a.jpg").write("a")
+    tmpdir.join("b.jpg").write("b")
+    moved = []
+    assert (
+        transfer(
+            str(tmpdir),
+            [("a.jpg", "2020-05/a.jpg"), ("b.jpg", "2020-06/b.jpg")],
+            jobs=2,
+            on_move=lambda source, target: moved.append(source),
+        )
+        == 2
+    )
+    assert moved == ["a.jpg", "b.jpg"]
+    assert tmpdir.join("2020-05").join("a.jpg").read() == "a"
+    assert tmpdir.join("2020-06").join("b.jpg").read() == "b"
+    assert "# Moved 2 files" in capsys.readouterr().out
+
+
+def test_transfer_never_overwrites(tmpdir):
+    tmpdir.join("a.jpg").write("a")
+    tmpdir.join("b.jpg").write("b")
+    assert transfer(str(tmpdir), [("a.jpg", "b.jpg")]) == 0
+    assert tmpdir.join("a.jpg").read() == "a"
+    assert tmpdir.join("b.jpg").read() == "b"
+
+
+def test_transfer_across_devices(tmpdir, capsys):
+    tmpdir.join("a.jpg").write("a")
+    source = os.path.join(str(tmpdir), "a.jpg")
+    rename = os.rename
+
+    def cross_device_rename(src, dst):
+        if src == source:
+            raise OSError(errno.EXDEV, "Invalid cross-device link")
+        rename(src, dst)
+
+    with patch("os.rename", cross_device_rename):
+        assert transfer(str(tmpdir), [("a.jpg", "2020-05/a.jpg")]) == 1
+
+    assert not tmpdir.join("a.jpg").exists()
+    assert tmpdir.join("2020-05").join("a.jpg").read() == "a"
+    assert os.listdir(str(tmpdir.join("2020-05"))) == ["a.jpg"]
+    assert "1 files copied across devices" in capsys.readouterr().out
+
+
+def test_move_to_a_target_freed_by_another_move(tmpdir):
+    tmpdir.join("a.jpg").write("a")
+    tmpdir.join("b.jpg").write("b")
+    move(str(tmpdir), ["a.jpg", "b.jpg"], ["c.jpg", "a.jpg"], test=False, jobs=4)
+    assert tmpdir.join("c.jpg").read() == "a"
+    assert tmpdir.join("a.jpg").read() == "b"
+    assert not tmpdir.join("b.jpg").exists()
+
+
+def test_failed_moves_are_not_in_the_undo_commands(tmpdir):
+    tmpdir.join("a.jpg").write("a")
+    tmpdir.join("b.jpg").write("b")
+
+    def failed_move(args):
+        if args[1] == "b.jpg":
+            return OSError(errno.EACCES, "Permission denied")
+        return _move_one(args)
+
+    with patch("sortpics.transfer._move_one", failed_move):
+        _, undo = move(str(tmpdir), ["a.jpg", "b.jpg"], ["c.jpg", "d.jpg"], test=False)
+
+    assert undo[1:] == ["mv c.jpg a.jpg"]
+    assert tmpdir.join("b.jpg").exists()
+
+
+def test_undo_script_is_correct_when_interrupted(tmpdir):
+    timestamps = {
+        "IMG_1.JPG": datetime(2020, 5, 23, 16, 55, 13),
+        "IMG_2.JPG": datetime(2020, 5, 24, 10, 0, 0),
+    }
+    for filename in timestamps:
+        tmpdir.join(filename).write(filename)
+
+    def interrupted_move(args):
+        if args[1].endswith("IMG_2.JPG"):
+            raise KeyboardInterrupt
+        return _move_one(args)
+
+    with patch("sortpics.transfer._move_one", interrupted_move), patch(
+        "sortpics.normalize.creation_date",
+        lambda path: timestamps[os.path.basename(path)],
+    ):
+        with pytest.raises(KeyboardInterrupt):
+            sortpics(str(tmpdir), test=False, cache=False)
+
+    (undo_script,) = [
+        name for name in os.listdir(str(tmpdir)) if name.startswith(".sortpics_undo")
+    ]
+    undo = tmpdir.join(undo_script).read().splitlines()
+    assert undo[-1] == "mv '2020-05/2020-05-23 16.55.13.JPG' ./IMG_1.JPG"
+    assert tmpdir.join("2020-05").join("2020-05-23 16.55.13.JPG").exists()
+
+
+@pytest.mark.parametrize("mode", ["hardlink", "reflink", "copy"])
+def test_transfer_keeps_the_source(tmpdir, mode, capsys):
+    tmpdir.join("a.jpg").write("a" * 1000)
+    os.utime(str(tmpdir.join("a.jpg")), ns=(0, 1234567890 * 10**9))
+    assert transfer(str(tmpdir), [("a.jpg", "2020-05/a.jpg")], mode=mode) == 1
+
+    source = os.stat(str(tmpdir.join("a.jpg")))
+    target = os.stat(str(tmpdir.join("2020-05").join("a.jpg")))
+    assert tmpdir.join("2020-05").join("a.jpg").read() == "a" * 1000
+    assert target.st_mtime_ns == source.st_mtime_ns
+    assert (target.st_ino == source.st_ino) == (mode == "hardlink")
+    assert os.listdir(str(tmpdir.join("2020-05"))) == ["a.jpg"]
+    assert (
+        "# {} 1 files".format(
+            {"hardlink": "Linked", "reflink": "Cloned", "copy": "Copied"}[mode]
+        )
+        in capsys.readouterr().out
+    )
+
+
+def test_reflink_falls_back_to_a_copy(tmpdir):
+    tmpdir.join("a.jpg").write("a")
+
+    def unsupported(*args):
+        raise OSError(errno.EOPNOTSUPP, "Operation not supported")
+
+    with patch("fcntl.ioctl", unsupported):
+        assert transfer(str(tmpdir), [("a.jpg", "b.jpg")], mode="reflink") == 1
+    assert tmpdir.join("b.jpg").read() == "a"
+    assert tmpdir.join("a.jpg").read() == "a"
+
+
+def test_copy_without_kernel_copy(tmpdir):
+    tmpdir.join("a.jpg").write("a" * 100000)
+
+    def unsupported(*args):
+        raise OSError(errno.ENOSYS, "Function not implemented")
+
+    with patch("sortpics.transfer._copy_file_range", unsupported), patch(
+        "sortpics.transfer._sendfile", unsupported
+    ):
+        assert transfer(str(tmpdir), [("a.jpg", "b.jpg")], mode="copy") == 1
+    assert tmpdir.join("b.jpg").read() == "a" * 100000
+
+
+@pytest.mark.parametrize("mode", ["move", "hardlink", "copy"])
+def test_sort_to_another_folder(tmpdir, mode):
+    source = tmpdir.mkdir("ingest")
+    dest = str(tmpdir.join("library"))
+    source.join("IMG_1.JPG").write("1")
+    timestamps = {"IMG_1.JPG": datetime(2020, 5, 23, 16, 55, 13)}
+
+    with patch(
+        "sortpics.normalize.creation_date",
+        lambda path: timestamps[os.path.basename(path)],
+    ):
+        sortpics(str(source), test=False, cache=False, dest=dest, mode=mode)
+        assert tmpdir.join("library", "2020-05", "2020-05-23 16.55.13.JPG").exists()
+        assert source.join("IMG_1.JPG").exists() == (mode != "move")
+
+        # The files that are already in the destination are not copied again
+        source.join("IMG_2.JPG").write("1")
+        timestamps["IMG_2.JPG"] = timestamps["IMG_1.JPG"]
+        sortpics(str(source), test=False, cache=False, dest=dest, mode=mode)
+
+    assert os.listdir(str(tmpdir.join("library", "2020-05"))) == [
+        "2020-05-23 16.55.13.JPG"
+    ]
+    (undo_script,) = sorted(
+        name for name in os.listdir(str(source)) if name.startswith(".sortpics_undo")
+    )[:1]
+    undo = source.join(undo_script).read().splitlines()
+    target = os.path.join(dest, "2020-05", "2020-05-23 16.55.13.JPG")
+    if mode == "move":
+        assert undo[-1] == shlex.join(["mv", target, "./IMG_1.JPG"])
+    else:
+        assert undo[-1] == shlex.join(["rm", target])
+
+
+@pytest.mark.parametrize("dest", [False, True])
+def test_rerun_with_suffixed_targets_does_nothing(tmpdir, capsys, dest):
+    source = tmpdir.mkdir("ingest")
+    library = str(tmpdir.join("library")) if dest else None
+    for i in range(1, 4):
+        source.join(f"IMG_{i}.JPG").write(str(i) * i)
+
+    def run():
+        with patch(
+            "sortpics.normalize.creation_date",
+            return_value=datetime(2020, 5, 23, 16, 55, 13),
+        ):
+            sortpics(
+                str(source),
+                test=False,
+                scripts=False,
+                cache=False,
+                dest=library,
+                mode="hardlink" if dest else "move",
+            )
+        return capsys.readouterr().out
+
+    run()
+    month = tmpdir.join("library" if dest else "ingest", "2020-05")
+    assert sorted(os.listdir(str(month))) == [
+        "2020-05-23 16.55.13 (1).JPG",
+        "2020-05-23 16.55.13 (2).JPG",
+        "2020-05-23 16.55.13.JPG",
+    ]
+
+    # A copy of a file at a suffixed target is not moved again
+    source.join("IMG_4.JPG").write("22")
+    assert "IMG_" not in run()
+    assert len(os.listdir(str(month))) == 3
+
+
+@pytest.mark.parametrize("mode", ["move", "copy"])
+def test_short_kernel_copy_ends_in_user_space(tmpdir, mode):
+    tmpdir.join("a.jpg").write("a" * 100000)
+    source = os.path.join(str(tmpdir), "a.jpg")
+    rename = os.rename
+
+    def cross_device_rename(src, dst):
+        if src == source:
+            raise OSError(errno.EXDEV, "Invalid cross-device link")
+        rename(src, dst)
+
+    with patch("os.rename", cross_device_rename), patch(
+        "sortpics.transfer._copy_file_range", lambda *args: 0
+    ), patch("sortpics.transfer._sendfile", lambda *args: 0):
+        assert transfer(str(tmpdir), [("a.jpg", "b.jpg")], mode=mode) == 1
+    assert tmpdir.join("b.jpg").read() == "a" * 100000
+    assert tmpdir.join("a.jpg").exists() == (mode == "copy")
+
+
+def test_incomplete_copy_keeps_the_source(tmpdir):
+    tmpdir.join("a.jpg").write("a" * 100000)
+    source = os.path.join(str(tmpdir), "a.jpg")
+    rename = os.rename
+
+    def cross_device_rename(src, dst):
+        if src == source:
+            raise OSError(errno.EXDEV, "Invalid cross-device link")
+        rename(src, dst)
+
+    with patch("os.rename", cross_device_rename), patch(
+        "sortpics.transfer._copy_data", lambda source, target: 0
+    ):
+        assert transfer(str(tmpdir), [("a.jpg", "b.jpg")]) == 0
+    assert tmpdir.join("a.jpg").read() == "a" * 100000
+    assert sorted(os.listdir(str(tmpdir))) == ["a.jpg"]
@@ -0,0 +1,100 @@
+import os
+import sys
+import struct
+import shutil
+import pytest
+from datetime import datetime
+from sortpics.isobmff import MAC_EPOCH
+from utils import box, write_jpeg
+
+pytestmark = pytest.mark.skipif(
+    not sys.platform.startswith("linux"), reason="inotify is only available on Linux"
+)
+
+
+def write_movie(path, timestamp):
+    seconds = int((timestamp - MAC_EPOCH).total_seconds())
+    mvhd = box(
+        b"mvhd", struct.pack(">B3xIIII", 0, seconds, seconds, 1000, 5000) + bytes(80)
+    )
+    with open(path, "wb") as stream:
+        stream.write(box(b"ftyp", b"qt  \x00\x00\x00\x00qt  ") + box(b"moov", mvhd))
+
+
+def wait_for_batch(watcher, attempts=50):
+    """Poll until a batch has been sorted"""
+    for _ in range(attempts):
+        moved = watcher.poll(0.1)
+        if moved or (not watcher.pending and watcher.last_event is not None):
+            return moved
+    raise AssertionError("No batch was sorted")
+
+
+def files(folder):
+    return sorted(
+        os.path.relpath(os.path.join(root, name), folder)
+        for root, _, names in os.walk(folder)
+        for name in names
+    )
+
+
+@pytest.fixture
+def watcher(tmpdir):
+    from sortpics.watch import Watcher
+
+    folder = str(tmpdir)
+    write_jpeg(
+        os.path.join(folder, "2020-05", "2020-05-23 16.55.13.JPG"),
+        {306: "2020:05:23 16:55:13"},
+    )
+    with Watcher(folder, debounce=0.05) as watcher:
+        assert list(watcher.index) == [
+            os.path.join("2020-05", "2020-05-23 16.55.13.JPG")
+        ]
+        yield watcher
+
+
+def test_watch_sorts_new_files(watcher):
+    folder = watcher.folder
+    write_jpeg(
+        os.path.join(folder, "uploads", "IMG_0001.JPG"), {306: "2021:01:02 03:04:05"}
+    )
+    assert wait_for_batch(watcher) == 1
+    assert files(folder) == [
+        os.path.join("2020-05", "2020-05-23 16.55.13.JPG"),
+        os.path.join("2021-01", "2021-01-02 03.04.05.JPG"),
+    ]
+    assert os.path.join("2021-01", "2021-01-02 03.04.05.JPG") in watcher.index
+    assert not watcher.pending
+
+    # The events of our own moves are ignored
+    assert watcher.poll(0.1) == 0
+    assert not watcher.pending
+
+
+def test_watch_collision_with_existing_file(watcher):
+    folder = watcher.folder
+    existing = os.path.join(folder, "2020-05", "2020-05-23 16.55.13.JPG")
+    shutil.copy(existing, os.path.join(folder, "IMG_0009.JPG"))
+    write_jpeg(
+        os.path.join(folder, "IMG_0002.JPG"),
+        {306: "2020:05:23 16:55:13"},
+        color=(255, 0, 0),
+    )
+    assert wait_for_batch(watcher) == 1
+    # The copy of the existing file is not moved, the other file gets a suffix
+    assert files(folder) == [
+        os.path.join("2020-05", "2020-05-23 16.55.13 (1).JPG"),
+        os.path.join("2020-05", "2020-05-23 16.55.13.JPG"),
+        "IMG_0009.JPG",
+    ]
+
+
+def test_watch_pairs_movie_with_still_of_earlier_batch(watcher):
+    folder = watcher.folder
+    write_jpeg(os.path.join(folder, "IMG_0003.JPG"), {306: "2021:06:01 10:00:00"})
+    assert wait_for_batch(watcher) == 1
+
+    write_movie(os.path.join(folder, "IMG_0003.MOV"), datetime(2021, 6, 1, 10, 0, 2))
+    assert wait_for_batch(watcher) == 1
+    assert os.path.join("2021-06", "2021-06-01 10.00.00.MOV") in files(folder)
@@ -0,0 +1,28 @@
+"""Helpers that write the media files used by the tests"""
+
+import io
+import os
+import struct
+from PIL import Image
+
+
+def box(box_type, payload):
+    """An ISO base media box"""
+    return struct.pack(">I", 8 + len(payload)) + box_type + payload
+
+
+def write_jpeg(path, ifd0=None, exif_ifd=None, format="JPEG", color=(0, 0, 0)):
+    """An 8x8 image with the given tags in IFD0 and in the Exif IFD. The file is written
+    at once, so that a watched folder sees a single write"""
+    exif = Image.Exif()
+    for tag, value in (ifd0 or {}).items():
+        exif[tag] = value
+    if exif_ifd:
+        ifd = exif.get_ifd(0x8769)
+        for tag, value in exif_ifd.items():
+            ifd[tag] = value
+    stream = io.BytesIO()
+    Image.new("RGB", (8, 8), color).save(stream, format=format, exif=exif)
+    os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+    with open(path, "wb") as file:
+        file.write(stream.getvalue())